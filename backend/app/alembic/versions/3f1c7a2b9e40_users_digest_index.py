@@ -0,0 +1,79 @@
+"""Users digest index
+
+Revision ID: 3f1c7a2b9e40
+Revises: d8effc2df5e2
+Create Date: 2026-10-19 09:12:41.318204
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+revision = "3f1c7a2b9e40"
+down_revision = "d8effc2df5e2"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """
+    Merge the users sharing both digests into the first of them,
+    their rankings and reactions moved to it, so that the index
+    can be created
+    """
+    users = sa.table(
+        "users",
+        sa.column("uid", sa.Integer),
+        sa.column("email_digest", sa.String),
+        sa.column("token_digest", sa.String),
+    )
+    kept = (
+        sa.select(
+            users.c.email_digest,
+            users.c.token_digest,
+            sa.func.min(users.c.uid).label("uid"),
+        )
+        .where(users.c.email_digest.isnot(None), users.c.token_digest.isnot(None))
+        .group_by(users.c.email_digest, users.c.token_digest)
+        .having(sa.func.count() > 1)
+        .subquery()
+    )
+    statement = sa.select(users.c.uid, kept.c.uid).join(
+        kept,
+        sa.and_(
+            users.c.email_digest == kept.c.email_digest,
+            users.c.token_digest == kept.c.token_digest,
+            users.c.uid != kept.c.uid,
+        ),
+    )
+
+    bind = op.get_bind()
+    duplicates = [
+        {"duplicate": duplicate, "kept": uid}
+        for duplicate, uid in bind.execute(statement)
+    ]
+    if duplicates:
+        for name in ("rankings", "reactions"):
+            table = sa.table(name, sa.column("user_uid", sa.Integer))
+            bind.execute(
+                table.update()
+                .where(table.c.user_uid == sa.bindparam("duplicate"))
+                .values(user_uid=sa.bindparam("kept")),
+                duplicates,
+            )
+        bind.execute(
+            users.delete().where(
+                users.c.uid.in_([row["duplicate"] for row in duplicates])
+            )
+        )
+
+    op.create_index(
+        "ix_users_email_digest_token_digest",
+        "users",
+        ["email_digest", "token_digest"],
+        unique=True,
+    )
+
+
+def downgrade():
+    op.drop_index("ix_users_email_digest_token_digest", table_name="users")
@@ -0,0 +1,42 @@
+"""Play events
+
+Revision ID: 7b2d4e6f8a13
+Revises: 3f1c7a2b9e40
+Create Date: 2026-10-19 11:02:17.640913
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+revision = "7b2d4e6f8a13"
+down_revision = "3f1c7a2b9e40"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "play_events",
+        sa.Column("uid", sa.Integer(), nullable=False),
+        sa.Column("create_timestamp", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("update_timestamp", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("kind", sa.String(length=20), nullable=False),
+        sa.Column("match_uid", sa.Integer(), nullable=False),
+        sa.Column("user_uid", sa.Integer(), nullable=False),
+        sa.Column("attempt_uid", sa.String(length=32), nullable=True),
+        sa.Column("game_uid", sa.Integer(), nullable=True),
+        sa.Column("question_uid", sa.Integer(), nullable=True),
+        sa.Column("answer_uid", sa.Integer(), nullable=True),
+        sa.Column("open_answer_uid", sa.Integer(), nullable=True),
+        sa.Column("displayed_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("answered_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("score", sa.Float(), nullable=True),
+        sa.PrimaryKeyConstraint("uid", name=op.f("pk_play_events")),
+    )
+    op.create_index("ix_play_events_match_uid_uid", "play_events", ["match_uid", "uid"])
+
+
+def downgrade():
+    op.drop_index("ix_play_events_match_uid_uid", table_name="play_events")
+    op.drop_table("play_events")
@@ -0,0 +1,23 @@
+"""Reactions match user index
+
+Revision ID: a7e1c3d9b052
+Revises: f2c8d4b6a931
+Create Date: 2026-10-19 17:46:52.118374
+
+"""
+from alembic import op
+
+revision = "a7e1c3d9b052"
+down_revision = "f2c8d4b6a931"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_reactions_match_uid_user_uid", "reactions", ["match_uid", "user_uid"]
+    )
+
+
+def downgrade():
+    op.drop_index("ix_reactions_match_uid_user_uid", table_name="reactions")
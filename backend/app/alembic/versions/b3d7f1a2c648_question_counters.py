@@ -0,0 +1,179 @@
+"""Question counters
+
+Revision ID: b3d7f1a2c648
+Revises: a7e1c3d9b052
+Create Date: 2026-10-19 19:12:40.531207
+
+"""
+import json
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision = "b3d7f1a2c648"
+down_revision = "a7e1c3d9b052"
+branch_labels = None
+depends_on = None
+
+
+def question_counters_table():
+    return sa.table(
+        "question_counters",
+        sa.column("create_timestamp", sa.DateTime(timezone=True)),
+        sa.column("question_uid", sa.Integer),
+        sa.column("match_uid", sa.Integer),
+        sa.column("name", sa.String),
+        sa.column("shard", sa.Integer),
+        sa.column("total", sa.Integer),
+    )
+
+
+def question_stats_table():
+    return sa.table(
+        "question_stats",
+        sa.column("create_timestamp", sa.DateTime(timezone=True)),
+        sa.column("question_uid", sa.Integer),
+        sa.column("match_uid", sa.Integer),
+        sa.column("attempts", sa.Integer),
+        sa.column("correct", sa.Integer),
+        sa.column("answers", sa.Text),
+        sa.column("timing", sa.Text),
+    )
+
+
+def upgrade():
+    op.create_table(
+        "question_counters",
+        sa.Column("uid", sa.Integer(), nullable=False),
+        sa.Column("create_timestamp", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("update_timestamp", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("question_uid", sa.Integer(), nullable=False),
+        sa.Column("match_uid", sa.Integer(), nullable=True),
+        sa.Column("name", sa.String(length=32), nullable=False),
+        sa.Column("shard", sa.Integer(), nullable=False),
+        sa.Column("total", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["match_uid"],
+            ["matches.uid"],
+            name=op.f("fk_question_counters_match_uid_matches"),
+            ondelete="CASCADE",
+        ),
+        sa.ForeignKeyConstraint(
+            ["question_uid"],
+            ["questions.uid"],
+            name=op.f("fk_question_counters_question_uid_questions"),
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("uid", name=op.f("pk_question_counters")),
+        sa.UniqueConstraint(
+            "question_uid",
+            "name",
+            "shard",
+            name="uq_question_counters_question_uid_name_shard",
+        ),
+    )
+    op.create_index(
+        "ix_question_counters_match_uid", "question_counters", ["match_uid"]
+    )
+
+    # the counters of each question go to the first shard
+    bind = op.get_bind()
+    now = datetime.now(tz=timezone.utc)
+    rows = []
+    for stats in bind.execute(sa.select(question_stats_table())):
+        counters = Counter(attempts=stats.attempts, correct=stats.correct)
+        for answer, total in json.loads(stats.answers).items():
+            counters[f"answer:{answer}"] = total
+        for bucket, total in json.loads(stats.timing).items():
+            counters[f"timing:{bucket}"] = total
+        rows.extend(
+            {
+                "create_timestamp": now,
+                "question_uid": stats.question_uid,
+                "match_uid": stats.match_uid,
+                "name": name,
+                "shard": 0,
+                "total": total,
+            }
+            for name, total in counters.items()
+            if total
+        )
+    if rows:
+        op.bulk_insert(question_counters_table(), rows)
+
+    op.drop_index("ix_question_stats_match_uid", table_name="question_stats")
+    op.drop_table("question_stats")
+
+
+def downgrade():
+    op.create_table(
+        "question_stats",
+        sa.Column("uid", sa.Integer(), nullable=False),
+        sa.Column("create_timestamp", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("update_timestamp", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("question_uid", sa.Integer(), nullable=False),
+        sa.Column("match_uid", sa.Integer(), nullable=True),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("correct", sa.Integer(), nullable=False),
+        sa.Column("answers", sa.Text(), nullable=False),
+        sa.Column("timing", sa.Text(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["match_uid"],
+            ["matches.uid"],
+            name=op.f("fk_question_stats_match_uid_matches"),
+            ondelete="CASCADE",
+        ),
+        sa.ForeignKeyConstraint(
+            ["question_uid"],
+            ["questions.uid"],
+            name=op.f("fk_question_stats_question_uid_questions"),
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("uid", name=op.f("pk_question_stats")),
+        sa.UniqueConstraint("question_uid", name="uq_question_stats_question_uid"),
+    )
+    op.create_index("ix_question_stats_match_uid", "question_stats", ["match_uid"])
+
+    # the shards of each counter are added back up
+    bind = op.get_bind()
+    counters = question_counters_table()
+    totals = defaultdict(Counter)
+    matches = {}
+    query = sa.select(
+        counters.c.question_uid,
+        counters.c.match_uid,
+        counters.c.name,
+        sa.func.sum(counters.c.total).label("total"),
+    ).group_by(counters.c.question_uid, counters.c.match_uid, counters.c.name)
+    for row in bind.execute(query):
+        totals[row.question_uid][row.name] += row.total
+        matches[row.question_uid] = row.match_uid
+
+    now = datetime.now(tz=timezone.utc)
+    rows = []
+    for question_uid, named in totals.items():
+        answers = {
+            n[len("answer:") :]: t for n, t in named.items() if n.startswith("answer:")
+        }
+        timing = {
+            n[len("timing:") :]: t for n, t in named.items() if n.startswith("timing:")
+        }
+        rows.append(
+            {
+                "create_timestamp": now,
+                "question_uid": question_uid,
+                "match_uid": matches[question_uid],
+                "attempts": named["attempts"],
+                "correct": named["correct"],
+                "answers": json.dumps(answers, separators=(",", ":"), sort_keys=True),
+                "timing": json.dumps(timing, separators=(",", ":"), sort_keys=True),
+            }
+        )
+    if rows:
+        op.bulk_insert(question_stats_table(), rows)
+
+    op.drop_index("ix_question_counters_match_uid", table_name="question_counters")
+    op.drop_table("question_counters")
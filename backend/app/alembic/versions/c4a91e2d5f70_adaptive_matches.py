@@ -0,0 +1,26 @@
+"""Adaptive matches
+
+Revision ID: c4a91e2d5f70
+Revises: 7b2d4e6f8a13
+Create Date: 2026-10-19 14:26:05.412337
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+revision = "c4a91e2d5f70"
+down_revision = "7b2d4e6f8a13"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "matches",
+        sa.Column("adaptive", sa.Boolean(), server_default="0", nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_column("matches", "adaptive")
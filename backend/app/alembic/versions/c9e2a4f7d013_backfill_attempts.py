@@ -0,0 +1,123 @@
+"""Backfill attempts
+
+Revision ID: c9e2a4f7d013
+Revises: b3d7f1a2c648
+Create Date: 2026-10-19 19:41:05.872316
+
+"""
+from datetime import datetime, timezone
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision = "c9e2a4f7d013"
+down_revision = "b3d7f1a2c648"
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 500
+
+
+def aware(value):
+    return value.replace(tzinfo=timezone.utc) if value and not value.tzinfo else value
+
+
+def upgrade():
+    """
+    Summarize the attempts played before the attempts table, so
+    that the left attempts of a match keep counting them
+    """
+    reactions = sa.table(
+        "reactions",
+        sa.column("user_uid", sa.Integer),
+        sa.column("match_uid", sa.Integer),
+        sa.column("attempt_uid", sa.String),
+        sa.column("answer_uid", sa.Integer),
+        sa.column("create_timestamp", sa.DateTime(timezone=True)),
+        sa.column("update_timestamp", sa.DateTime(timezone=True)),
+        sa.column("answer_time", sa.DateTime(timezone=True)),
+        sa.column("score", sa.Float),
+    )
+    answers = sa.table(
+        "answers", sa.column("uid", sa.Integer), sa.column("is_correct", sa.Boolean)
+    )
+    questions = sa.table(
+        "questions", sa.column("uid", sa.Integer), sa.column("game_uid", sa.Integer)
+    )
+    games = sa.table(
+        "games", sa.column("uid", sa.Integer), sa.column("match_uid", sa.Integer)
+    )
+    attempts = sa.table(
+        "attempts",
+        sa.column("create_timestamp", sa.DateTime(timezone=True)),
+        sa.column("user_uid", sa.Integer),
+        sa.column("match_uid", sa.Integer),
+        sa.column("attempt_uid", sa.String),
+        sa.column("started_at", sa.DateTime(timezone=True)),
+        sa.column("finished_at", sa.DateTime(timezone=True)),
+        sa.column("displayed", sa.Integer),
+        sa.column("answered", sa.Integer),
+        sa.column("correct", sa.Integer),
+        sa.column("score", sa.Float),
+        sa.column("duration", sa.Float),
+    )
+
+    questions_count = (
+        sa.select(sa.func.count(questions.c.uid))
+        .select_from(questions.join(games, games.c.uid == questions.c.game_uid))
+        .where(games.c.match_uid == reactions.c.match_uid)
+        .scalar_subquery()
+    )
+    statement = (
+        sa.select(
+            reactions.c.user_uid,
+            reactions.c.match_uid,
+            reactions.c.attempt_uid,
+            sa.func.min(reactions.c.create_timestamp),
+            sa.func.max(reactions.c.update_timestamp),
+            sa.func.count(),
+            sa.func.count(reactions.c.answer_time),
+            sa.func.sum(sa.case((answers.c.is_correct, 1), else_=0)),
+            sa.func.coalesce(sa.func.sum(reactions.c.score), 0),
+            questions_count,
+        )
+        .select_from(
+            reactions.outerjoin(answers, answers.c.uid == reactions.c.answer_uid)
+        )
+        .where(~sa.exists().where(attempts.c.attempt_uid == reactions.c.attempt_uid))
+        .group_by(reactions.c.user_uid, reactions.c.match_uid, reactions.c.attempt_uid)
+    )
+
+    now = datetime.now(tz=timezone.utc)
+
+    def summary(row):
+        user, match, attempt, started, last, displayed, *counters = row
+        answered, correct, score, total = counters
+        finished = last if displayed >= total else None
+        return {
+            "create_timestamp": now,
+            "user_uid": user,
+            "match_uid": match,
+            "attempt_uid": attempt,
+            "started_at": started,
+            "finished_at": finished,
+            "displayed": displayed,
+            "answered": answered,
+            "correct": correct or 0,
+            "score": score,
+            "duration": (
+                (aware(finished) - aware(started)).total_seconds() if finished else None
+            ),
+        }
+
+    # the summaries are read from a server-side cursor and inserted
+    # one batch at a time, never all held in memory
+    bind = op.get_bind().execution_options(stream_results=True, yield_per=BATCH_SIZE)
+    for rows in bind.execute(statement).partitions():
+        op.bulk_insert(attempts, [summary(row) for row in rows])
+
+
+def downgrade():
+    # the summaries are kept: they are rebuilt the same way
+    pass
@@ -0,0 +1,26 @@
+"""Attempts steps
+
+Revision ID: d4f8b2e6a157
+Revises: c9e2a4f7d013
+Create Date: 2026-10-19 20:05:37.604128
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+revision = "d4f8b2e6a157"
+down_revision = "c9e2a4f7d013"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "attempts",
+        sa.Column("steps", sa.Integer(), server_default="0", nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_column("attempts", "steps")
@@ -0,0 +1,50 @@
+"""Question stats
+
+Revision ID: e5b3f9a1c284
+Revises: c4a91e2d5f70
+Create Date: 2026-10-19 15:48:31.205719
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+revision = "e5b3f9a1c284"
+down_revision = "c4a91e2d5f70"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "question_stats",
+        sa.Column("uid", sa.Integer(), nullable=False),
+        sa.Column("create_timestamp", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("update_timestamp", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("question_uid", sa.Integer(), nullable=False),
+        sa.Column("match_uid", sa.Integer(), nullable=True),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("correct", sa.Integer(), nullable=False),
+        sa.Column("answers", sa.Text(), nullable=False),
+        sa.Column("timing", sa.Text(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["match_uid"],
+            ["matches.uid"],
+            name=op.f("fk_question_stats_match_uid_matches"),
+            ondelete="CASCADE",
+        ),
+        sa.ForeignKeyConstraint(
+            ["question_uid"],
+            ["questions.uid"],
+            name=op.f("fk_question_stats_question_uid_questions"),
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("uid", name=op.f("pk_question_stats")),
+        sa.UniqueConstraint("question_uid", name="uq_question_stats_question_uid"),
+    )
+    op.create_index("ix_question_stats_match_uid", "question_stats", ["match_uid"])
+
+
+def downgrade():
+    op.drop_index("ix_question_stats_match_uid", table_name="question_stats")
+    op.drop_table("question_stats")
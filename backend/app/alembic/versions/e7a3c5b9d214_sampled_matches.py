@@ -0,0 +1,27 @@
+"""Sampled matches
+
+Revision ID: e7a3c5b9d214
+Revises: d4f8b2e6a157
+Create Date: 2026-10-19 23:12:48.305916
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+revision = "e7a3c5b9d214"
+down_revision = "d4f8b2e6a157"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("matches", sa.Column("sample", sa.Integer(), nullable=True))
+    op.add_column(
+        "matches", sa.Column("sample_levels", sa.String(length=60), nullable=True)
+    )
+
+
+def downgrade():
+    op.drop_column("matches", "sample_levels")
+    op.drop_column("matches", "sample")
@@ -0,0 +1,56 @@
+"""Attempts
+
+Revision ID: f2c8d4b6a931
+Revises: e5b3f9a1c284
+Create Date: 2026-10-19 17:12:08.441093
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+revision = "f2c8d4b6a931"
+down_revision = "e5b3f9a1c284"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "attempts",
+        sa.Column("uid", sa.Integer(), nullable=False),
+        sa.Column("create_timestamp", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("update_timestamp", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("user_uid", sa.Integer(), nullable=False),
+        sa.Column("match_uid", sa.Integer(), nullable=False),
+        sa.Column("attempt_uid", sa.String(length=32), nullable=False),
+        sa.Column("started_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("displayed", sa.Integer(), nullable=False),
+        sa.Column("answered", sa.Integer(), nullable=False),
+        sa.Column("correct", sa.Integer(), nullable=False),
+        sa.Column("score", sa.Float(), nullable=False),
+        sa.Column("duration", sa.Float(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["match_uid"],
+            ["matches.uid"],
+            name=op.f("fk_attempts_match_uid_matches"),
+            ondelete="CASCADE",
+        ),
+        sa.ForeignKeyConstraint(
+            ["user_uid"],
+            ["users.uid"],
+            name=op.f("fk_attempts_user_uid_users"),
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("uid", name=op.f("pk_attempts")),
+        sa.UniqueConstraint("attempt_uid", name="uq_attempts_attempt_uid"),
+    )
+    op.create_index(
+        "ix_attempts_match_uid_user_uid", "attempts", ["match_uid", "user_uid"]
+    )
+
+
+def downgrade():
+    op.drop_index("ix_attempts_match_uid_user_uid", table_name="attempts")
+    op.drop_table("attempts")
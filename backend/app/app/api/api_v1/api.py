@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from app.api.api_v1.endpoints import login, match, play, question, user
+from app.api.api_v1.endpoints import admin, live, login, match, play, question, user
 
 api_router = APIRouter()
 api_router.include_router(login.router, tags=["login"])
@@ -8,3 +8,5 @@ api_router.include_router(match.router, prefix="/matches", tags=["matches"])
 api_router.include_router(question.router, prefix="/questions", tags=["questions"])
 api_router.include_router(play.router, prefix="/play", tags=["play"])
 api_router.include_router(user.router, prefix="/players", tags=["players"])
+api_router.include_router(live.router, prefix="/live", tags=["live"])
+api_router.include_router(admin.router, prefix="/admin", tags=["admin"])
@@ -0,0 +1,76 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from app.api.deps import get_admin_user
+from app.core.profiling import profiler
+from app.core.slow_queries import slow_query_log
+from app.core.sql_metrics import sql_metrics
+from app.core.tracing import TracedRoute, tracer
+from app.domain_entities.user import User
+from app.domain_service.schemas import syntax_validation as syntax
+
+router = APIRouter(route_class=TracedRoute)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics(_user: User = Depends(get_admin_user)):
+    """The counters of the requests, in the Prometheus text format"""
+    return sql_metrics.render()
+
+
+@router.get("/spans")
+def spans(_user: User = Depends(get_admin_user)):
+    """The histograms of the durations of each phase of the requests"""
+    return tracer.histograms.summary()
+
+
+@router.get("/slow-queries")
+def slow_queries(
+    limit: int = Query(20, gt=0, le=100),
+    order: str = Query("total", regex="^(total|count|p95|max)$"),
+    _user: User = Depends(get_admin_user),
+):
+    """The statement fingerprints with the highest latency"""
+    return slow_query_log.top(limit, order)
+
+
+@router.post("/profiler")
+def arm_profiler(user_input: syntax.ArmProfiler, _user: User = Depends(get_admin_user)):
+    """Profile the next requests matching the route and/or the match"""
+    profiler.arm(**user_input.dict())
+    return profiler.status()
+
+
+@router.delete("/profiler")
+def disarm_profiler(_user: User = Depends(get_admin_user)):
+    profiler.disarm()
+    return profiler.status()
+
+
+@router.get("/profiler")
+def profiler_status(_user: User = Depends(get_admin_user)):
+    return profiler.status()
+
+
+def get_profile(uid):
+    profile = profiler.profiles.get(uid)
+    if profile is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    return profile
+
+
+@router.get("/profiler/{uid}/speedscope")
+def profile_speedscope(uid: int, _user: User = Depends(get_admin_user)):
+    """The samples of the request, to open with speedscope"""
+    return JSONResponse(
+        get_profile(uid).speedscope(),
+        headers={
+            "Content-Disposition": f"attachment; filename=profile-{uid}.speedscope.json"
+        },
+    )
+
+
+@router.get("/profiler/{uid}/sql")
+def profile_sql(uid: int, _user: User = Depends(get_admin_user)):
+    """The statements of the request, with the plans of the SELECTs"""
+    return get_profile(uid).sql()
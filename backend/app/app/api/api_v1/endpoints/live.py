@@ -0,0 +1,179 @@
+import logging
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Request,
+    WebSocket,
+    WebSocketDisconnect,
+    status,
+)
+from fastapi.concurrency import run_in_threadpool
+from fastapi_csrf_protect import CsrfProtect
+from sqlalchemy.orm import Session
+
+from app.api.deps import get_current_user
+from app.core.config import settings
+from app.core.tracing import TracedRoute
+from app.domain_entities.db.session import get_db
+from app.domain_entities.user import User
+from app.domain_service.data_transfer.user import UserDTO
+from app.domain_service.play import (
+    ClientFactory,
+    LiveRegistry,
+    LiveToken,
+    RedisRelay,
+    live_counters,
+)
+from app.domain_service.schemas import response
+from app.domain_service.schemas import syntax_validation as syntax
+from app.domain_service.schemas.logical_validation import (
+    LogicValidation,
+    RetrieveObject,
+    ValidatePlayStart,
+)
+from app.exceptions import (
+    LiveHostError,
+    LiveHostUserError,
+    LiveMatchOverError,
+    NotFoundObjectError,
+)
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(route_class=TracedRoute)
+
+live_registry = LiveRegistry(
+    RedisRelay(ClientFactory().new_async_client())
+    if settings.LIVE_REDIS_RELAY
+    else None
+)
+
+
+def valid_player(token, match_uid, db_session):
+    """
+    The user of the live token, if it admits them to the match
+    and the match can still be played
+    """
+    live_token = LiveToken.decode(token)
+    if not live_token or live_token.match_uid != match_uid:
+        return
+
+    try:
+        match = RetrieveObject(
+            uid=match_uid, otype="match", db_session=db_session
+        ).get()
+        RetrieveObject(
+            uid=live_token.user_uid, otype="user", db_session=db_session
+        ).get()
+    except NotFoundObjectError:
+        return
+    finally:
+        db_session.close()
+    if match.is_active:
+        return live_token.user_uid
+
+
+@router.post("/join", response_model=response.LiveJoinResponse)
+def join(
+    user_input: syntax.StartPlay,
+    request: Request,
+    session: Session = Depends(get_db),
+    csrf_protect: CsrfProtect = Depends(),
+):
+    """
+    Admit the player to the live match, under the same rules of
+    /play/start, with a token to open the socket with
+    """
+    csrf_protect.validate_csrf_in_cookies(request)
+    data = LogicValidation(ValidatePlayStart).validate(
+        db_session=session, **user_input.dict()
+    )
+    match = data.get("match")
+    user = data.get("user") or UserDTO(session=session).fetch(
+        signed=match.is_restricted
+    )
+    return {
+        "match_uid": match.uid,
+        "user_uid": user.uid,
+        "live_token": LiveToken(match.uid, user.uid).encode(),
+    }
+
+
+@router.post("/{match_uid}/next", response_model=response.LiveNextResponse)
+async def next_live_question(
+    match_uid: int,
+    session: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """
+    Publish the results of the current question and the next one,
+    only for the user who hosted the match first
+    """
+    try:
+        match = await run_in_threadpool(
+            RetrieveObject(uid=match_uid, otype="match", db_session=session).get
+        )
+    except NotFoundObjectError as exc:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND) from exc
+
+    if not match.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Expired match"
+        )
+
+    try:
+        host = await live_registry.host(match_uid, user.uid)
+    except LiveMatchOverError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=exc.message
+        ) from exc
+    except LiveHostUserError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail=exc.message
+        ) from exc
+    except LiveHostError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail=exc.message
+        ) from exc
+
+    question, messages = await run_in_threadpool(host.advance, match, session)
+    await host.publish(messages)
+    if question is None:
+        await live_registry.end(match_uid)
+    return {"match_uid": match_uid, "question": question}
+
+
+@router.websocket("/{match_uid}")
+async def live_player(
+    websocket: WebSocket,
+    match_uid: int,
+    token: str,
+    session: Session = Depends(get_db),
+):
+    user_uid = await run_in_threadpool(valid_player, token, match_uid, session)
+    if not user_uid:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    room = await live_registry.room(match_uid)
+    await room.connect(user_uid, websocket)
+    live_counters.played(match_uid, user_uid)
+    try:
+        while True:
+            try:
+                data = await websocket.receive_json()
+                answer_uid = data["answer_uid"]
+            except (ValueError, TypeError, KeyError):
+                await websocket.send_json({"type": "invalid"})
+                continue
+
+            await room.answer(user_uid, answer_uid)
+            live_counters.answered(match_uid, user_uid)
+            await websocket.send_json({"type": "received"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await live_registry.leave(match_uid, user_uid)
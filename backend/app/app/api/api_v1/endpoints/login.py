@@ -10,13 +10,14 @@ from sqlalchemy.orm import Session
 from app.api.deps import get_current_user
 from app.core import security
 from app.core.config import settings
+from app.core.tracing import TracedRoute
 from app.domain_entities import User
 from app.domain_entities.db.session import get_db
 from app.domain_service.data_transfer.user import UserDTO
 from app.domain_service.schemas import response
 from app.domain_service.schemas import syntax_validation as syntax
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
 
 
 @router.post("/login/access-token", response_model=response.Token)
@@ -1,13 +1,25 @@
 import logging
 
-from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from fastapi_csrf_protect import CsrfProtect
 from sqlalchemy.orm import Session
 
 from app.api.deps import get_current_user
+from app.constants import SCORE_DISTRIBUTION_BINS
+from app.core.tracing import TracedRoute
 from app.domain_entities.db.session import get_db
 from app.domain_entities.user import User
+from app.domain_service.data_transfer import export
 from app.domain_service.data_transfer.match import MatchDTO
+from app.domain_service.data_transfer.question_stats import QuestionStatsDTO
+from app.domain_service.play import (
+    live_counters,
+    match_analytics,
+    ranking_feeds,
+    template_pool,
+)
 from app.domain_service.schemas import response
 from app.domain_service.schemas import syntax_validation as syntax
 from app.domain_service.schemas.logical_validation import (
@@ -17,11 +29,11 @@ from app.domain_service.schemas.logical_validation import (
     ValidateMatchImport,
     ValidateNewMatch,
 )
-from app.exceptions import NotFoundObjectError
+from app.exceptions import LiveCountersError, NotFoundObjectError
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
 
 
 @router.get("/", response_model=response.Matches)
@@ -122,13 +134,87 @@ def import_questions(
     match = LogicValidation(ValidateMatchImport).validate(
         match_uid=match_uid, db_session=session
     )
+    ids = user_input["questions"]
+    if user_input["sample"]:
+        ids = template_pool.sample(
+            session,
+            user_input["sample"],
+            user_input["seed"] or match.uid,
+            levels=user_input["levels"],
+        )
+
     dto = MatchDTO(session=session)
-    dto.import_template_questions(
-        match, user_input["questions"], game_uid=user_input["game_uid"]
-    )
+    dto.import_template_questions(match, ids, game_uid=user_input["game_uid"])
     return match
 
 
+@router.get("/{uid}/stats", response_model=response.MatchStats)
+def match_stats(
+    uid: int,
+    session: Session = Depends(get_db),
+    _user: User = Depends(get_current_user),
+):
+    try:
+        RetrieveObject(uid=uid, otype="match", db_session=session).get()
+    except NotFoundObjectError as exc:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND) from exc
+
+    return QuestionStatsDTO(session=session).match_summary(uid)
+
+
+@router.get("/{uid}/dashboard", response_model=response.MatchDashboard)
+def match_dashboard(
+    uid: int,
+    bins: int = Query(SCORE_DISTRIBUTION_BINS, ge=1, le=100),
+    session: Session = Depends(get_db),
+    _user: User = Depends(get_current_user),
+):
+    try:
+        match = RetrieveObject(uid=uid, otype="match", db_session=session).get()
+    except NotFoundObjectError as exc:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND) from exc
+
+    return match_analytics.dashboard(match, session, bins)
+
+
+@router.get("/{uid}/live", response_model=response.MatchLive)
+def match_live(uid: int, _user: User = Depends(get_current_user)):
+    """The live counters of the match, read without touching the database"""
+    try:
+        return live_counters.read(uid)
+    except LiveCountersError as exc:
+        logger.error(exc.message)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=exc.message
+        ) from exc
+
+
+@router.get("/{uid}/export")
+def export_match(
+    uid: int,
+    fmt: str = Query("csv", alias="format", regex="^(csv|ndjson|parquet)$"),
+    session: Session = Depends(get_db),
+    _user: User = Depends(get_current_user),
+):
+    """Stream the reactions of the match, for the analysts"""
+    try:
+        RetrieveObject(uid=uid, otype="match", db_session=session).get()
+    except NotFoundObjectError as exc:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND) from exc
+
+    if fmt == "parquet" and export.pyarrow is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="The Parquet export needs pyarrow",
+        )
+
+    return StreamingResponse(
+        export.ReactionExport(uid, session).stream(fmt),
+        media_type=export.MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f"attachment; filename=match-{uid}.{fmt}"},
+    )
+
+
 @router.get("/rankings/{uid}", response_model=response.MatchRanking)
 def match_rankings(uid: int, session: Session = Depends(get_db)):
     try:
@@ -137,3 +223,28 @@ def match_rankings(uid: int, session: Session = Depends(get_db)):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND) from exc
 
     return {"name": match.name, "rankings": match.rankings.all()}
+
+
+@router.get("/rankings/{uid}/stream")
+async def match_rankings_stream(
+    uid: int, request: Request, session: Session = Depends(get_db)
+):
+    """
+    Stream the rankings of the match as Server-Sent Events
+
+    The first event is a snapshot, followed by the deltas
+    of the new rankings
+    """
+    try:
+        await run_in_threadpool(
+            RetrieveObject(uid=uid, otype="match", db_session=session).get
+        )
+    except NotFoundObjectError as exc:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND) from exc
+
+    feed = await run_in_threadpool(ranking_feeds.feed, uid, session)
+    last_event_id = request.headers.get("last-event-id")
+    return StreamingResponse(
+        ranking_feeds.stream(feed, request, last_event_id),
+        media_type="text/event-stream",
+    )
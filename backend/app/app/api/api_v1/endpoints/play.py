@@ -6,9 +6,17 @@ from fastapi_csrf_protect import CsrfProtect
 from pydantic import ValidationError
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
+from app.core.tracing import TracedRoute, span
 from app.domain_entities.db.session import get_db
 from app.domain_service.data_transfer.user import UserDTO
-from app.domain_service.play import PlayerStatus, PlayScore, SinglePlayer
+from app.domain_service.play import (
+    DisplayToken,
+    PlayerStatus,
+    PlayScore,
+    SinglePlayer,
+    live_counters,
+)
 from app.domain_service.schemas import response
 from app.domain_service.schemas import syntax_validation as syntax
 from app.domain_service.schemas.logical_validation import (
@@ -19,11 +27,11 @@ from app.domain_service.schemas.logical_validation import (
     ValidatePlaySign,
     ValidatePlayStart,
 )
-from app.exceptions import HuntOver, InternalException, MatchOver
+from app.exceptions import HuntOver, InternalException, MatchOver, ValidateError
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
 
 
 @router.post("/h/{match_uhash}", response_model=response.UIDSchemaBase)
@@ -33,7 +41,8 @@ def land(
     session: Session = Depends(get_db),
     csrf_protect: CsrfProtect = Depends(),
 ):
-    csrf_protect.validate_csrf_in_cookies(request)
+    with span("csrf"):
+        csrf_protect.validate_csrf_in_cookies(request)
     try:
         match_uhash = syntax.LandPlay(match_uhash=match_uhash).dict()["match_uhash"]
     except ValidationError as exc:
@@ -56,7 +65,8 @@ def code(
     session: Session = Depends(get_db),
     csrf_protect: CsrfProtect = Depends(),
 ):
-    csrf_protect.validate_csrf_in_cookies(request)
+    with span("csrf"):
+        csrf_protect.validate_csrf_in_cookies(request)
     match_code = user_input.dict()["match_code"]
     data = LogicValidation(ValidatePlayCode).validate(
         match_code=match_code, db_session=session
@@ -73,7 +83,8 @@ def start(
     session: Session = Depends(get_db),
     csrf_protect: CsrfProtect = Depends(),
 ):
-    csrf_protect.validate_csrf_in_cookies(request)
+    with span("csrf"):
+        csrf_protect.validate_csrf_in_cookies(request)
     user_input = user_input.dict()
     data = LogicValidation(ValidatePlayStart).validate(db_session=session, **user_input)
     match = data.get("match")
@@ -83,7 +94,13 @@ def start(
 
     player_status = PlayerStatus(user, match, db_session=session)
     try:
-        player = SinglePlayer(player_status, user, match, db_session=session)
+        player = SinglePlayer(
+            player_status,
+            user,
+            match,
+            db_session=session,
+            deferred=settings.DEFERRED_REACTIONS or settings.PROGRESS_TOKENS,
+        )
         next_question, attempt_uid = player.start()
     except InternalException as exc:
         logger.error(exc.message)
@@ -91,12 +108,20 @@ def start(
             status_code=status.HTTP_400_BAD_REQUEST, detail=exc.message
         ) from exc
 
-    return {
+    live_counters.played(match.uid, user.uid)
+    result = {
         "match_uid": match.uid,
         "question": next_question,
         "attempt_uid": attempt_uid,
         "user_uid": user.uid,
     }
+    if settings.PROGRESS_TOKENS:
+        result["progress_token"] = player.start_progress(attempt_uid).encode()
+    elif player.deferred:
+        result["display_token"] = DisplayToken.now(
+            match.uid, user.uid, attempt_uid, next_question.uid
+        ).encode()
+    return result
 
 
 @router.post("/next", response_model=response.NextResponse)
@@ -106,7 +131,8 @@ def next(
     session: Session = Depends(get_db),
     csrf_protect: CsrfProtect = Depends(),
 ):
-    csrf_protect.validate_csrf_in_cookies(request)
+    with span("csrf"):
+        csrf_protect.validate_csrf_in_cookies(request)
     user_input = user_input.dict()
     data = LogicValidation(ValidatePlayNext).validate(db_session=session, **user_input)
     match = data.get("match")
@@ -128,9 +154,20 @@ def next(
         ) from exc
 
     try:
-        was_correct = player.react(question, answer, open_answer)
+        was_correct = player.react(
+            question,
+            answer,
+            open_answer,
+            displayed_at=data.get("displayed_at"),
+            progress=data.get("progress"),
+        )
+        live_counters.answered(match.uid, user.uid)
     except HuntOver:
         return {"question": None, "score": 0, "was_correct": None}
+    except ValidateError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=exc.message
+        ) from exc
 
     if not match.notify_correct:
         was_correct = None
@@ -139,16 +176,27 @@ def next(
         next_q = player.forward()
     except MatchOver:
         score = PlayScore(
-            match.uid, user.uid, player_status.current_score(), db_session=session
+            match.uid,
+            user.uid,
+            player.score(),
+            db_session=session,
+            attempt_uid=attempt_uid,
         ).save_to_ranking()
         return {"question": None, "score": score.score, "was_correct": was_correct}
 
-    return {
+    result = {
         "question": next_q,
         "user_uid": user.uid,
         "match_uid": match.uid,
         "was_correct": was_correct,
     }
+    if data.get("progress"):
+        result["progress_token"] = player.progress().encode()
+    elif player.deferred:
+        result["display_token"] = DisplayToken.now(
+            match.uid, user.uid, attempt_uid, next_q.uid
+        ).encode()
+    return result
 
 
 @router.post("/sign", response_model=response.SignResponse)
@@ -158,7 +206,8 @@ def sign(
     session: Session = Depends(get_db),
     csrf_protect: CsrfProtect = Depends(),
 ):
-    csrf_protect.validate_csrf_in_cookies(request)
+    with span("csrf"):
+        csrf_protect.validate_csrf_in_cookies(request)
     user_input = user_input.dict()
     data = LogicValidation(ValidatePlaySign).validate(db_session=session, **user_input)
     user = data.get("user")
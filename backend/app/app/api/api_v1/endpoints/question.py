@@ -5,9 +5,11 @@ from fastapi_csrf_protect import CsrfProtect
 from sqlalchemy.orm import Session
 
 from app.api.deps import get_current_user
+from app.core.tracing import TracedRoute
 from app.domain_entities.db.session import get_db
 from app.domain_entities.user import User
 from app.domain_service.data_transfer.question import QuestionDTO
+from app.domain_service.data_transfer.question_stats import QuestionStatsDTO
 from app.domain_service.schemas import response
 from app.domain_service.schemas import syntax_validation as syntax
 from app.domain_service.schemas.logical_validation import (
@@ -19,7 +21,7 @@ from app.exceptions import NotFoundObjectError
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
 
 
 @router.get("/", response_model=response.ManyQuestions)
@@ -47,6 +49,20 @@ def get_question(
     return question
 
 
+@router.get("/{uid}/stats", response_model=response.QuestionStats)
+def get_question_stats(
+    uid: int,
+    session: Session = Depends(get_db),
+    _user: User = Depends(get_current_user),
+):
+    try:
+        RetrieveObject(uid=uid, otype="question", db_session=session).get()
+    except NotFoundObjectError as exc:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND) from exc
+
+    return QuestionStatsDTO(session=session).summary(uid)
+
+
 @router.post("/new", response_model=response.Question)
 def new_question(
     question_in: syntax.QuestionCreate,
@@ -1,9 +1,11 @@
 import logging
 
-from fastapi import APIRouter, Depends, Request
+from fastapi import APIRouter, Depends, Query, Request
 from fastapi_csrf_protect import CsrfProtect
 from sqlalchemy.orm import Session
 
+from app.constants import PLAYERS_PAGE_SIZE
+from app.core.tracing import TracedRoute
 from app.domain_entities.db.session import get_db
 from app.domain_service.data_transfer.user import UserDTO
 from app.domain_service.schemas import response
@@ -11,23 +13,44 @@ from app.domain_service.schemas import syntax_validation as syntax
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
 
 
-@router.get("/{match_uid}", response_model=response.Players)
-def list_players_of_match(match_uid: int, session: Session = Depends(get_db)):
+@router.get("/{match_uid}", response_model=response.MatchPlayers)
+def list_players_of_match(
+    match_uid: int,
+    after: int = None,
+    limit: int = Query(PLAYERS_PAGE_SIZE, gt=0, le=PLAYERS_PAGE_SIZE),
+    stats: bool = False,
+    session: Session = Depends(get_db),
+):
     dto = UserDTO(session=session)
-    all_players = dto.players_of_match(match_uid)
-    return {"players": all_players}
+    all_players = dto.players_of_match(match_uid, after_uid=after, limit=limit)
+    if not stats:
+        return {"players": all_players}
+
+    match_stats = dto.match_stats(match_uid, [p.uid for p in all_players])
+    return {
+        "players": [
+            dict(response.Player.from_orm(p).dict(), **match_stats.get(p.uid, {}))
+            for p in all_players
+        ]
+    }
 
 
 @router.get("/", response_model=response.Players)
-def players(signed: bool = None, session: Session = Depends(get_db)):
+def players(
+    signed: bool = None,
+    after: int = None,
+    limit: int = Query(PLAYERS_PAGE_SIZE, gt=0, le=PLAYERS_PAGE_SIZE),
+    session: Session = Depends(get_db),
+):
     dto = UserDTO(session=session)
-    query_method = {
-        True: dto.signed,
-        False: dto.unsigned,
-    }.get(signed, dto.all)
+    if signed is False:
+        all_players = dto.unsigned(after_uid=after, limit=limit)
+        return {"players": all_players}
+
+    query_method = {True: dto.signed}.get(signed, dto.all)
     all_players = query_method()
     return {"players": all_players}
 
@@ -7,12 +7,15 @@ PASSWORD_POPULATION = digits
 MATCH_CODE_LEN = 4
 CODE_POPULATION = digits
 ATTEMPT_UID_LENGTH = 32
+PLAY_EVENT_KIND_LENGTH = 20
+QUESTION_COUNTER_NAME_LENGTH = 32
 ATTEMPT_UID_POPULATION = "abcdef" + digits
 
 ISOFORMAT = "%Y-%m-%dT%H:%M:%S.%f"
 
 MATCH_NAME_MAX_LENGTH = 100
 TOPIC_NAME_LENGTH = 60
+SAMPLE_LEVELS_LENGTH = 60
 
 URL_LENGTH = 256
 
@@ -29,3 +32,96 @@ USER_NAME_MAX_LENGTH = 30
 # no matter the password's length,
 # the hash length stays the same
 PASSWORD_HASH_LENGTH = 60
+
+PLAYERS_PAGE_SIZE = 100
+# unsigned users are deleted this many at a time
+REAP_BATCH_SIZE = 1000
+# the email of the unsigned users, around a random digest
+UNSIGNED_EMAIL = "uns-{}@progame.io"
+# seconds between two closings of the abandoned deferred attempts
+CLOSE_ATTEMPTS_EVERY = 3600
+
+# seconds between two updates of the rankings stream
+RANKINGS_STREAM_TICK = 1.0
+# rankings stream events kept to resume a dropped connection
+RANKINGS_STREAM_BACKLOG = 256
+
+# seconds between two flushes of the reactions write-behind buffer
+WRITE_BEHIND_FLUSH_INTERVAL = 0.2
+# pending answer recordings that trigger an early flush
+WRITE_BEHIND_BATCH_SIZE = 500
+# failed flushes of a batch before its recordings are dead-lettered
+WRITE_BEHIND_MAX_RETRIES = 5
+# seconds the answers pending in the write-behind buffers are shared
+WRITE_BEHIND_PENDING_TTL = 3600
+
+# question, game and answer orders of the latest attempts
+PERMUTATION_CACHE_SIZE = 4096
+
+# seconds the index of the template questions is reused
+TEMPLATE_POOL_TTL = 300
+
+# difficulty buckets of the questions of adaptive matches
+DIFFICULTY_BUCKETS = 5
+# seconds the difficulty index of an adaptive match is reused
+DIFFICULTY_INDEX_TTL = 600
+
+# relative error of the response time percentiles of the questions
+RESPONSE_TIME_ACCURACY = 0.02
+# response times below this many seconds share the same bucket
+RESPONSE_TIME_MIN = 0.001
+# rows each counter of a question is split in, picked at random
+QUESTION_STATS_SHARDS = 8
+
+# rows written by each statement of a bulk update
+BULK_UPDATE_BATCH_SIZE = 5000
+# reactions fetched at a time when rescoring a match
+RESCORE_FETCH_SIZE = 10000
+
+# rows fetched and written at a time by the exports
+EXPORT_CHUNK_SIZE = 5000
+
+# bytes of match facts kept in memory for the dashboards
+ANALYTICS_MEMORY_LIMIT = 256 * 1024 * 1024
+# reactions fetched at a time when loading the match facts
+ANALYTICS_FETCH_SIZE = 10000
+# seconds an answer may be committed late and still be picked up
+ANALYTICS_REFRESH_MARGIN = 5
+# bins of the score distribution of the dashboards
+SCORE_DISTRIBUTION_BINS = 10
+
+# 2**12 registers per unique players sketch, about 1.6% of error
+LIVE_COUNTERS_PRECISION = 12
+# seconds since the last request of a player to be counted as active
+LIVE_ACTIVE_WINDOW = 120
+# seconds over which the answers per minute are averaged
+LIVE_ANSWERS_WINDOW = 60
+# seconds the live counters are kept after the last update
+LIVE_COUNTERS_TTL = 24 * 3600
+# updates of the live counters waiting to be sent to Redis
+LIVE_COUNTERS_PENDING = 10000
+# seconds a worker keeps hosting an idle live match
+LIVE_HOST_LEASE = 3600
+# seconds a live match played to its end cannot be hosted again
+LIVE_ENDED_TTL = 30 * 24 * 3600
+
+# seconds between two writes of the finished spans
+TRACE_EXPORT_INTERVAL = 1
+# finished spans waiting to be written, the oldest dropped beyond
+TRACE_EXPORT_PENDING = 10000
+
+# profiles of the requests kept in memory for the admins
+PROFILES_KEPT = 10
+# distinct SELECT statements of a profile explained at most
+PROFILER_EXPLAIN_LIMIT = 20
+
+# normalized statements remembered, to fingerprint them once
+FINGERPRINT_CACHE_SIZE = 4096
+# distinct fingerprints whose latency is tracked
+SLOW_QUERY_FINGERPRINTS = 1000
+# statements waiting to be aggregated, the oldest dropped beyond
+SLOW_QUERY_PENDING = 10000
+# seconds between two aggregations of the statements
+SLOW_QUERY_FLUSH_INTERVAL = 1
+# seconds, the lowest latency told apart by the percentiles
+SQL_LATENCY_MIN = 0.00001
@@ -1,5 +1,23 @@
 from celery import Celery
 
+from app.constants import CLOSE_ATTEMPTS_EVERY
+
 celery_app = Celery("worker", broker="amqp://guest@queue//")
 
-celery_app.conf.task_routes = {"app.worker.test_celery": "main-queue"}
+celery_app.conf.task_routes = {
+    "app.worker.test_celery": "main-queue",
+    "app.worker.reap_unsigned_players": "main-queue",
+    "app.worker.close_deferred_attempts": "main-queue",
+    "app.worker.rebuild_rankings": "main-queue",
+    "app.worker.rescore_match": "main-queue",
+}
+celery_app.conf.beat_schedule = {
+    "reap-unsigned-players": {
+        "task": "app.worker.reap_unsigned_players",
+        "schedule": 60 * 60 * 24,
+    },
+    "close-deferred-attempts": {
+        "task": "app.worker.close_deferred_attempts",
+        "schedule": CLOSE_ATTEMPTS_EVERY,
+    },
+}
@@ -47,6 +47,69 @@ class Settings(BaseSettings):
     FIRST_SUPERUSER: EmailStr
     FIRST_SUPERUSER_PASSWORD: str
 
+    # unsigned users without rankings older than this are deleted
+    UNSIGNED_PLAYERS_RETENTION_DAYS: int = 7
+
+    # live matches and ranking feeds relay their messages through
+    # Redis when there is more than one worker, in-process otherwise
+    LIVE_REDIS_RELAY: bool = False
+
+    # the live counters of the matches are kept in Redis, shared
+    # by the workers, in-process otherwise. In Redis by default
+    # when the live messages are relayed through it, that is when
+    # more than one worker is running
+    LIVE_REDIS_COUNTERS: Optional[bool] = None
+
+    @validator("LIVE_REDIS_COUNTERS", always=True)
+    def follow_live_relay(cls, v: Optional[bool], values: Dict[str, Any]) -> bool:
+        if v is None:
+            return bool(values.get("LIVE_REDIS_RELAY"))
+        return v
+
+    # answer recordings are appended to a local log, one per
+    # process named after this path, and written to the database
+    # in batches by a background flusher
+    REACTIONS_WRITE_BEHIND: bool = False
+    REACTIONS_WRITE_BEHIND_LOG: str = "/tmp/reactions-write-behind.log"
+    # the pending answers are shared in Redis, so that a duplicate
+    # answer is refused by any worker: needed with more than one
+    REACTIONS_WRITE_BEHIND_REDIS: bool = False
+
+    # finished attempts are also appended to the play_events
+    # table, which rankings can be rebuilt from along with the
+    # reactions
+    PLAY_EVENTS_LOG: bool = False
+
+    # the display time of a question travels in a signed token
+    # and the reaction is inserted only once, at answer time
+    DEFERRED_REACTIONS: bool = False
+    # deferred attempts left for this many hours are closed, the
+    # question they displayed last saved as unanswered
+    DEFERRED_ATTEMPTS_CLOSE_HOURS: int = 6
+
+    # the position of the player travels in a signed token as
+    # well, instead of being rebuilt from the reactions
+    PROGRESS_TOKENS: bool = False
+
+    # requests issuing more SQL statements than this are logged
+    # as warnings, with their slowest statement
+    SQL_QUERY_BUDGET: int = 50
+
+    # the timing spans of the requests are written in batches, one
+    # OTLP JSON export request per line, to this file or to
+    # "stdout". Not exported if empty
+    TRACE_EXPORT: str = ""
+
+    # seconds between two stack samples of the profiled requests
+    PROFILER_INTERVAL: float = 0.005
+
+    # statements slower than this many milliseconds are appended
+    # to the slow-query log, and explained on PostgreSQL, a few
+    # times per minute at most
+    SLOW_QUERY_MS: int = 100
+    SLOW_QUERY_EXPLAINS_PER_MINUTE: int = 6
+    SLOW_QUERY_LOG: str = "/tmp/slow-queries.log"
+
     class Config:
         case_sensitive = True
 
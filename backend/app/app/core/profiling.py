@@ -0,0 +1,335 @@
+import json
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar
+from time import perf_counter, time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.concurrency import run_in_threadpool
+
+from app.constants import PROFILER_EXPLAIN_LIMIT, PROFILES_KEPT
+from app.core.config import settings
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MATCH_IN_PATH = re.compile(r"/(?:matches|players|live)/(\d+)")
+
+active_profile = ContextVar("active_profile", default=None)
+
+
+class Profile:
+    """The stack samples and the SQL statements of one request"""
+
+    def __init__(self, uid, method, path):
+        self.uid = uid
+        self.method = method
+        self.path = path
+        self.started = time()
+        self.duration = None
+        self.frames = []
+        self.samples = []
+        self.weights = []
+        self.statements = []
+        self.roots = {}
+        self._frame_index = {}
+
+    def _frame(self, code):
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        if key not in self._frame_index:
+            self._frame_index[key] = len(self.frames)
+            self.frames.append({"name": key[0], "file": key[1], "line": key[2]})
+        return self._frame_index[key]
+
+    def attach(self, root=None):
+        """
+        Sample the current thread while `root` is on its stack, by
+        default the outermost frame of the app it is running
+        """
+        thread_id = threading.get_ident()
+        if root is None:
+            known = self.roots.get(thread_id)
+            frame = sys._getframe(1)
+            while frame is not None:
+                if frame is known:
+                    return
+                if frame.f_code.co_filename.startswith(APP_ROOT):
+                    root = frame
+                frame = frame.f_back
+        if root is not None:
+            self.roots[thread_id] = root
+
+    def sample(self, frame, weight, root):
+        """Keep the stack, root first, if it runs the request of `root`"""
+        stack = []
+        while frame is not None:
+            stack.append(frame)
+            frame = frame.f_back
+        if not any(f is root for f in stack):
+            return
+
+        self.samples.append([self._frame(f.f_code) for f in reversed(stack)])
+        self.weights.append(weight)
+
+    def statement(self, engine, statement, parameters, seconds):
+        self.statements.append(
+            {
+                "engine": engine,
+                "statement": statement,
+                "parameters": parameters,
+                "seconds": seconds,
+            }
+        )
+
+    def explain(self, limit=PROFILER_EXPLAIN_LIMIT):
+        """The plans of the distinct SELECT statements, after the request"""
+        plans = {}
+        for entry in self.statements:
+            statement = entry["statement"]
+            if not statement.lstrip().upper().startswith("SELECT"):
+                continue
+            if statement in plans or len(plans) >= limit:
+                continue
+
+            engine = entry["engine"]
+            prefix = (
+                "EXPLAIN (FORMAT JSON) "
+                if engine.dialect.name == "postgresql"
+                else "EXPLAIN QUERY PLAN "
+            )
+            try:
+                with engine.connect() as conn:
+                    rows = conn.exec_driver_sql(prefix + statement, entry["parameters"])
+                    plans[statement] = [list(row) for row in rows]
+            except Exception as exc:  # the plan is a best effort
+                plans[statement] = str(exc)
+
+        for entry in self.statements:
+            entry["plan"] = plans.get(entry["statement"])
+
+    def summary(self):
+        return {
+            "uid": self.uid,
+            "method": self.method,
+            "path": self.path,
+            "started": self.started,
+            "duration": self.duration,
+            "samples": len(self.samples),
+            "statements": len(self.statements),
+        }
+
+    def sql(self):
+        return [
+            {
+                "statement": e["statement"],
+                "parameters": json.loads(json.dumps(e["parameters"], default=str)),
+                "seconds": e["seconds"],
+                "plan": e.get("plan"),
+            }
+            for e in self.statements
+        ]
+
+    def speedscope(self):
+        """The samples in the file format of https://www.speedscope.app"""
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"{self.method} {self.path}",
+            "exporter": "proquiz",
+            "shared": {"frames": self.frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": f"{self.method} {self.path}",
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": self.duration or 0,
+                    "samples": self.samples,
+                    "weights": self.weights,
+                }
+            ],
+        }
+
+
+def capture_statement(conn, cursor, statement, parameters, context, executemany):
+    conn.info["profiled_at"] = perf_counter()
+
+
+def captured_statement(conn, cursor, statement, parameters, context, executemany):
+    profile = active_profile.get()
+    if profile is not None:
+        seconds = perf_counter() - conn.info.pop("profiled_at", perf_counter())
+        profile.statement(conn.engine, statement, parameters, seconds)
+        # the threadpool threads of the request are known by their statements
+        profile.attach()
+
+
+class Sampler(threading.Thread):
+    """Sample the stacks of the threads of the request every `interval` seconds"""
+
+    def __init__(self, profile, interval):
+        super().__init__(daemon=True)
+        self.profile = profile
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        last = perf_counter()
+        while not self.stopped.wait(self.interval):
+            now = perf_counter()
+            roots = dict(self.profile.roots)
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id in roots:
+                    self.profile.sample(frame, now - last, roots[thread_id])
+            last = now
+
+
+class Profiler:
+    """
+    Profile the next requests matching a path prefix and/or a
+    match uid, once armed by an admin
+
+    Nothing is sampled or listened to while it is not armed.
+    Only the stacks running the profiled request are sampled:
+    those of the event loop under its middleware, and those of
+    the threadpool under the code of the app that ran its SQL
+    """
+
+    def __init__(self, interval=None, kept=PROFILES_KEPT):
+        self.interval = interval or settings.PROFILER_INTERVAL
+        self.remaining = 0
+        self.route = None
+        self.match_uid = None
+        self.profiles = OrderedDict()
+        self._kept = kept
+        self._next_uid = 1
+        self._running = 0
+        self._lock = threading.Lock()
+
+    @property
+    def armed(self):
+        return self.remaining > 0
+
+    def arm(self, requests, route=None, match_uid=None):
+        with self._lock:
+            self.remaining = requests
+            self.route = route
+            self.match_uid = match_uid
+
+    def disarm(self):
+        self.arm(0)
+
+    def status(self):
+        return {
+            "remaining": self.remaining,
+            "route": self.route,
+            "match_uid": self.match_uid,
+            "profiles": [p.summary() for p in self.profiles.values()],
+        }
+
+    def matches(self, path, match_uid=None):
+        if self.route and not path.startswith(self.route):
+            return False
+        return self.match_uid is None or match_uid == self.match_uid
+
+    def claim(self, method, path, match_uid=None):
+        """A new profile if the request is to be profiled"""
+        with self._lock:
+            if not self.remaining or not self.matches(path, match_uid):
+                return
+
+            self.remaining -= 1
+            profile = Profile(self._next_uid, method, path)
+            self._next_uid += 1
+            self._running += 1
+            if self._running == 1:
+                event.listen(Engine, "before_cursor_execute", capture_statement)
+                event.listen(Engine, "after_cursor_execute", captured_statement)
+            return profile
+
+    def release(self, profile):
+        with self._lock:
+            self._running -= 1
+            if not self._running:
+                event.remove(Engine, "before_cursor_execute", capture_statement)
+                event.remove(Engine, "after_cursor_execute", captured_statement)
+            self.profiles[profile.uid] = profile
+            while len(self.profiles) > self._kept:
+                self.profiles.popitem(last=False)
+
+
+profiler = Profiler()
+
+
+def match_uid_of(path, query_string, body):
+    """The match of the request: in the path, the query or the JSON body"""
+    found = MATCH_IN_PATH.search(path) or re.search(
+        r"(?:^|&)match_uid=(\d+)", query_string
+    )
+    if found:
+        return int(found.group(1))
+    try:
+        data = json.loads(body or b"null")
+    except ValueError:
+        return
+    if isinstance(data, dict) and isinstance(data.get("match_uid"), int):
+        return data["match_uid"]
+
+
+class ProfilerMiddleware:
+    """
+    Hand the requests over to the profiler, while it is armed.
+    A plain ASGI middleware, so that the body can be read to
+    find the match uid and then passed on untouched
+    """
+
+    def __init__(self, app, profiler=profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.profiler.armed:
+            await self.app(scope, receive, send)
+            return
+
+        match_uid = None
+        if self.profiler.match_uid is not None:
+            receive, body = await self._buffered(receive)
+            match_uid = match_uid_of(
+                scope["path"], scope["query_string"].decode(), body
+            )
+        profile = self.profiler.claim(scope["method"], scope["path"], match_uid)
+        if profile is None:
+            await self.app(scope, receive, send)
+            return
+
+        sampler = Sampler(profile, self.profiler.interval)
+        profile.attach(sys._getframe())
+        token = active_profile.set(profile)
+        started = perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            sampler.stopped.set()
+            sampler.join()
+            profile.roots.clear()
+            profile.duration = perf_counter() - started
+            active_profile.reset(token)
+            self.profiler.release(profile)
+            await run_in_threadpool(profile.explain)
+
+    async def _buffered(self, receive):
+        messages, body = [], b""
+        while True:
+            message = await receive()
+            messages.append(message)
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+
+        async def replay():
+            return messages.pop(0) if messages else await receive()
+
+        return replay, body
@@ -0,0 +1,64 @@
+import json
+import math
+from collections import Counter
+
+from app.constants import RESPONSE_TIME_ACCURACY, RESPONSE_TIME_MIN
+
+
+def dumps(values):
+    return json.dumps(values, separators=(",", ":"), sort_keys=True)
+
+
+class ResponseTimeSketch:
+    """
+    Histogram of the response times over logarithmic buckets
+
+    Each bucket is `relative_accuracy` wide around its value,
+    so that any percentile is within that relative error while
+    only a few dozen buckets are stored. Two sketches are
+    merged by adding their counts
+    """
+
+    def __init__(
+        self,
+        counts=None,
+        relative_accuracy=RESPONSE_TIME_ACCURACY,
+        minimum=RESPONSE_TIME_MIN,
+    ):
+        self.minimum = minimum
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.counts = Counter({int(k): v for k, v in (counts or {}).items()})
+
+    @classmethod
+    def loads(cls, text):
+        return cls(json.loads(text or "{}"))
+
+    def dumps(self):
+        return dumps(self.counts)
+
+    @property
+    def count(self):
+        return sum(self.counts.values())
+
+    def key(self, seconds):
+        return math.ceil(math.log(max(seconds, self.minimum)) / self._log_gamma)
+
+    def add(self, seconds):
+        self.counts[self.key(seconds)] += 1
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+        return self
+
+    def quantile(self, q):
+        total = self.count
+        if not total:
+            return
+
+        rank = q * (total - 1)
+        seen = 0
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if seen > rank:
+                return 2 * self.gamma**key / (self.gamma + 1)
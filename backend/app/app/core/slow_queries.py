@@ -0,0 +1,266 @@
+import json
+import logging
+import queue
+import re
+import threading
+from collections import defaultdict, deque
+from functools import lru_cache
+from hashlib import blake2b
+from time import monotonic, time
+
+from app.constants import (
+    FINGERPRINT_CACHE_SIZE,
+    SLOW_QUERY_FINGERPRINTS,
+    SLOW_QUERY_FLUSH_INTERVAL,
+    SLOW_QUERY_PENDING,
+    SQL_LATENCY_MIN,
+)
+from app.core.config import settings
+from app.core.sketch import ResponseTimeSketch
+
+logger = logging.getLogger(__name__)
+
+PERCENTILES = (50, 95, 99)
+NORMALIZATIONS = (
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"%\(\w+\)s|%s|(?<!:):(?!:)\w+|\$\d+"), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)"), "(?+)"),
+    (re.compile(r"\s+"), " "),
+)
+
+
+@lru_cache(maxsize=FINGERPRINT_CACHE_SIZE)
+def fingerprint(statement):
+    """The statement without its literals and parameters, and its id"""
+    normalized = statement.strip()
+    for pattern, replacement in NORMALIZATIONS:
+        normalized = pattern.sub(replacement, normalized)
+    digest = blake2b(normalized.encode(), digest_size=8).hexdigest()
+    return digest, normalized
+
+
+def explainable(statement):
+    text = statement.lstrip().upper()
+    return text.startswith("SELECT") and "FOR UPDATE" not in text
+
+
+class RateLimiter:
+    """At most `per_minute` events, spread as a token bucket"""
+
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self._tokens = float(per_minute)
+        self._last = monotonic()
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(
+                self.per_minute,
+                self._tokens + (now - self._last) * self.per_minute / 60,
+            )
+            self._last = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class FingerprintStats:
+    def __init__(self, uid, normalized):
+        self.uid = uid
+        self.normalized = normalized
+        self.count = 0
+        self.total = 0.0
+        self.slowest = 0.0
+        self.sketch = ResponseTimeSketch(minimum=SQL_LATENCY_MIN)
+        self.plan = None
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.slowest = max(self.slowest, seconds)
+        self.sketch.add(seconds)
+
+    def summary(self):
+        return dict(
+            {
+                "fingerprint": self.uid,
+                "statement": self.normalized,
+                "count": self.count,
+                "total_ms": self.total * 1000,
+                "mean_ms": self.total * 1000 / self.count,
+                "max_ms": self.slowest * 1000,
+                "plan": self.plan,
+            },
+            **{f"p{p}_ms": self.sketch.quantile(p / 100) * 1000 for p in PERCENTILES},
+        )
+
+
+class SlowQueryLog:
+    """
+    The latency of every statement, grouped by fingerprint
+
+    Recording a statement only appends it to a bounded buffer: a
+    background thread fingerprints and aggregates the buffer every
+    `interval` seconds, appends the statements slower than
+    `threshold` seconds to the log file and, on PostgreSQL,
+    explains the SELECTs among them with ANALYZE and BUFFERS, at
+    most `explains_per_minute` times
+    """
+
+    ORDERS = {"total": "total_ms", "count": "count", "p95": "p95_ms", "max": "max_ms"}
+
+    def __init__(
+        self,
+        threshold=None,
+        explains_per_minute=None,
+        path=None,
+        max_fingerprints=SLOW_QUERY_FINGERPRINTS,
+        interval=SLOW_QUERY_FLUSH_INTERVAL,
+    ):
+        self.threshold = (
+            threshold if threshold is not None else settings.SLOW_QUERY_MS / 1000
+        )
+        self.path = path if path is not None else settings.SLOW_QUERY_LOG
+        self.max_fingerprints = max_fingerprints
+        self.interval = interval
+        self._limiter = RateLimiter(
+            explains_per_minute or settings.SLOW_QUERY_EXPLAINS_PER_MINUTE
+        )
+        self._stats = {}
+        self._pending = deque(maxlen=SLOW_QUERY_PENDING)
+        self._lock = threading.Lock()
+        self._explains = queue.Queue(maxsize=max_fingerprints)
+        self._worker = None
+
+    def record(self, engine, statement, parameters, seconds):
+        if seconds < self.threshold:
+            parameters = None
+        self._pending.append((engine, statement, parameters, seconds))
+        if self._worker is None:
+            self._start_worker()
+
+    def flush(self):
+        """Aggregate the buffered statements, log and explain the slow ones"""
+        slow = []
+        with self._lock:
+            while self._pending:
+                engine, statement, parameters, seconds = self._pending.popleft()
+                uid, normalized = fingerprint(statement)
+                stats = self._stats.get(uid)
+                if stats is None:
+                    if len(self._stats) >= self.max_fingerprints:
+                        continue
+                    stats = self._stats[uid] = FingerprintStats(uid, normalized)
+                stats.add(seconds)
+                if seconds >= self.threshold:
+                    slow.append((engine, stats, statement, parameters, seconds))
+
+        self.write(
+            {"fingerprint": found.uid, "seconds": took, "statement": text}
+            for _, found, text, _, took in slow
+        )
+        for engine, stats, statement, parameters, _ in slow:
+            if (
+                engine.dialect.name == "postgresql"
+                and explainable(statement)
+                and self._limiter.allow()
+            ):
+                try:
+                    self._explains.put_nowait((engine, stats, statement, parameters))
+                except queue.Full:
+                    pass
+
+    def write(self, entries):
+        entries = [json.dumps(dict(e, at=time()), default=str) for e in entries]
+        if not self.path or not entries:
+            return
+        try:
+            with open(self.path, "a") as out:
+                out.write("\n".join(entries) + "\n")
+        except OSError as exc:
+            logger.warning(f"Slow queries not logged: {exc}")
+
+    def _start_worker(self):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            try:
+                self._explain(timeout=self.interval)
+                self.flush()
+            except Exception:
+                logger.exception("Slow queries not aggregated")
+
+    def _explain(self, timeout):
+        """Explain the queued statements, waiting `timeout` for the first"""
+        try:
+            self.explain(*self._explains.get(timeout=timeout))
+        except queue.Empty:
+            return
+        while True:
+            try:
+                self.explain(*self._explains.get_nowait())
+            except queue.Empty:
+                return
+
+    def explain(self, engine, stats, statement, parameters):
+        try:
+            with engine.connect() as conn:
+                (plan,) = conn.exec_driver_sql(
+                    "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + statement, parameters
+                ).one()
+        except Exception as exc:  # the plan is a best effort
+            logger.warning(f"Slow query not explained: {exc}")
+            return
+
+        stats.plan = plan
+        self.write([{"fingerprint": stats.uid, "plan": plan}])
+
+    def top(self, limit=20, order="total"):
+        self.flush()
+        with self._lock:
+            summaries = [stats.summary() for stats in self._stats.values()]
+        key = self.ORDERS[order]
+        return sorted(summaries, key=lambda s: s[key], reverse=True)[:limit]
+
+
+slow_query_log = SlowQueryLog()
+
+
+def report(lines, limit=20, order="total"):
+    """The slowest fingerprints of a slow-query log file"""
+    entries = defaultdict(lambda: {"seconds": [], "plan": None, "statement": None})
+    for line in lines:
+        entry = json.loads(line)
+        found = entries[entry["fingerprint"]]
+        if "plan" in entry:
+            found["plan"] = entry["plan"]
+            continue
+        found["seconds"].append(entry["seconds"])
+        found["statement"] = found["statement"] or fingerprint(entry["statement"])[1]
+
+    rows = []
+    for uid, found in entries.items():
+        seconds = sorted(found["seconds"])
+        if not seconds:
+            continue
+        rows.append(
+            {
+                "fingerprint": uid,
+                "statement": found["statement"],
+                "count": len(seconds),
+                "total_ms": sum(seconds) * 1000,
+                "p95_ms": seconds[int(0.95 * (len(seconds) - 1))] * 1000,
+                "max_ms": seconds[-1] * 1000,
+                "plan": found["plan"],
+            }
+        )
+    key = SlowQueryLog.ORDERS[order]
+    return sorted(rows, key=lambda r: r[key], reverse=True)[:limit]
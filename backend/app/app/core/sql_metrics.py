@@ -0,0 +1,188 @@
+import json
+import logging
+import threading
+from collections import defaultdict
+from contextvars import ContextVar
+from time import perf_counter
+
+from sqlalchemy import event
+from sqlalchemy.engine.default import CACHE_HIT, CACHE_MISS
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.core.config import settings
+from app.core.slow_queries import slow_query_log
+
+logger = logging.getLogger(__name__)
+
+request_stats = ContextVar("request_stats", default=None)
+
+
+class RequestStats:
+    """The statements and commits issued while serving one request"""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        self.commits = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.slowest = (0.0, None)
+
+    def statement(self, statement, seconds, cache_hit=None):
+        self.queries += 1
+        self.seconds += seconds
+        self.cache_hits += cache_hit is CACHE_HIT
+        self.cache_misses += cache_hit is CACHE_MISS
+        if seconds >= self.slowest[0]:
+            self.slowest = (seconds, statement)
+
+    def commit(self):
+        self.commits += 1
+
+    def server_timing(self):
+        return (
+            f'db;dur={self.seconds * 1000:.2f};desc="{self.queries} queries", '
+            f'commit;desc="{self.commits} commits"'
+        )
+
+    def as_dict(self):
+        return {
+            "queries": self.queries,
+            "db_ms": round(self.seconds * 1000, 2),
+            "commits": self.commits,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "slowest_ms": round(self.slowest[0] * 1000, 2),
+            "slowest": self.slowest[1],
+        }
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = perf_counter() - conn.info["query_start"].pop()
+    slow_query_log.record(conn.engine, statement, parameters, seconds)
+    stats = request_stats.get()
+    if stats is not None:
+        stats.statement(statement, seconds, getattr(context, "cache_hit", None))
+
+
+def handle_error(context):
+    context.connection.info.get("query_start", [None]).pop()
+
+
+def on_commit(conn):
+    stats = request_stats.get()
+    if stats is not None:
+        stats.commit()
+
+
+def instrument(engine):
+    """
+    Count the statements and commits of `engine` in the current
+    request, and fingerprint the statements for the slow-query log
+    """
+    if event.contains(engine, "before_cursor_execute", before_cursor_execute):
+        return
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine, "handle_error", handle_error)
+    event.listen(engine, "commit", on_commit)
+
+
+class SQLMetrics:
+    """
+    Counters of the requests, statements, database time, commits
+    and compiled-statement cache hits per route, in the Prometheus
+    text format
+    """
+
+    COUNTERS = (
+        ("requests", "Requests served"),
+        ("queries", "SQL statements executed"),
+        ("db_seconds", "Seconds spent in the database"),
+        ("commits", "Transactions committed"),
+        ("cache_hits", "Statements whose compiled form was cached"),
+        ("cache_misses", "Statements compiled anew"),
+    )
+
+    def __init__(self, prefix="proquiz_sql"):
+        self.prefix = prefix
+        self._counters = defaultdict(lambda: defaultdict(float))
+        self._lock = threading.Lock()
+
+    def add(self, route, stats):
+        with self._lock:
+            counters = self._counters[route]
+            counters["requests"] += 1
+            counters["queries"] += stats.queries
+            counters["db_seconds"] += stats.seconds
+            counters["commits"] += stats.commits
+            counters["cache_hits"] += stats.cache_hits
+            counters["cache_misses"] += stats.cache_misses
+
+    def get(self, route, name):
+        return self._counters.get(route, {}).get(name, 0)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, description in self.COUNTERS:
+                metric = f"{self.prefix}_{name}_total"
+                lines.append(f"# HELP {metric} {description}")
+                lines.append(f"# TYPE {metric} counter")
+                for route, counters in sorted(self._counters.items()):
+                    lines.append(f'{metric}{{route="{route}"}} {counters[name]:g}')
+        return "\n".join(lines) + "\n"
+
+
+sql_metrics = SQLMetrics()
+route_paths = {}
+
+
+def route_of(request):
+    """The path template of the route that served the request"""
+    endpoint = request.scope.get("endpoint")
+    if endpoint not in route_paths:
+        route_paths[endpoint] = next(
+            (
+                route.path
+                for route in request.app.routes
+                if getattr(route, "endpoint", None) is endpoint
+            ),
+            "unmatched",
+        )
+    return f"{request.method} {route_paths[endpoint]}"
+
+
+class SQLBudgetMiddleware(BaseHTTPMiddleware):
+    """
+    Collect the statements issued by each request, report them in
+    the Server-Timing header, the route counters and the logs
+    """
+
+    def __init__(self, app, metrics=sql_metrics):
+        super().__init__(app)
+        self.metrics = metrics
+
+    async def dispatch(self, request, call_next):
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        try:
+            response = await call_next(request)
+        finally:
+            request_stats.reset(token)
+
+        route = route_of(request)
+        self.metrics.add(route, stats)
+        response.headers["Server-Timing"] = stats.server_timing()
+        log = (
+            logger.warning
+            if stats.queries > settings.SQL_QUERY_BUDGET
+            else logger.debug
+        )
+        log(json.dumps(dict(stats.as_dict(), route=route)))
+        return response
@@ -0,0 +1,252 @@
+import json
+import logging
+import os
+import sys
+import threading
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from time import perf_counter_ns, sleep, time_ns
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from pydantic.fields import ModelField
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.constants import TRACE_EXPORT_INTERVAL, TRACE_EXPORT_PENDING
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+current_span = ContextVar("current_span", default=None)
+
+# upper bounds of the histogram buckets, in milliseconds
+BUCKETS_MS = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class Span:
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "start",
+        "end",
+        "attributes",
+    )
+
+    def __init__(self, name, parent=None, **attributes):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.start = time_ns()
+        self.end = None
+        self.attributes = attributes
+
+    @property
+    def milliseconds(self):
+        return (self.end - self.start) / 1e6
+
+    def as_otlp(self):
+        """The span in the JSON encoding of OpenTelemetry (OTLP)"""
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end),
+            "attributes": [
+                {"key": key, "value": {"stringValue": str(value)}}
+                for key, value in self.attributes.items()
+            ],
+        }
+
+
+class SpanExporter:
+    """
+    Write the finished spans to a file or stdout, as OTLP JSON
+
+    The spans are buffered and written by a background thread
+    every `interval` seconds, one export request per line: the
+    spans of the batch under the resource of the service
+    """
+
+    def __init__(
+        self, target, interval=TRACE_EXPORT_INTERVAL, pending=TRACE_EXPORT_PENDING
+    ):
+        self.target = target
+        self.interval = interval
+        self._pending = deque(maxlen=pending)
+        self._out = None
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        self._pending.append(span)
+        if self._worker is None:
+            self._start_worker()
+
+    def _start_worker(self):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            sleep(self.interval)
+            self.flush()
+
+    @staticmethod
+    def request(spans):
+        """The ExportTraceServiceRequest of the spans"""
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": {"stringValue": settings.PROJECT_NAME},
+                            }
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": __name__},
+                            "spans": [span.as_otlp() for span in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+
+    def flush(self):
+        with self._lock:
+            spans = []
+            while self._pending:
+                spans.append(self._pending.popleft())
+            if not spans:
+                return
+
+            try:
+                if self._out is None:
+                    self._out = (
+                        sys.stdout
+                        if self.target == "stdout"
+                        else open(self.target, "a")
+                    )
+                self._out.write(json.dumps(self.request(spans)) + "\n")
+                self._out.flush()
+            except OSError as exc:
+                logger.warning(f"{len(spans)} spans not exported: {exc}")
+
+
+class PhaseHistograms:
+    """The durations of each phase, counted in fixed buckets"""
+
+    def __init__(self, bounds=BUCKETS_MS):
+        self.bounds = bounds
+        self._phases = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, milliseconds):
+        with self._lock:
+            counts, total = self._phases.get(name, ([0] * (len(self.bounds) + 1), 0.0))
+            counts[bisect_left(self.bounds, milliseconds)] += 1
+            self._phases[name] = (counts, total + milliseconds)
+
+    def summary(self):
+        with self._lock:
+            phases = dict(self._phases)
+
+        result = {}
+        for name, (counts, total) in sorted(phases.items()):
+            cumulative, buckets = 0, []
+            for bound, count in zip(self.bounds + ("+Inf",), counts):
+                cumulative += count
+                buckets.append({"le": bound, "count": cumulative})
+            result[name] = {"count": cumulative, "sum_ms": total, "buckets": buckets}
+        return result
+
+
+class Tracer:
+    def __init__(self, histograms, exporter=None):
+        self.histograms = histograms
+        self.exporter = exporter
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Time the block as a child of the current span"""
+        span = Span(name, current_span.get(), **attributes)
+        token = current_span.set(span)
+        started = perf_counter_ns()
+        try:
+            yield span
+        finally:
+            span.end = span.start + perf_counter_ns() - started
+            current_span.reset(token)
+            self.histograms.observe(name, span.milliseconds)
+            if self.exporter:
+                self.exporter.export(span)
+
+    def traced(self, name):
+        """Time each call of the decorated function"""
+
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+
+tracer = Tracer(
+    PhaseHistograms(),
+    SpanExporter(settings.TRACE_EXPORT) if settings.TRACE_EXPORT else None,
+)
+span = tracer.span
+traced = tracer.traced
+
+
+class TracingMiddleware(BaseHTTPMiddleware):
+    """Open the root span of each request"""
+
+    async def dispatch(self, request, call_next):
+        with span("request", method=request.method, path=request.url.path):
+            return await call_next(request)
+
+
+class TracedJSONResponse(JSONResponse):
+    """Time the encoding of the response bodies"""
+
+    def render(self, content):
+        with span("serialization"):
+            return super().render(content)
+
+
+class TracedResponseField(ModelField):
+    """Time the validation of the responses against their model"""
+
+    __slots__ = ()
+
+    def validate(self, *args, **kwargs):
+        with span("response_validation"):
+            return super().validate(*args, **kwargs)
+
+
+class TracedRoute(APIRoute):
+    """Route whose responses are validated under their own span"""
+
+    def get_route_handler(self):
+        # the cloned field is used only by the handler of the route
+        if self.secure_cloned_response_field is not None:
+            self.secure_cloned_response_field.__class__ = TracedResponseField
+        return super().get_route_handler()
@@ -1,8 +1,11 @@
 from app.domain_entities.answer import Answer  # noqa: F401
+from app.domain_entities.attempt import Attempt  # noqa: F401
 from app.domain_entities.game import Game  # noqa: F401
 from app.domain_entities.match import Match  # noqa: F401
 from app.domain_entities.open_answer import OpenAnswer  # noqa: F401
+from app.domain_entities.play_event import PlayEvent  # noqa: F401
 from app.domain_entities.question import Question  # noqa: F401
+from app.domain_entities.question_counter import QuestionCounter  # noqa: F401
 from app.domain_entities.ranking import Ranking  # noqa: F401
 from app.domain_entities.reaction import Reaction  # noqa: F401
 from app.domain_entities.user import User  # noqa: F401
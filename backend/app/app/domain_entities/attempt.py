@@ -0,0 +1,45 @@
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Index, Integer, String
+from sqlalchemy.orm import relationship
+from sqlalchemy.schema import UniqueConstraint
+
+from app.constants import ATTEMPT_UID_LENGTH
+from app.domain_entities.db.base import Base
+from app.domain_entities.db.utils import TableMixin
+
+
+class Attempt(TableMixin, Base):
+    """
+    Summary of the reactions of one attempt at a match
+
+    It is updated along with the reactions, so that the score,
+    the progress and the players of a match are read from one
+    row per attempt
+    """
+
+    __tablename__ = "attempts"
+
+    user_uid = Column(
+        Integer, ForeignKey("users.uid", ondelete="CASCADE"), nullable=False
+    )
+    user = relationship("User")
+    match_uid = Column(
+        Integer, ForeignKey("matches.uid", ondelete="CASCADE"), nullable=False
+    )
+    attempt_uid = Column(String(ATTEMPT_UID_LENGTH), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=False)
+    # set once the score of the attempt is saved to the ranking
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    # how many questions were displayed, answered and answered correctly
+    displayed = Column(Integer, nullable=False, default=0)
+    answered = Column(Integer, nullable=False, default=0)
+    correct = Column(Integer, nullable=False, default=0)
+    score = Column(Float, nullable=False, default=0)
+    # seconds from the first question to the end of the attempt
+    duration = Column(Float, nullable=True)
+    # the progress-token steps played
+    steps = Column(Integer, nullable=False, default=0, server_default="0")
+
+    __table_args__ = (
+        UniqueConstraint("attempt_uid", name="uq_attempts_attempt_uid"),
+        Index("ix_attempts_match_uid_user_uid", "match_uid", "user_uid"),
+    )
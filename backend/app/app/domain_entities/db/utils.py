@@ -1,11 +1,25 @@
 from datetime import datetime, timezone
+from functools import lru_cache
+from random import Random
 from typing import Union
 
-from sqlalchemy import Column, DateTime, Integer, Table
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Integer,
+    Table,
+    bindparam,
+    cast,
+    column,
+    update,
+    values,
+)
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.orm import Query, declarative_mixin
 from sqlalchemy.sql.expression import ColumnOperators
 
+from app.constants import BULK_UPDATE_BATCH_SIZE, PERMUTATION_CACHE_SIZE
 from app.domain_entities.db.base import Base
 
 
@@ -13,6 +27,82 @@ def t_now():
     return datetime.now(tz=timezone.utc)
 
 
+@lru_cache(maxsize=PERMUTATION_CACHE_SIZE)
+def seeded_permutation(seed: str, uids: tuple) -> tuple:
+    """Shuffle the uids, always in the same way for the same seed"""
+    order = sorted(uids)
+    Random(seed).shuffle(order)
+    return tuple(order)
+
+
+def insert_ignore(db_session, table: Table, **values):
+    """
+    Insert the row outside of the unit of work, so that nothing
+    else is flushed, unless it conflicts with an existing one
+    """
+    dialect = (
+        postgresql if db_session.get_bind().dialect.name == "postgresql" else sqlite
+    )
+    db_session.execute(dialect.insert(table).values(**values).on_conflict_do_nothing())
+
+
+def increment_counters(db_session, table: Table, keys: tuple, rows: list):
+    """
+    Add the `total` of each row to the counter identified by its
+    `keys` columns, created if missing, with one statement that
+    reads nothing. The rows should come in the same order in all
+    the transactions, so that they lock them in the same order
+    """
+    dialect = (
+        postgresql if db_session.get_bind().dialect.name == "postgresql" else sqlite
+    )
+    statement = dialect.insert(table).values(rows)
+    db_session.execute(
+        statement.on_conflict_do_update(
+            index_elements=keys,
+            set_={"total": table.c.total + statement.excluded.total},
+        )
+    )
+
+
+def update_from_values(
+    db_session,
+    table: Table,
+    names: tuple,
+    rows: list,
+    batch_size=BULK_UPDATE_BATCH_SIZE,
+) -> int:
+    """
+    Update the rows of `table` identified by the first of `names`
+
+    On PostgreSQL each batch is one UPDATE .. FROM (VALUES ..),
+    elsewhere one executemany. Nothing goes through the ORM
+    """
+    key, *targets = names
+    if db_session.get_bind().dialect.name != "postgresql":
+        statement = (
+            update(table)
+            .where(table.c[key] == bindparam(f"_{key}"))
+            .values({name: bindparam(f"_{name}") for name in targets})
+        )
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start : start + batch_size]
+            db_session.execute(
+                statement, [{f"_{n}": v for n, v in zip(names, row)} for row in batch]
+            )
+        return len(rows)
+
+    columns = [column(name, table.c[name].type) for name in names]
+    for start in range(0, len(rows), batch_size):
+        data = values(*columns, name="v").data(rows[start : start + batch_size])
+        db_session.execute(
+            update(table).where(table.c[key] == data.c[key])
+            # all-NULL columns would be typed as text otherwise
+            .values({name: cast(data.c[name], table.c[name].type) for name in targets})
+        )
+    return len(rows)
+
+
 class StoreConfig:
     _instance = None
     _session = None
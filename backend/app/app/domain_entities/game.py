@@ -8,6 +8,9 @@ from app.domain_entities.db.utils import QAppenderClass, TableMixin
 
 class Game(TableMixin, Base):
     __tablename__ = "games"
+    # read-mostly entity: rows already loaded in the session are not
+    # overwritten when a query returns them again
+    __mapper_args__ = {"always_refresh": False}
 
     match_uid = Column(
         Integer, ForeignKey("matches.uid", ondelete="CASCADE"), nullable=False
@@ -8,6 +8,7 @@ from app.constants import (
     MATCH_HASH_LEN,
     MATCH_NAME_MAX_LENGTH,
     MATCH_PASSWORD_LEN,
+    SAMPLE_LEVELS_LENGTH,
     TOPIC_NAME_LENGTH,
 )
 from app.domain_entities.db.base import Base
@@ -16,6 +17,9 @@ from app.domain_entities.db.utils import QAppenderClass, TableMixin
 
 class Match(TableMixin, Base):
     __tablename__ = "matches"
+    # read-mostly entity: rows already loaded in the session are not
+    # overwritten when a query returns them again
+    __mapper_args__ = {"always_refresh": False}
 
     name = Column(String(MATCH_NAME_MAX_LENGTH), nullable=False, unique=True)
     # unique hash identifying this match
@@ -41,6 +45,17 @@ class Match(TableMixin, Base):
     # implies the next question is returned only if the previous
     # one was answered correctly
     treasure_hunt = Column(Boolean, server_default="0")
+    # indicates whether the next question is picked by difficulty,
+    # based on how the player is doing
+    adaptive = Column(Boolean, server_default="0")
+    # how many questions of each game an attempt plays, drawn by
+    # its seed, among those of the sample levels if any. All of
+    # them are played when it is null
+    sample = Column(Integer, nullable=True)
+    # comma-separated, read and written through sample_levels
+    _sample_levels = Column(
+        "sample_levels", String(SAMPLE_LEVELS_LENGTH), nullable=True
+    )
 
     games = relationship(
         "Game",
@@ -56,6 +71,13 @@ class Match(TableMixin, Base):
         lazy="dynamic",
         query_class=QAppenderClass,
     )
+    attempts = relationship(
+        "Attempt",
+        viewonly=True,
+        order_by="Attempt.uid",
+        lazy="dynamic",
+        query_class=QAppenderClass,
+    )
     rankings = relationship(
         "Ranking",
         viewonly=True,
@@ -64,6 +86,18 @@ class Match(TableMixin, Base):
         query_class=QAppenderClass,
     )
 
+    @property
+    def sample_levels(self):
+        if not self._sample_levels:
+            return []
+        return [int(level) for level in self._sample_levels.split(",")]
+
+    @sample_levels.setter
+    def sample_levels(self, levels):
+        self._sample_levels = (
+            ",".join(str(level) for level in sorted(set(levels))) if levels else None
+        )
+
     @property
     def questions(self):
         return [g.questions.all() for g in self.games]
@@ -105,12 +139,7 @@ class Match(TableMixin, Base):
     def left_attempts(self, user):
         if self.times == 0:
             return 1
-        return (
-            self.times
-            - self.reactions.filter_by(user_uid=user.uid)
-            .filter_join(position=0)
-            .count()
-        )
+        return self.times - self.attempts.filter_by(user_uid=user.uid).count()
 
     @property
     def open_answers(self):
@@ -0,0 +1,36 @@
+from sqlalchemy import Column, DateTime, Float, Index, Integer, String
+
+from app.constants import ATTEMPT_UID_LENGTH, PLAY_EVENT_KIND_LENGTH
+from app.domain_entities.db.base import Base
+from app.domain_entities.db.utils import TableMixin
+
+ATTEMPT_FINISHED = "AttemptFinished"
+
+
+class PlayEvent(TableMixin, Base):
+    """
+    Append-only log of what happened while playing
+
+    Rows are inserted and never updated, the uids give the
+    order in which the events are replayed. The uids of the
+    other entities are not foreign keys, so that the log
+    outlives them
+    """
+
+    __tablename__ = "play_events"
+    # rows are never updated, no need to reload them
+    __mapper_args__ = {"always_refresh": False}
+
+    kind = Column(String(PLAY_EVENT_KIND_LENGTH), nullable=False)
+    match_uid = Column(Integer, nullable=False)
+    user_uid = Column(Integer, nullable=False)
+    attempt_uid = Column(String(ATTEMPT_UID_LENGTH), nullable=True)
+    game_uid = Column(Integer, nullable=True)
+    question_uid = Column(Integer, nullable=True)
+    answer_uid = Column(Integer, nullable=True)
+    open_answer_uid = Column(Integer, nullable=True)
+    displayed_at = Column(DateTime(timezone=True), nullable=True)
+    answered_at = Column(DateTime(timezone=True), nullable=True)
+    score = Column(Float, nullable=True)
+
+    __table_args__ = (Index("ix_play_events_match_uid_uid", "match_uid", "uid"),)
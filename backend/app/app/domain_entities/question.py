@@ -6,11 +6,18 @@ from sqlalchemy.schema import UniqueConstraint
 
 from app.constants import QUESTION_TEXT_MAX_LENGTH, URL_LENGTH
 from app.domain_entities.db.base import Base
-from app.domain_entities.db.utils import QAppenderClass, TableMixin
+from app.domain_entities.db.utils import (
+    QAppenderClass,
+    TableMixin,
+    seeded_permutation,
+)
 
 
 class Question(TableMixin, Base):
     __tablename__ = "questions"
+    # read-mostly entity: rows already loaded in the session are not
+    # overwritten when a query returns them again
+    __mapper_args__ = {"always_refresh": False}
 
     game_uid = Column(Integer, ForeignKey("games.uid", ondelete="SET NULL"))
     text = Column(String(QUESTION_TEXT_MAX_LENGTH), nullable=False)
@@ -37,6 +44,9 @@ class Question(TableMixin, Base):
     __table_args__ = (
         UniqueConstraint("game_uid", "position", name="ck_question_game_uid_position"),
     )
+    # set on the instance to display the answers in the order
+    # of an attempt, not stored
+    display_seed = None
 
     def __init__(self, **kwargs):
         if not kwargs.get("text") and kwargs.get("content_url"):
@@ -54,8 +64,13 @@ class Question(TableMixin, Base):
     @property
     def answers_to_display(self):
         _answers = [(a.uid, a.text or a.content_url) for a in self.answers.all()]
-        shuffle(_answers)
-        return _answers
+        if not self.display_seed:
+            shuffle(_answers)
+            return _answers
+
+        by_uid = dict(_answers)
+        order = seeded_permutation(f"{self.display_seed}:{self.uid}", tuple(by_uid))
+        return [(uid, by_uid[uid]) for uid in order]
 
     @property
     def is_template(self):
@@ -0,0 +1,40 @@
+from sqlalchemy import Column, ForeignKey, Index, Integer, String
+from sqlalchemy.schema import UniqueConstraint
+
+from app.constants import QUESTION_COUNTER_NAME_LENGTH
+from app.domain_entities.db.base import Base
+from app.domain_entities.db.utils import TableMixin
+
+
+class QuestionCounter(TableMixin, Base):
+    """
+    One counter of the answers given to one question
+
+    Each counter is split in a few rows, the shards, and every
+    answer adds to one of them picked at random, so that the
+    answers to the same question seldom update the same row.
+    The statistics of a question add its shards up
+    """
+
+    __tablename__ = "question_counters"
+
+    question_uid = Column(
+        Integer, ForeignKey("questions.uid", ondelete="CASCADE"), nullable=False
+    )
+    match_uid = Column(
+        Integer, ForeignKey("matches.uid", ondelete="CASCADE"), nullable=True
+    )
+    # "attempts", "correct", "answer:<uid or open>" or "timing:<bucket>"
+    name = Column(String(QUESTION_COUNTER_NAME_LENGTH), nullable=False)
+    shard = Column(Integer, nullable=False, default=0)
+    total = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint(
+            "question_uid",
+            "name",
+            "shard",
+            name="uq_question_counters_question_uid_name_shard",
+        ),
+        Index("ix_question_counters_match_uid", "match_uid"),
+    )
@@ -1,4 +1,13 @@
-from sqlalchemy import Boolean, Column, DateTime, Float, ForeignKey, Integer, String
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+)
 from sqlalchemy.orm import relationship
 from sqlalchemy.schema import UniqueConstraint
 
@@ -46,6 +55,7 @@ class Reaction(TableMixin, Base):
         UniqueConstraint(
             "question_uid", "answer_uid", "user_uid", "match_uid", "create_timestamp"
         ),
+        Index("ix_reactions_match_uid_user_uid", "match_uid", "user_uid"),
     )
 
     @property
@@ -1,5 +1,5 @@
 import bcrypt
-from sqlalchemy import Boolean, Column, String
+from sqlalchemy import Boolean, Column, Index, String
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import Session, relationship
 
@@ -39,6 +39,15 @@ class User(TableMixin, Base):
         query_class=QAppenderClass,
     )
 
+    __table_args__ = (
+        Index(
+            "ix_users_email_digest_token_digest",
+            "email_digest",
+            "token_digest",
+            unique=True,
+        ),
+    )
+
     def __init__(self, db_session: Session = None, **kwargs):
         self._session = db_session
         password = kwargs.pop("password", None)
@@ -36,6 +36,9 @@ class AnswerDTO:
     def get(self, **filters):
         return self._session.query(self.klass).filter_by(**filters).one_or_none()
 
+    def get_by_uid(self, uid):
+        return self._session.get(self.klass, uid)
+
     def nullable_column(self, name):
         return self.klass.__table__.columns.get(name).nullable
 
@@ -0,0 +1,284 @@
+from datetime import timezone
+from uuid import uuid4
+
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+
+from app.constants import BULK_UPDATE_BATCH_SIZE
+from app.domain_entities import Answer, Attempt, Game, Question, Reaction
+from app.domain_entities.db.utils import insert_ignore, t_now, update_from_values
+
+# the columns of the summaries rebuilt by the backfill, by attempt
+BACKFILLED = (
+    "attempt_uid",
+    "started_at",
+    "finished_at",
+    "displayed",
+    "answered",
+    "correct",
+    "score",
+    "duration",
+)
+
+
+def aware(value):
+    """SQLite gives the timestamps back without their timezone"""
+    return value.replace(tzinfo=timezone.utc) if value and not value.tzinfo else value
+
+
+class AttemptDTO:
+    """
+    The summary of each attempt is created by its first reaction
+    and its counters are incremented in the same transaction as
+    the next ones, with UPDATE .. SET x = x + n, so that the
+    workers add to the same row without reading it first
+    """
+
+    def __init__(self, session: Session):
+        self._session = session
+        self.klass = Attempt
+
+    def get(self, attempt_uid):
+        # the counters are updated outside of the identity map
+        return (
+            self._session.query(self.klass)
+            .filter_by(attempt_uid=attempt_uid)
+            .populate_existing()
+            .one_or_none()
+        )
+
+    def _increment(self, attempt_uid, **amounts):
+        self._session.query(self.klass).filter_by(attempt_uid=attempt_uid).update(
+            {
+                getattr(self.klass, name): getattr(self.klass, name) + amount
+                for name, amount in amounts.items()
+            },
+            synchronize_session=False,
+        )
+
+    def reserve(self, user_uid, match_uid, attempt_uid):
+        """Create the summary of an attempt before its first reaction"""
+        insert_ignore(
+            self._session,
+            self.klass.__table__,
+            user_uid=user_uid,
+            match_uid=match_uid,
+            attempt_uid=attempt_uid,
+            started_at=t_now(),
+            displayed=0,
+            answered=0,
+            correct=0,
+            score=0,
+        )
+        self._session.commit()
+
+    def release(self, attempt_uid):
+        """Drop the summary of an attempt that never started"""
+        self._session.query(self.klass).filter_by(
+            attempt_uid=attempt_uid, displayed=0
+        ).delete(synchronize_session=False)
+        self._session.commit()
+
+    def displayed(self, reaction):
+        """Count a new reaction, creating the summary of its attempt"""
+        if not reaction.attempt_uid:
+            reaction.attempt_uid = uuid4().hex
+
+        insert_ignore(
+            self._session,
+            self.klass.__table__,
+            user_uid=reaction.user_uid or reaction.user.uid,
+            match_uid=reaction.match_uid or reaction.match.uid,
+            attempt_uid=reaction.attempt_uid,
+            started_at=reaction.create_timestamp or t_now(),
+            displayed=0,
+            answered=0,
+            correct=0,
+            score=0,
+        )
+        self._increment(reaction.attempt_uid, displayed=1, score=reaction.score or 0)
+
+    def answered(self, reaction, was_correct):
+        """Add the answer to the counters of the attempt"""
+        self._increment(
+            reaction.attempt_uid,
+            answered=1,
+            correct=int(bool(was_correct)),
+            score=reaction.score or 0,
+        )
+
+    def score(self, attempt_uid, pending):
+        """
+        The score of the attempt with its `pending` answers, the
+        score of each by reaction uid. Those the write-behind
+        flush committed meanwhile are already in the summary: it
+        is read along with their reactions, by one statement
+        """
+        written = (
+            select(func.coalesce(func.sum(Reaction.score), 0))
+            .where(Reaction.uid.in_(pending), Reaction.update_timestamp.isnot(None))
+            .scalar_subquery()
+        )
+        row = self._session.execute(
+            select(self.klass.score, written).where(
+                self.klass.attempt_uid == attempt_uid
+            )
+        ).one_or_none()
+        if row is None:
+            return 0
+        score, already_written = row
+        return score + sum(s or 0 for s in pending.values()) - already_written
+
+    def add_answers(self, counters):
+        """Add the answers written behind to the counters of their attempts"""
+        for attempt_uid, amounts in counters.items():
+            self._increment(attempt_uid, **amounts)
+
+    def abandoned(self, since, before):
+        """
+        The unfinished attempts started between `since` and `before`
+        with no reaction left unanswered: those played with deferred
+        reactions, whose last question only the client knew of
+        """
+        unanswered = (
+            select(Reaction.uid)
+            .where(
+                Reaction.attempt_uid == self.klass.attempt_uid,
+                Reaction.update_timestamp.is_(None),
+            )
+            .exists()
+        )
+        return (
+            self._session.query(self.klass)
+            .filter(
+                self.klass.finished_at.is_(None),
+                self.klass.started_at >= since,
+                self.klass.started_at < before,
+                ~unanswered,
+            )
+            .all()
+        )
+
+    def advance(self, attempt_uid, step):
+        """
+        Play the progress-token step of the attempt, False if it
+        is not the next one: only one of the workers racing on the
+        same step updates the row
+        """
+        updated = (
+            self._session.query(self.klass)
+            .filter_by(attempt_uid=attempt_uid, steps=step)
+            .update({self.klass.steps: step + 1}, synchronize_session=False)
+        )
+        return updated == 1
+
+    def finish(self, attempt_uid, finished_at=None):
+        instance = self.get(attempt_uid)
+        if instance is None:
+            return
+
+        instance.finished_at = finished_at or t_now()
+        instance.duration = (
+            aware(instance.finished_at) - aware(instance.started_at)
+        ).total_seconds()
+        return instance
+
+    def aggregates(self, match_uid=None, attempt_uids=None):
+        """The summary of each attempt, computed from its reactions"""
+        questions = (
+            select(func.count(Question.uid))
+            .join(Game, Game.uid == Question.game_uid)
+            .where(Game.match_uid == Reaction.match_uid)
+            .scalar_subquery()
+        )
+        statement = (
+            select(
+                Reaction.user_uid,
+                Reaction.match_uid,
+                Reaction.attempt_uid,
+                func.min(Reaction.create_timestamp),
+                func.max(Reaction.update_timestamp),
+                func.count(Reaction.uid),
+                func.count(Reaction.answer_time),
+                func.sum(case((Answer.is_correct, 1), else_=0)),
+                func.coalesce(func.sum(Reaction.score), 0),
+                questions,
+            )
+            .outerjoin(Answer, Answer.uid == Reaction.answer_uid)
+            .group_by(Reaction.user_uid, Reaction.match_uid, Reaction.attempt_uid)
+        )
+        if match_uid is not None:
+            statement = statement.where(Reaction.match_uid == match_uid)
+        if attempt_uids is not None:
+            statement = statement.where(Reaction.attempt_uid.in_(attempt_uids))
+
+        for row in self._session.execute(statement):
+            user, match, attempt, started, last, displayed, *counters = row
+            answered, correct, score, questions_count = counters
+            # an attempt that displayed all the questions is over
+            finished = last if displayed >= questions_count else None
+            yield {
+                "user_uid": user,
+                "match_uid": match,
+                "attempt_uid": attempt,
+                "started_at": started,
+                "finished_at": finished,
+                "displayed": displayed,
+                "answered": answered,
+                "correct": correct,
+                "score": score,
+                "duration": (
+                    (aware(finished) - aware(started)).total_seconds()
+                    if finished
+                    else None
+                ),
+            }
+
+    def backfill(self, match_uid=None, batch_size=BULK_UPDATE_BATCH_SIZE):
+        """
+        Rebuild the summaries from the reactions, return how many
+
+        The summaries of each batch are created if missing and
+        locked before their reactions are read, so that the answers
+        recorded meanwhile are either among those reactions or
+        incremented on top of the rebuilt counters, never lost
+        """
+        statement = select(Reaction.attempt_uid).distinct()
+        if match_uid is not None:
+            statement = statement.where(Reaction.match_uid == match_uid)
+        attempt_uids = sorted(self._session.execute(statement).scalars())
+
+        for start in range(0, len(attempt_uids), batch_size):
+            batch = attempt_uids[start : start + batch_size]
+            existing = set(
+                self._session.execute(
+                    select(self.klass.attempt_uid).where(
+                        self.klass.attempt_uid.in_(batch)
+                    )
+                ).scalars()
+            )
+            for row in self.aggregates(match_uid, batch):
+                if row["attempt_uid"] not in existing:
+                    insert_ignore(
+                        self._session,
+                        self.klass.__table__,
+                        **dict(row, displayed=0, answered=0, correct=0, score=0),
+                    )
+
+            self._session.execute(
+                select(self.klass.uid)
+                .where(self.klass.attempt_uid.in_(batch))
+                .order_by(self.klass.attempt_uid)
+                .with_for_update()
+            )
+            update_from_values(
+                self._session,
+                self.klass.__table__,
+                BACKFILLED,
+                [
+                    tuple(row[name] for name in BACKFILLED)
+                    for row in self.aggregates(match_uid, batch)
+                ],
+            )
+            self._session.commit()
+        return len(attempt_uids)
@@ -0,0 +1,152 @@
+import csv
+import io
+import json
+import tempfile
+from datetime import datetime
+
+from sqlalchemy import Boolean, DateTime, Float, Integer, func, select
+from sqlalchemy.orm import Session
+
+from app.constants import EXPORT_CHUNK_SIZE
+from app.domain_entities import Answer, OpenAnswer, Question, Reaction, User
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+class ReactionExport:
+    """
+    The reactions of a match, with their question, answer and
+    the digest of the player, in a format for the analysts
+
+    Rows are fetched as plain tuples, `chunk_size` at a time,
+    through a server-side cursor where the database has one,
+    so that memory does not grow with the size of the match.
+    A plain SELECT takes no lock on the play tables
+    """
+
+    def __init__(self, match_uid, db_session: Session, chunk_size=EXPORT_CHUNK_SIZE):
+        self.match_uid = match_uid
+        self._session = db_session
+        self.chunk_size = chunk_size
+
+    def statement(self):
+        return (
+            select(
+                Reaction.uid.label("reaction_uid"),
+                Reaction.attempt_uid,
+                func.coalesce(User.email_digest, User.token_digest).label(
+                    "user_digest"
+                ),
+                Reaction.game_uid,
+                Reaction.question_uid,
+                Question.text.label("question_text"),
+                Question.time.label("question_time"),
+                Reaction.answer_uid,
+                Answer.text.label("answer_text"),
+                Answer.is_correct.label("answer_is_correct"),
+                Answer.level.label("answer_level"),
+                Reaction.open_answer_uid,
+                OpenAnswer.text.label("open_answer_text"),
+                Reaction.create_timestamp.label("displayed_at"),
+                Reaction.answer_time.label("answered_at"),
+                Reaction.score,
+            )
+            .join(User, User.uid == Reaction.user_uid)
+            .join(Question, Question.uid == Reaction.question_uid)
+            .outerjoin(Answer, Answer.uid == Reaction.answer_uid)
+            .outerjoin(OpenAnswer, OpenAnswer.uid == Reaction.open_answer_uid)
+            .where(Reaction.match_uid == self.match_uid)
+            .order_by(Reaction.uid)
+        )
+
+    @property
+    def columns(self):
+        return [c.name for c in self.statement().selected_columns]
+
+    def arrow_schema(self):
+        types = [
+            (Boolean, pyarrow.bool_()),
+            (Integer, pyarrow.int64()),
+            (Float, pyarrow.float64()),
+            (DateTime, pyarrow.timestamp("us", tz="UTC")),
+        ]
+        fields = []
+        for column in self.statement().selected_columns:
+            arrow_type = next(
+                (t for klass, t in types if isinstance(column.type, klass)),
+                pyarrow.string(),
+            )
+            fields.append((column.name, arrow_type))
+        return pyarrow.schema(fields)
+
+    def chunks(self):
+        """Lists of at most `chunk_size` rows"""
+        connection = self._session.connection().execution_options(stream_results=True)
+        result = connection.execute(self.statement())
+        try:
+            yield from result.partitions(self.chunk_size)
+        finally:
+            result.close()
+
+    def csv(self):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(self.columns)
+        for rows in self.chunks():
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+    def ndjson(self):
+        columns = self.columns
+        for rows in self.chunks():
+            yield "".join(
+                json.dumps(dict(zip(columns, map(json_value, row)))) + "\n"
+                for row in rows
+            )
+
+    def parquet(self):
+        """
+        Write the rows to a temporary Parquet file, one row group
+        per chunk, and stream it once complete: the footer of the
+        file is only known at the end
+        """
+        if pyarrow is None:
+            raise RuntimeError("The Parquet export needs pyarrow")
+
+        columns = self.columns
+        schema = self.arrow_schema()
+        with tempfile.TemporaryFile() as sink:
+            with pyarrow.parquet.ParquetWriter(sink, schema) as writer:
+                for rows in self.chunks():
+                    writer.write_table(
+                        pyarrow.Table.from_pylist(
+                            [dict(zip(columns, row)) for row in rows], schema=schema
+                        )
+                    )
+
+            sink.seek(0)
+            while True:
+                data = sink.read(io.DEFAULT_BUFFER_SIZE * 16)
+                if not data:
+                    break
+                yield data
+
+    def stream(self, fmt):
+        return {"csv": self.csv, "ndjson": self.ndjson, "parquet": self.parquet}[fmt]()
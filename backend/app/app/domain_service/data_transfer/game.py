@@ -19,6 +19,9 @@ class GameDTO:
     def get(self, **filters):
         return self._session.query(self.klass).filter_by(**filters).one_or_none()
 
+    def get_by_uid(self, uid):
+        return self._session.get(self.klass, uid)
+
     def refresh(self, instance):
         self._session.refresh(instance)
         return instance
@@ -3,6 +3,7 @@ from random import choices
 from typing import List
 from uuid import uuid1
 
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
 from app.constants import (
@@ -14,6 +15,7 @@ from app.constants import (
     PASSWORD_POPULATION,
 )
 from app.domain_entities.match import Match
+from app.domain_entities.question import Question
 from app.domain_service.data_transfer.game import GameDTO
 from app.domain_service.data_transfer.question import QuestionDTO
 from app.exceptions import NotUsableQuestionError
@@ -78,6 +80,9 @@ class MatchDTO:
     def get(self, **filters):
         return self._session.query(self.klass).filter_by(**filters).one_or_none()
 
+    def get_by_uid(self, uid):
+        return self._session.get(self.klass, uid)
+
     def active_with_code(self, code):
         return (
             self._session.query(self.klass)
@@ -130,7 +135,12 @@ class MatchDTO:
             self._session.commit()
 
     def import_template_questions(self, instance: Match, ids: List, game_uid=None):
-        """Import already existing questions"""
+        """
+        Import already existing questions, with their answers
+
+        The copies are appended after the questions of the game,
+        so that their positions never collide with the existing ones
+        """
         result = []
         if not ids:
             return result
@@ -139,18 +149,39 @@ class MatchDTO:
         new_game = self.game_dto.get(uid=game_uid) or self.game_dto.save(
             self.game_dto.new(match_uid=instance.uid, index=instance.games.count())
         )
+        last_position = new_game.questions.with_entities(
+            func.max(Question.position)
+        ).scalar()
+        position = -1 if last_position is None else last_position
         for question in questions:
             if question.game_uid:
                 raise NotUsableQuestionError(
                     f"Question with id {question.uid} is already in use"
                 )
 
+            position += 1
             new = self.question_dto.new(
                 game_uid=new_game.uid,
                 text=question.text,
-                position=question.position,
+                position=position,
+                time=question.time,
+                boolean=question.boolean,
+                content_url=question.content_url,
             )
             self._session.add(new)
+            self._session.flush()
+            for answer in question.answers:
+                self._session.add(
+                    self.question_dto.answer_dto.new(
+                        question_uid=new.uid,
+                        text=answer.text,
+                        position=answer.position,
+                        boolean=answer.boolean,
+                        content_url=answer.content_url,
+                        is_correct=answer.is_correct,
+                        level=answer.level,
+                    )
+                )
             result.append(new)
         self._session.commit()
         return result
@@ -0,0 +1,46 @@
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.domain_entities.play_event import ATTEMPT_FINISHED, PlayEvent
+
+
+class PlayEventDTO:
+    """
+    Events are only added to the session, so that they are
+    committed together with the write they describe
+    """
+
+    def __init__(self, session: Session, enabled=None):
+        self._session = session
+        self.klass = PlayEvent
+        self.enabled = settings.PLAY_EVENTS_LOG if enabled is None else enabled
+
+    def new(self, **kwargs):
+        return self.klass(**kwargs)
+
+    def add(self, kind, **kwargs):
+        if not self.enabled:
+            return
+
+        instance = self.new(kind=kind, **kwargs)
+        self._session.add(instance)
+        return instance
+
+    def attempt_finished(self, match_uid, user_uid, score, attempt_uid=None):
+        return self.add(
+            ATTEMPT_FINISHED,
+            match_uid=match_uid,
+            user_uid=user_uid,
+            attempt_uid=attempt_uid,
+            score=score,
+        )
+
+    def replay(self, match_uid, until=None, batch_size=1000):
+        """
+        Yield the events of the match in the order they were
+        logged, up to the `until` one if given
+        """
+        query = self._session.query(self.klass).filter_by(match_uid=match_uid)
+        if until is not None:
+            query = query.filter(self.klass.uid <= until)
+        return query.order_by(self.klass.uid).yield_per(batch_size)
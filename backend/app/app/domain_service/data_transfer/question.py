@@ -46,6 +46,9 @@ class QuestionDTO:
     def get(self, **filters):
         return self._session.query(self.klass).filter_by(**filters).one_or_none()
 
+    def get_by_uid(self, uid):
+        return self._session.get(self.klass, uid)
+
     def count(self):
         return self._session.query(self.klass).count()
 
@@ -0,0 +1,155 @@
+from collections import Counter, defaultdict
+from random import randrange
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.constants import QUESTION_STATS_SHARDS
+from app.core.sketch import ResponseTimeSketch
+from app.domain_entities.db.utils import increment_counters
+from app.domain_entities.question_counter import QuestionCounter
+
+PERCENTILES = (50, 90, 99)
+
+
+# the buckets of the response times of the questions
+TIMING = ResponseTimeSketch()
+
+
+class QuestionStatsDTO:
+    """
+    Each answer adds to a few counters of its question: the
+    attempts, the correct ones, the answer given and the bucket
+    of its response time. They are added with one upsert, to one
+    of QUESTION_STATS_SHARDS rows each, without reading them, so
+    that the answers to the same question seldom wait for each
+    other. The statistics add the counters up when read
+    """
+
+    def __init__(self, session: Session):
+        self._session = session
+        self.klass = QuestionCounter
+
+    def counters(
+        self, was_correct, answer_uid=None, open_answer_uid=None, response_time=None
+    ):
+        """The counters the answer adds to, by name"""
+        counters = Counter(attempts=1, correct=int(bool(was_correct)))
+        if answer_uid or open_answer_uid:
+            counters[f"answer:{answer_uid or 'open'}"] += 1
+        if response_time is not None:
+            counters[f"timing:{TIMING.key(response_time)}"] += 1
+        return counters
+
+    def add(self, counters_by_question):
+        """
+        Add the counters of each (question_uid, match_uid) pair,
+        all with one statement, in the same order every time
+        """
+        shard = randrange(QUESTION_STATS_SHARDS)
+        rows = [
+            {
+                "question_uid": question_uid,
+                "match_uid": match_uid,
+                "name": name,
+                "shard": shard,
+                "total": total,
+            }
+            for (question_uid, match_uid), counters in sorted(
+                counters_by_question.items(), key=lambda item: item[0][0]
+            )
+            for name, total in sorted(counters.items())
+            if total
+        ]
+        if rows:
+            increment_counters(
+                self._session,
+                self.klass.__table__,
+                ("question_uid", "name", "shard"),
+                rows,
+            )
+
+    def record(self, reaction, was_correct, response_time=None):
+        """Add the answer to the counters of the question"""
+        question_uid = reaction.question_uid or reaction.question.uid
+        self.add(
+            {
+                (question_uid, reaction.match_uid): self.counters(
+                    was_correct,
+                    reaction.answer_uid,
+                    reaction.open_answer_uid,
+                    response_time,
+                )
+            }
+        )
+
+    def totals(self, *criteria):
+        """The counters of the questions, their shards added up"""
+        rows = (
+            self._session.query(
+                self.klass.question_uid, self.klass.name, func.sum(self.klass.total)
+            )
+            .filter(*criteria)
+            .group_by(self.klass.question_uid, self.klass.name)
+        )
+        totals = defaultdict(Counter)
+        for question_uid, name, total in rows:
+            totals[question_uid][name] = total
+        return totals
+
+    def accuracy(self, match_uid):
+        """The attempts and correct answers of each question of the match"""
+        return {
+            question_uid: (counters["attempts"], counters["correct"])
+            for question_uid, counters in self.totals(
+                self.klass.match_uid == match_uid,
+                self.klass.name.in_(("attempts", "correct")),
+            ).items()
+        }
+
+    def _summary(self, attempts, correct, sketch):
+        return {
+            "attempts": attempts,
+            "correct": correct,
+            "correct_rate": correct / attempts if attempts else None,
+            "response_time": {f"p{p}": sketch.quantile(p / 100) for p in PERCENTILES},
+        }
+
+    def _named(self, counters, prefix):
+        return {
+            name[len(prefix) :]: total
+            for name, total in counters.items()
+            if name.startswith(prefix)
+        }
+
+    def _sketch(self, counters):
+        return ResponseTimeSketch(self._named(counters, "timing:"))
+
+    def _question_summary(self, question_uid, counters):
+        return dict(
+            self._summary(
+                counters["attempts"], counters["correct"], self._sketch(counters)
+            ),
+            question_uid=question_uid,
+            answers=self._named(counters, "answer:"),
+        )
+
+    def summary(self, question_uid):
+        totals = self.totals(self.klass.question_uid == question_uid)
+        return self._question_summary(question_uid, totals[question_uid])
+
+    def match_summary(self, match_uid):
+        """The statistics of each question and of the whole match"""
+        totals = self.totals(self.klass.match_uid == match_uid)
+        sketch = ResponseTimeSketch()
+        for counters in totals.values():
+            sketch.merge(self._sketch(counters))
+        return dict(
+            self._summary(
+                sum(c["attempts"] for c in totals.values()),
+                sum(c["correct"] for c in totals.values()),
+                sketch,
+            ),
+            match_uid=match_uid,
+            questions=[self._question_summary(q, totals[q]) for q in sorted(totals)],
+        )
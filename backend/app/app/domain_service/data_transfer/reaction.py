@@ -2,38 +2,133 @@ from datetime import datetime, timezone
 from uuid import uuid4
 
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
 
+from app.core.tracing import traced
 from app.domain_entities.reaction import Reaction
+from app.domain_service.data_transfer.attempt import AttemptDTO
+from app.domain_service.data_transfer.question_stats import QuestionStatsDTO
+from app.domain_service.data_transfer.write_behind import reaction_buffer
+from app.exceptions import ValidateError
+
+RECORDED_FIELDS = (
+    "create_timestamp",
+    "update_timestamp",
+    "answer_time",
+    "score",
+    "answer_uid",
+    "open_answer_uid",
+)
 
 
 class ReactionDTO:
-    def __init__(self, session: Session):
+    def __init__(self, session: Session, buffer=None):
         self._session = session
         self.klass = Reaction
+        self.buffer = buffer if buffer is not None else reaction_buffer()
+        self.stats = QuestionStatsDTO(session=session)
+        self.attempts = AttemptDTO(session=session)
 
     def new(self, **kwargs):
         return self.klass(**kwargs)
 
-    def save(self, instance):
+    def save(self, instance, counted=False):
+        """
+        `counted` tells that a new reaction is already counted in
+        the summary of its attempt, by record_answer(commit=False)
+        """
         if not instance.game_uid:
             instance.game_uid = instance.question.game.uid
 
         if not instance.attempt_uid:
             instance.attempt_uid = uuid4().hex
 
+        if not counted:
+            self.summarize(instance)
         self._session.add(instance)
         self._session.commit()
         return instance
 
-    def record_answer(self, instance, answer=None, open_answer=None) -> bool:
+    def summarize(self, instance):
+        """Count the reaction in its attempt, if it is new"""
+        if instance.uid is None:
+            self.attempts.displayed(instance)
+
+    def defer(self, instance, was_correct=False, response_time=None, answered=False):
+        """
+        Hand the answer recording over to the write-behind buffer,
+        which adds it to the statistics of the question and, if
+        `answered`, to the counters of the attempt too
+
+        The values stay on the instance but are marked as
+        committed, so that no later commit of the session writes
+        them on the request path, which commits nothing
+        """
+        values = {
+            "uid": instance.uid,
+            "attempt_uid": instance.attempt_uid,
+            "question_uid": instance.question_uid,
+            "match_uid": instance.match_uid,
+            "was_correct": bool(was_correct),
+            "response_time": response_time,
+            "answered": answered,
+        }
+        for key in RECORDED_FIELDS:
+            values[key] = getattr(instance, key)
+        if not self.buffer.append(values):
+            raise ValidateError("Duplicate Reactions")
+
+        for key in RECORDED_FIELDS:
+            set_committed_value(instance, key, values[key])
+        return instance
+
+    def observed(self, instance, key):
+        """The value of `key`, pending writes included"""
+        if self.is_pending(instance):
+            return self.buffer.get(instance.uid, key)
+        return getattr(instance, key)
+
+    def is_pending(self, instance):
+        return self.buffer is not None and self.buffer.is_pending(instance.uid)
+
+    def store(
+        self, instance, was_correct, response_time=None, commit=True, answered=False
+    ):
+        """
+        Add the answer to the statistics and save the reaction,
+        counted in its attempt if `answered`
+        """
+        if commit and self.buffer is not None:
+            return self.defer(instance, was_correct, response_time, answered)
+
+        if answered:
+            self.attempts.answered(instance, was_correct)
+        self.stats.record(instance, was_correct, response_time)
+        if commit:
+            return self.save(instance, counted=True)
+        self._session.add(instance)
+        return instance
+
+    @traced("record_answer")
+    def record_answer(
+        self, instance, answer=None, open_answer=None, answered_at=None, commit=True
+    ) -> bool:
         """Save the answer given by the user
 
         If question is expired discard the answer
         Store the answer for bot, open or timed
         questions.
+
+        `answered_at` is the server time the answer was received,
+        when it is not recorded immediately. With commit=False the
+        reaction is only added to the session, already counted in its
+        attempt, and is saved with counted=True. With the write-behind
+        buffer enabled, the recording is appended to it instead.
+        The statistics of the question and the summary of the
+        attempt are updated along
         """
         was_correct = False
-        response_datetime = datetime.now(tz=timezone.utc)
+        response_datetime = answered_at or datetime.now(tz=timezone.utc)
         assert not instance.update_timestamp
         if not instance.create_timestamp.tzinfo:
             instance.create_timestamp = instance.create_timestamp.replace(
@@ -47,9 +142,10 @@ class ReactionDTO:
             instance.question.time is not None
             and instance.question.time - response_time_in_secs < 0
         )
+        self.summarize(instance)
         instance.update_timestamp = response_datetime
         if question_expired:
-            self.save(instance)
+            self.store(instance, was_correct, commit=commit)
             return was_correct
 
         if answer:
@@ -65,7 +161,9 @@ class ReactionDTO:
             else:
                 instance.answer_uid = answer.uid
                 was_correct = answer.is_correct
-            self.save(instance)
+            self.store(
+                instance, was_correct, response_time_in_secs, commit, answered=True
+            )
 
         return was_correct
 
@@ -1,11 +1,20 @@
 import os
+from datetime import datetime
+from functools import lru_cache
 from hashlib import blake2b
 from uuid import uuid4
 
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
-from app.constants import DIGEST_SIZE
-from app.domain_entities.reaction import Reaction
+from app.constants import (
+    DIGEST_SIZE,
+    PLAYERS_PAGE_SIZE,
+    REAP_BATCH_SIZE,
+    UNSIGNED_EMAIL,
+)
+from app.domain_entities.attempt import Attempt
 from app.domain_entities.user import User
 
 
@@ -32,6 +41,9 @@ class UserDTO:
     def get(self, **filters):
         return self._session.query(self.klass).filter_by(**filters).one_or_none()
 
+    def get_by_uid(self, uid):
+        return self._session.get(self.klass, uid)
+
     def all(self):
         return self._session.query(self.klass).all()
 
@@ -42,12 +54,53 @@ class UserDTO:
             .all()
         )
 
-    def unsigned(self):
-        return (
-            self._session.query(self.klass)
-            .filter(self.klass.email_digest.is_(None))
-            .all()
+    def unsigned(self, after_uid: int = None, limit: int = PLAYERS_PAGE_SIZE):
+        """
+        Return a page of unsigned users
+
+        Pagination is keyset based: the uid of the last user
+        of the previous page is used as starting point
+        """
+        query = self._session.query(self.klass).filter(
+            self.klass.email_digest.is_(None)
         )
+        if after_uid:
+            query = query.filter(self.klass.uid > after_uid)
+        return query.order_by(self.klass.uid).limit(limit).all()
+
+    def reap_unsigned(self, before: datetime, batch_size: int = REAP_BATCH_SIZE):
+        """
+        Delete the unsigned users created before `before`
+        that never completed a match (thus without rankings)
+
+        Only the anonymous players are unsigned this way: the users
+        with a password, admins included, have no digest either
+
+        Rows are deleted in batches to keep each transaction
+        short. Their reactions are removed by the FK cascade
+        """
+        deleted = 0
+        while True:
+            uids = [
+                uid
+                for (uid,) in self._session.query(self.klass.uid)
+                .filter(
+                    self.klass.email_digest.is_(None),
+                    self.klass.email.like(UNSIGNED_EMAIL.format("%")),
+                    self.klass.is_admin.isnot(True),
+                    self.klass.create_timestamp < before,
+                    ~self.klass.user_rankings.any(),
+                )
+                .limit(batch_size)
+            ]
+            if not uids:
+                return deleted
+
+            self._session.query(self.klass).filter(self.klass.uid.in_(uids)).delete(
+                synchronize_session=False
+            )
+            self._session.commit()
+            deleted += len(uids)
 
     def fetch(self, **kwargs):
         """
@@ -70,24 +123,70 @@ class UserDTO:
             db_session=self._session,
         ).fetch()
 
-    def players_of_match(self, match_uid):
+    def players_of_match(
+        self, match_uid, after_uid: int = None, limit: int = PLAYERS_PAGE_SIZE
+    ):
+        """
+        Return a page of the users who played the match, each once
+
+        The uids are read from the attempt summaries, through their
+        (match_uid, user_uid) index. Pagination is keyset based, as
+        for the unsigned users
+        """
+        page = self._session.query(Attempt.user_uid).filter(
+            Attempt.match_uid == match_uid
+        )
+        if after_uid:
+            page = page.filter(Attempt.user_uid > after_uid)
+        page = (
+            page.group_by(Attempt.user_uid)
+            .order_by(Attempt.user_uid)
+            .limit(limit)
+            .subquery()
+        )
         return (
-            self._session.query(User)
-            .join(Reaction, Reaction.user_uid == User.uid)
-            .filter(Reaction.match_uid == match_uid)
+            self._session.query(self.klass)
+            .join(page, page.c.user_uid == self.klass.uid)
+            .order_by(self.klass.uid)
             .all()
         )
 
+    def match_stats(self, match_uid, user_uids):
+        """The best score, attempts and last play of each user in the match"""
+        rows = (
+            self._session.query(
+                Attempt.user_uid,
+                func.max(Attempt.score),
+                func.count(Attempt.uid),
+                func.max(func.coalesce(Attempt.finished_at, Attempt.started_at)),
+            )
+            .filter(Attempt.match_uid == match_uid, Attempt.user_uid.in_(user_uids))
+            .group_by(Attempt.user_uid)
+        )
+        return {
+            user_uid: {"best_score": best, "attempts": count, "last_played": last}
+            for user_uid, best, count, last in rows
+        }
+
+
+@lru_cache(maxsize=None)
+def keyed_hasher(key: str):
+    """Return the initialised blake2b state for this key"""
+    return blake2b(key=key.encode("utf-8"), digest_size=DIGEST_SIZE)
+
+
+def keyed_digest(key: str, word: str) -> str:
+    h = keyed_hasher(key).copy()
+    h.update(word.encode("utf-8"))
+    return h.hexdigest()
+
 
 class WordDigest:
     def __init__(self, word):
         self.word = word
 
     def value(self):
-        key = os.getenv("SIGNED_KEY").encode("utf-8")
-        h = blake2b(key=key, digest_size=DIGEST_SIZE)
-        h.update(self.word.encode("utf-8"))
-        return h.hexdigest()
+        return keyed_digest(os.getenv("SIGNED_KEY"), self.word)
 
 
 class UserFactory:
@@ -105,13 +204,11 @@ class UserFactory:
         return self.user_dto.get(email_digest=email_digest, token_digest=token_digest)
 
     def internal_user(self):
-        email_digest = WordDigest(self.email).value()
-
         _internal_user = self.user_dto.get(email=self.email)
         return _internal_user or self.user_dto.save(
             self.user_dto.new(
                 email=self.email,
-                email_digest=email_digest,
+                email_digest=WordDigest(self.email).value(),
                 password=self.password,
                 db_session=self._session,
             )
@@ -119,16 +216,31 @@ class UserFactory:
 
     def unsigned_user(self):
         email_digest = uuid4().hex
-        email = f"uns-{email_digest}@progame.io"
+        email = UNSIGNED_EMAIL.format(email_digest)
         new_user = self.user_dto.new(email=email)
         return self.user_dto.save(new_user)
 
     def signed_user(self, email_digest, token_digest):
+        """
+        Create the signed user
+
+        When a concurrent request already created it, the unique
+        index on the digests rejects the insert and the existing
+        row is returned instead. The insert runs in a SAVEPOINT, so
+        that the pending work of the caller survives the rejection
+        """
         user = self.user_dto.new()
         user.email = f"{email_digest}@progame.io"
         user.email_digest = email_digest
         user.token_digest = token_digest
-        return self.user_dto.save(user)
+        try:
+            with self._session.begin_nested():
+                self._session.add(user)
+        except IntegrityError:
+            return self.existing_user(email_digest, token_digest)
+
+        self._session.commit()
+        return user
 
     def fetch(self):
         if self.email:
@@ -140,7 +252,5 @@ class UserFactory:
         word = self.original_email or uuid4().hex
         email_digest = WordDigest(word).value()
         token_digest = WordDigest(self.token).value()
-        if self.existing_user(email_digest, token_digest):
-            return self.existing_user(email_digest, token_digest)
-
-        return self.signed_user(email_digest, token_digest)
+        user = self.existing_user(email_digest, token_digest)
+        return user or self.signed_user(email_digest, token_digest)
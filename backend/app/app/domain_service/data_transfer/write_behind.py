@@ -0,0 +1,387 @@
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime
+from uuid import uuid4
+
+from redis.exceptions import RedisError
+from sqlalchemy.exc import OperationalError
+
+from app.constants import (
+    WRITE_BEHIND_BATCH_SIZE,
+    WRITE_BEHIND_FLUSH_INTERVAL,
+    WRITE_BEHIND_MAX_RETRIES,
+    WRITE_BEHIND_PENDING_TTL,
+)
+from app.core.config import settings
+from app.domain_entities.reaction import Reaction
+from app.domain_service.data_transfer.attempt import AttemptDTO
+from app.domain_service.data_transfer.question_stats import QuestionStatsDTO
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMPS = ("create_timestamp", "update_timestamp", "answer_time")
+# the files next to the logs
+NOT_LOGS = (".lock", ".tmp", ".dead")
+
+
+def dumps(values):
+    return json.dumps(
+        {
+            key: value.isoformat() if isinstance(value, datetime) else value
+            for key, value in values.items()
+        }
+    )
+
+
+def loads(line):
+    values = json.loads(line)
+    for key in TIMESTAMPS:
+        if values.get(key):
+            values[key] = datetime.fromisoformat(values[key])
+    return values
+
+
+class PendingAnswers:
+    """
+    The answers waiting in the buffers of all the workers: one
+    Redis hash per attempt, from the question to the reaction
+    and score of its answer. The field is set with HSETNX, so
+    that of two workers taking the same answer only the first
+    records it, and deleted once its batch is committed.
+
+    While Redis is unavailable every buffer only sees its own
+    answers, as when there is no shared store
+    """
+
+    def __init__(self, client, prefix="write-behind", ttl=WRITE_BEHIND_PENDING_TTL):
+        self._client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def _key(self, attempt_uid):
+        return f"{self.prefix}:{attempt_uid}"
+
+    def claim(self, values):
+        """Share the answer, False if another worker took it first"""
+        key = self._key(values["attempt_uid"])
+        pipeline = self._client.pipeline()
+        pipeline.hsetnx(
+            key, values["question_uid"], json.dumps([values["uid"], values["score"]])
+        )
+        pipeline.expire(key, self.ttl)
+        try:
+            claimed, _ = pipeline.execute()
+        except RedisError as exc:
+            logger.warning(
+                f"Answer of attempt {values['attempt_uid']} not shared: {exc}"
+            )
+            return True
+        return bool(claimed)
+
+    def answered(self, attempt_uid, question_uid):
+        try:
+            return bool(self._client.hexists(self._key(attempt_uid), question_uid))
+        except RedisError:
+            return False
+
+    def scores(self, attempt_uid):
+        """The score of each pending reaction of the attempt, by uid"""
+        try:
+            fields = self._client.hgetall(self._key(attempt_uid))
+        except RedisError:
+            return {}
+        return dict(json.loads(value) for value in fields.values())
+
+    def release(self, rows):
+        """Forget the written answers, left to expire if Redis is down"""
+        pipeline = self._client.pipeline(transaction=False)
+        for row in rows:
+            pipeline.hdel(self._key(row["attempt_uid"]), row["question_uid"])
+        try:
+            pipeline.execute()
+        except RedisError as exc:
+            logger.warning(f"{len(rows)} written answers not released: {exc}")
+
+
+class ReactionWriteBuffer:
+    """
+    Answer recordings waiting to be written to the reactions table
+
+    Each recording is appended to a local log before being
+    acknowledged, and kept in memory so that the read paths
+    can see it. The flusher writes them in batches, every
+    `interval` seconds or as soon as `batch_size` are pending,
+    along with the statistics of their questions and the
+    counters of their attempts, so that nothing is committed
+    on the request path. With a `shared` store of the pending
+    answers, those of the other workers are seen as well.
+
+    Every buffer has its own log, `<path>.<pid>-<token>`, held
+    with a lock for as long as the process lives. A new buffer
+    adopts the logs whose lock is free, those left by a crashed
+    process. A batch that fails `max_retries` times in a row is
+    written one recording at a time, and the recordings that
+    still fail are moved to `<path>.dead`
+    """
+
+    def __init__(
+        self,
+        path,
+        interval=WRITE_BEHIND_FLUSH_INTERVAL,
+        batch_size=WRITE_BEHIND_BATCH_SIZE,
+        max_retries=WRITE_BEHIND_MAX_RETRIES,
+        shared=None,
+    ):
+        self.base_path = path
+        self.path = f"{path}.{os.getpid()}-{uuid4().hex[:8]}"
+        self.dead_path = f"{path}.dead"
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._full = threading.Event()
+        self._pending = {}
+        self._answered = set()
+        self._failures = 0
+        self._thread = None
+        self._owner = self._lock_log(self.path)
+        self.recover()
+
+    def _track(self, values):
+        self._pending[values["uid"]] = values
+        self._answered.add((values["attempt_uid"], values["question_uid"]))
+
+    def _untrack(self, rows):
+        for row in rows:
+            if self._pending.get(row["uid"]) is row:
+                del self._pending[row["uid"]]
+                self._answered.discard((row["attempt_uid"], row["question_uid"]))
+
+    @staticmethod
+    def _lock_log(path):
+        """The open lock file of the log, None if another process holds it"""
+        lock = open(f"{path}.lock", "a")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return
+        return lock
+
+    def orphans(self):
+        """The logs of the other buffers, the legacy shared one included"""
+        names = glob.glob(f"{glob.escape(self.base_path)}.*")
+        return [self.base_path] + [
+            name
+            for name in sorted(names)
+            if name != self.path and not name.endswith(NOT_LOGS)
+        ]
+
+    def recover(self):
+        """Move the recordings of the orphan logs to the own log"""
+        for path in self.orphans():
+            lock = self._lock_log(path)
+            if lock is None:
+                continue
+
+            try:
+                if os.path.exists(path):
+                    with open(path) as log:
+                        rows = [loads(line) for line in log if line.strip()]
+                    with self._lock:
+                        self._write(rows)
+                    os.remove(path)
+                os.remove(lock.name)
+            finally:
+                lock.close()
+
+    def _write(self, rows):
+        with open(self.path, "a") as log:
+            for values in rows:
+                log.write(dumps(values) + "\n")
+            log.flush()
+            os.fsync(log.fileno())
+        for values in rows:
+            self._track(values)
+
+    def append(self, values):
+        """Log the recording, False if its answer is pending already"""
+        if self.shared is not None and not self.shared.claim(values):
+            return False
+
+        with self._lock:
+            if (values["attempt_uid"], values["question_uid"]) in self._answered:
+                return False
+            self._write([values])
+            if len(self._pending) >= self.batch_size:
+                self._full.set()
+        return True
+
+    def get(self, uid, key, default=None):
+        values = self._pending.get(uid)
+        return values[key] if values else default
+
+    def is_pending(self, uid):
+        return uid in self._pending
+
+    def answered(self, attempt_uid, question_uid):
+        if (attempt_uid, question_uid) in self._answered:
+            return True
+        return self.shared is not None and self.shared.answered(
+            attempt_uid, question_uid
+        )
+
+    def scores(self, attempt_uid):
+        """The score of each pending reaction of the attempt, by uid"""
+        scores = self.shared.scores(attempt_uid) if self.shared is not None else {}
+        with self._lock:
+            for values in self._pending.values():
+                if values["attempt_uid"] == attempt_uid:
+                    scores[values["uid"]] = values.get("score")
+        return scores
+
+    def _rewrite_log(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as log:
+            for values in self._pending.values():
+                log.write(dumps(values) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def write(self, db_session, batch):
+        """
+        Update the reactions with one multi-row update and add the
+        answers to the statistics of their questions and to the
+        counters of their attempts, one commit
+        """
+        columns = set(Reaction.__table__.columns.keys())
+        db_session.bulk_update_mappings(
+            Reaction, [{k: v for k, v in row.items() if k in columns} for row in batch]
+        )
+        stats = QuestionStatsDTO(session=db_session)
+        counters = defaultdict(Counter)
+        for row in batch:
+            # logged before the statistics were written with the batch
+            if "was_correct" not in row:
+                continue
+            counters[(row["question_uid"], row.get("match_uid"))] += stats.counters(
+                row["was_correct"],
+                row.get("answer_uid"),
+                row.get("open_answer_uid"),
+                row.get("response_time"),
+            )
+        stats.add(counters)
+        attempts = defaultdict(Counter)
+        for row in batch:
+            # logged before the attempts were counted with the batch
+            if not row.get("answered"):
+                continue
+            attempts[row["attempt_uid"]] += Counter(
+                answered=1, correct=int(row["was_correct"]), score=row["score"] or 0
+            )
+        AttemptDTO(session=db_session).add_answers(attempts)
+        db_session.commit()
+
+    def _done(self, rows):
+        with self._lock:
+            self._untrack(rows)
+            self._rewrite_log()
+        if self.shared is not None:
+            self.shared.release(rows)
+
+    def dead_letter(self, db_session, batch):
+        """
+        Write the recordings one by one and move those that fail
+        to the dead letters, return how many were written. It
+        stops at the first error of the database itself
+        """
+        done, dead = [], []
+        try:
+            for row in batch:
+                try:
+                    self.write(db_session, [row])
+                except OperationalError:
+                    raise
+                except Exception:
+                    db_session.rollback()
+                    dead.append(row)
+                done.append(row)
+        finally:
+            if dead:
+                logger.error("%d write-behind recordings dead-lettered", len(dead))
+                with open(self.dead_path, "a") as log:
+                    for values in dead:
+                        log.write(dumps(values) + "\n")
+            self._done(done)
+        return len(done) - len(dead)
+
+    def flush(self, db_session):
+        """Write the pending recordings, return how many were written"""
+        with self._lock:
+            batch = list(self._pending.values())
+        if not batch:
+            return 0
+
+        try:
+            self.write(db_session, batch)
+        except Exception:
+            db_session.rollback()
+            self._failures += 1
+            if self._failures < self.max_retries:
+                raise
+            self._failures = 0
+            return self.dead_letter(db_session, batch)
+
+        self._failures = 0
+        self._done(batch)
+        return len(batch)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def close(self):
+        """Give up the log, for another buffer to adopt"""
+        if self._owner is not None:
+            self._owner.close()
+            self._owner = None
+
+    def _run(self):
+        from app.domain_entities.db.session import session_factory
+
+        while True:
+            self._full.wait(self.interval)
+            self._full.clear()
+            _session = session_factory()
+            try:
+                self.flush(_session)
+            except Exception:
+                logger.exception("Write-behind flush failed, retrying")
+                _session.rollback()
+            finally:
+                _session.close()
+
+
+_buffer = None
+
+
+def reaction_buffer():
+    """Return the write-behind buffer, when enabled by the settings"""
+    global _buffer
+    if _buffer is None and settings.REACTIONS_WRITE_BEHIND:
+        shared = None
+        if settings.REACTIONS_WRITE_BEHIND_REDIS:
+            from app.domain_service.play.cache import ClientFactory
+
+            shared = PendingAnswers(ClientFactory().new_client())
+        _buffer = ReactionWriteBuffer(
+            settings.REACTIONS_WRITE_BEHIND_LOG, shared=shared
+        )
+        _buffer.start()
+    return _buffer
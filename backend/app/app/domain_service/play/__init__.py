@@ -1,8 +1,19 @@
+from .adaptive import DifficultyIndex, difficulty_indexes  # noqa: F401
+from .analytics import MatchAnalytics, match_analytics  # noqa: F401
 from .cache import ClientFactory  # noqa: F401
+from .counters import LocalCounters, live_counters  # noqa: F401
+from .leaderboard import RankingFeed, RankingFeeds, ranking_feeds  # noqa: F401
+from .live import LiveHost, LiveRegistry, LiveRoom  # noqa: F401
+from .projection import PlayEventProjector  # noqa: F401
+from .relay import LocalRelay, RedisRelay  # noqa: F401
+from .rescoring import MatchRescorer  # noqa: F401
+from .sampling import TemplatePool, template_pool  # noqa: F401
 from .single_player import (  # noqa: F401
     GameFactory,
     PlayerStatus,
     PlayScore,
     QuestionFactory,
     SinglePlayer,
+    close_abandoned_attempts,
 )
+from .tokens import DisplayToken, LiveToken, ProgressToken  # noqa: F401
@@ -0,0 +1,157 @@
+import logging
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+from random import Random
+from time import monotonic
+
+from app.constants import DIFFICULTY_BUCKETS, DIFFICULTY_INDEX_TTL
+from app.domain_entities import Game, Question
+from app.domain_service.data_transfer.question_stats import QuestionStatsDTO
+
+logger = logging.getLogger(__name__)
+
+
+def correctness(answered, correct):
+    """The rate of correct answers, 0.5 when nothing is known yet"""
+    return (correct + 1) / (answered + 2)
+
+
+class DifficultyIndex:
+    """
+    The questions of one match, sorted by the historical rate of
+    correct answers within each game, so that the bucket of a
+    given difficulty is found with two bisections.
+
+    The rates are updated as the answers arrive. The better the
+    attempt is doing, the lower the rate of the bucket to draw from
+    """
+
+    def __init__(self, match_uid, counts, buckets=DIFFICULTY_BUCKETS):
+        self.match_uid = match_uid
+        self.buckets = buckets
+        self.loaded_at = monotonic()
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._rates = defaultdict(list)
+        for question_uid, game_uid, answered, correct in counts:
+            self._counts[question_uid] = [game_uid, answered, correct]
+            insort(
+                self._rates[game_uid], (correctness(answered, correct), question_uid)
+            )
+
+    def rate(self, question_uid):
+        _, answered, correct = self._counts[question_uid]
+        return correctness(answered, correct)
+
+    def record(self, question_uid, was_correct):
+        with self._lock:
+            if question_uid not in self._counts:
+                return
+
+            game_uid, answered, correct = self._counts[question_uid]
+            rates = self._rates[game_uid]
+            del rates[
+                bisect_left(rates, (correctness(answered, correct), question_uid))
+            ]
+            answered, correct = answered + 1, correct + bool(was_correct)
+            self._counts[question_uid] = [game_uid, answered, correct]
+            insort(rates, (correctness(answered, correct), question_uid))
+
+    def _bucket(self, rates, bucket):
+        low = bisect_left(rates, (bucket / self.buckets,))
+        high = bisect_left(rates, ((bucket + 1) / self.buckets,))
+        if bucket == self.buckets - 1:
+            high = len(rates)
+        return rates[low:high]
+
+    def pick(self, attempt_uid, game_uid, displayed_ids, accuracy=correctness(0, 0)):
+        """
+        The uid of the next question of the game, None once they
+        were all displayed. The bucket matching the `accuracy` of
+        the attempt comes first, then the closest ones, the
+        easier first when two are as close
+        """
+        target = 1 - accuracy
+        first = min(int(target * self.buckets), self.buckets - 1)
+        order = sorted(range(self.buckets), key=lambda b: (abs(b - first), -b))
+        displayed = set(displayed_ids)
+        rng = Random(f"{attempt_uid}:{game_uid}:{len(displayed)}")
+        with self._lock:
+            rates = self._rates.get(game_uid, [])
+            for bucket in order:
+                candidates = [
+                    uid
+                    for _, uid in self._bucket(rates, bucket)
+                    if uid not in displayed
+                ]
+                if candidates:
+                    return rng.choice(candidates)
+
+
+class DifficultyIndexes:
+    """
+    The difficulty indexes of the adaptive matches being played
+
+    An index is loaded from the counters of the question
+    statistics the first time its match is played. Once older
+    than `ttl` seconds it keeps being served while a background
+    thread loads the new one, the edits of the match included
+    """
+
+    def __init__(self, ttl=DIFFICULTY_INDEX_TTL):
+        self.ttl = ttl
+        self._indexes = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def load(self, match_uid, db_session):
+        questions = (
+            db_session.query(Question.uid, Question.game_uid)
+            .join(Game, Game.uid == Question.game_uid)
+            .filter(Game.match_uid == match_uid)
+        )
+        accuracy = QuestionStatsDTO(session=db_session).accuracy(match_uid)
+        return DifficultyIndex(
+            match_uid,
+            [
+                (uid, game_uid, *accuracy.get(uid, (0, 0)))
+                for uid, game_uid in questions
+            ],
+        )
+
+    def refresh(self, match_uid, db_session):
+        index = self.load(match_uid, db_session)
+        with self._lock:
+            self._indexes[match_uid] = index
+            self._refreshing.discard(match_uid)
+        return index
+
+    def _refresh_later(self, match_uid):
+        from app.domain_entities.db.session import session_factory
+
+        _session = session_factory()
+        try:
+            self.refresh(match_uid, _session)
+        except Exception:
+            logger.exception("Difficulty index of match %s not refreshed", match_uid)
+            with self._lock:
+                self._refreshing.discard(match_uid)
+        finally:
+            _session.close()
+
+    def index(self, match, db_session):
+        with self._lock:
+            index = self._indexes.get(match.uid)
+            stale = index is not None and monotonic() - index.loaded_at > self.ttl
+            if stale and match.uid not in self._refreshing:
+                self._refreshing.add(match.uid)
+                threading.Thread(
+                    target=self._refresh_later, args=(match.uid,), daemon=True
+                ).start()
+        if index is None:
+            index = self.refresh(match.uid, db_session)
+        return index
+
+
+difficulty_indexes = DifficultyIndexes()
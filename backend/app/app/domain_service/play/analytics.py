@@ -0,0 +1,282 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+
+import numpy as np
+from sqlalchemy import or_
+
+from app.constants import (
+    ANALYTICS_FETCH_SIZE,
+    ANALYTICS_MEMORY_LIMIT,
+    ANALYTICS_REFRESH_MARGIN,
+    SCORE_DISTRIBUTION_BINS,
+)
+from app.domain_entities import Reaction
+from app.domain_service.play.tokens import match_version
+
+FIELDS = {
+    "uid": np.int64,
+    "game": np.int64,
+    "question": np.int64,
+    "attempt": np.int64,
+    "displayed": np.float64,
+    "answered": np.float64,
+    "score": np.float64,
+}
+
+
+def as_float(values):
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+
+class MatchFacts:
+    """
+    The reactions of one match as columns, sorted by uid
+
+    The first refresh loads them all, the next ones only the
+    reactions inserted or answered since then. The attempts
+    are coded as consecutive integers. The dashboard is kept
+    until the facts or the match change
+    """
+
+    def __init__(self, match_uid):
+        self.match_uid = match_uid
+        self.size = 0
+        self.version = 0
+        self.lock = threading.Lock()
+        self._columns = {name: np.empty(0, dtype) for name, dtype in FIELDS.items()}
+        self._attempts = {}
+        self._watermark = None
+        self._dashboard = (None, None)
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self._columns.values())
+
+    @property
+    def attempts(self):
+        return len(self._attempts)
+
+    def column(self, name):
+        return self._columns[name][: self.size]
+
+    def _reserve(self, extra):
+        capacity = len(self._columns["uid"])
+        if self.size + extra <= capacity:
+            return
+
+        capacity = max(self.size + extra, 2 * capacity)
+        for name, column in self._columns.items():
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[: self.size] = column[: self.size]
+            self._columns[name] = grown
+
+    def _code(self, attempt_uid):
+        return self._attempts.setdefault(attempt_uid, len(self._attempts))
+
+    def _query(self, db_session):
+        query = db_session.query(
+            Reaction.uid,
+            Reaction.game_uid,
+            Reaction.question_uid,
+            Reaction.attempt_uid,
+            Reaction.create_timestamp,
+            Reaction.answer_time,
+            Reaction.score,
+            Reaction.update_timestamp,
+        ).filter(Reaction.match_uid == self.match_uid)
+        if self.size:
+            # answers committed late by another worker are caught
+            # within the margin, the upsert makes them harmless
+            since = self._watermark - timedelta(seconds=ANALYTICS_REFRESH_MARGIN)
+            query = query.filter(
+                or_(
+                    Reaction.uid > int(self.column("uid")[-1]),
+                    Reaction.update_timestamp >= since,
+                )
+            )
+        return query.order_by(Reaction.uid).yield_per(ANALYTICS_FETCH_SIZE)
+
+    def refresh(self, db_session):
+        """Merge the new reactions in, return whether anything changed"""
+        rows = iter(self._query(db_session))
+        changed = False
+        while True:
+            chunk = list(islice(rows, ANALYTICS_FETCH_SIZE))
+            if not chunk:
+                break
+            changed = self._merge(chunk) or changed
+
+        if changed:
+            self.version += 1
+        return changed
+
+    def _merge(self, rows):
+        """Update the known reactions and append the others"""
+        uid, game, question, attempt, displayed, answered, score, updated = zip(*rows)
+        uids = np.array(uid, dtype=np.int64)
+        answered = as_float([a.timestamp() if a else None for a in answered])
+        score = as_float(score)
+
+        known = self.column("uid")
+        positions = np.searchsorted(known, uids)
+        existing = positions < self.size
+        existing[existing] = known[positions[existing]] == uids[existing]
+        changed = False
+        for name, column in (("answered", answered), ("score", score)):
+            before = self._columns[name][positions[existing]]
+            after = column[existing]
+            if not np.array_equal(before, after, equal_nan=True):
+                self._columns[name][positions[existing]] = after
+                changed = True
+
+        new = ~existing
+        count = int(new.sum())
+        self._reserve(count)
+        start, end = self.size, self.size + count
+        values = {
+            "uid": uids[new],
+            "game": np.array(game, dtype=np.int64)[new],
+            "question": np.array(question, dtype=np.int64)[new],
+            "attempt": np.array([self._code(a) for a in attempt], dtype=np.int64)[new],
+            "displayed": np.array([d.timestamp() for d in displayed])[new],
+            "answered": answered[new],
+            "score": score[new],
+        }
+        for name, column in values.items():
+            self._columns[name][start:end] = column
+        self.size = end
+        if count and start and values["uid"][0] < known[-1]:
+            order = np.argsort(self.column("uid"), kind="stable")
+            for name in FIELDS:
+                self._columns[name][: self.size] = self.column(name)[order]
+
+        stamps = [u for u in updated if u is not None] or [displayed[0]]
+        self._watermark = max(stamps + ([self._watermark] if self._watermark else []))
+        return changed or count > 0
+
+    def score_distribution(self, bins):
+        if not self.size:
+            return []
+
+        totals = np.bincount(
+            self.column("attempt"),
+            weights=np.nan_to_num(self.column("score")),
+            minlength=self.attempts,
+        )
+        counts, edges = np.histogram(totals, bins=bins)
+        return [
+            {"low": low, "high": high, "attempts": count}
+            for low, high, count in zip(
+                edges[:-1].tolist(), edges[1:].tolist(), counts.tolist()
+            )
+        ]
+
+    def drop_off(self):
+        """How many attempts saw and answered each question"""
+        if not self.size:
+            return []
+
+        questions, inverse = np.unique(self.column("question"), return_inverse=True)
+        displayed = np.bincount(inverse)
+        answered = np.bincount(
+            inverse, weights=~np.isnan(self.column("answered")) * 1.0
+        )
+        return [
+            {"question_uid": uid, "displayed": shown, "answered": int(done)}
+            for uid, shown, done in zip(
+                questions.tolist(), displayed.tolist(), answered.tolist()
+            )
+        ]
+
+    def funnel(self):
+        """How many attempts reached the n-th question"""
+        per_attempt = np.bincount(self.column("attempt"), minlength=self.attempts)
+        reached = np.bincount(per_attempt)[1:]
+        return reached[::-1].cumsum()[::-1].tolist()
+
+    def time_per_game(self):
+        answered = self.column("answered")
+        mask = ~np.isnan(answered)
+        if not mask.any():
+            return []
+
+        games, inverse = np.unique(self.column("game")[mask], return_inverse=True)
+        seconds = answered[mask] - self.column("displayed")[mask]
+        totals = np.bincount(inverse, weights=seconds)
+        counts = np.bincount(inverse)
+        return [
+            {"game_uid": uid, "average_seconds": total / count}
+            for uid, total, count in zip(
+                games.tolist(), totals.tolist(), counts.tolist()
+            )
+        ]
+
+    def attempts_per_hour(self):
+        if not self.size:
+            return []
+
+        first = np.full(self.attempts, np.inf)
+        np.minimum.at(first, self.column("attempt"), self.column("displayed"))
+        hours, counts = np.unique(np.floor(first / 3600) * 3600, return_counts=True)
+        return [
+            {"hour": datetime.fromtimestamp(hour, tz=timezone.utc), "attempts": count}
+            for hour, count in zip(hours.tolist(), counts.tolist())
+        ]
+
+    def dashboard(self, version, bins=SCORE_DISTRIBUTION_BINS):
+        key = (self.version, version, bins)
+        cached_key, result = self._dashboard
+        if cached_key == key:
+            return result
+
+        result = {
+            "match_uid": self.match_uid,
+            "reactions": self.size,
+            "attempts": self.attempts,
+            "score_distribution": self.score_distribution(bins),
+            "drop_off": self.drop_off(),
+            "funnel": self.funnel(),
+            "time_per_game": self.time_per_game(),
+            "attempts_per_hour": self.attempts_per_hour(),
+        }
+        self._dashboard = (key, result)
+        return result
+
+
+class MatchAnalytics:
+    """
+    The facts of the matches looked at, the least recently used
+    dropped once together they take more than `max_bytes`
+    """
+
+    def __init__(self, max_bytes=ANALYTICS_MEMORY_LIMIT):
+        self.max_bytes = max_bytes
+        self._facts = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        return sum(facts.nbytes for facts in self._facts.values())
+
+    def facts(self, match_uid, db_session):
+        with self._lock:
+            facts = self._facts.setdefault(match_uid, MatchFacts(match_uid))
+            self._facts.move_to_end(match_uid)
+
+        with facts.lock:
+            facts.refresh(db_session)
+
+        with self._lock:
+            while len(self._facts) > 1 and self.nbytes > self.max_bytes:
+                self._facts.popitem(last=False)
+        return facts
+
+    def dashboard(self, match, db_session, bins=SCORE_DISTRIBUTION_BINS):
+        facts = self.facts(match.uid, db_session)
+        with facts.lock:
+            return facts.dashboard(match_version(match), bins)
+
+
+match_analytics = MatchAnalytics()
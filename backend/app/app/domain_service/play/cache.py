@@ -1,14 +1,23 @@
 import os
 
 from redis import Redis
+from redis import asyncio as aioredis
 
 
 class ClientFactory:
     _client = None
+    _async_client = None
+
+    @property
+    def connection_kwargs(self):
+        return {"host": "redis", "port": "6379", "password": os.getenv("REDIS_PW")}
 
     def new_client(self):
         if self._client is None:
-            self._client = Redis(
-                **{"host": "redis", "port": "6379", "password": os.getenv("REDIS_PW")}
-            )
+            self._client = Redis(**self.connection_kwargs)
         return self._client
+
+    def new_async_client(self):
+        if self._async_client is None:
+            self._async_client = aioredis.Redis(**self.connection_kwargs)
+        return self._async_client
@@ -0,0 +1,301 @@
+import logging
+import math
+import queue
+import threading
+from collections import OrderedDict
+from hashlib import blake2b
+from time import time
+
+from redis.exceptions import RedisError
+
+from app.constants import (
+    LIVE_ACTIVE_WINDOW,
+    LIVE_ANSWERS_WINDOW,
+    LIVE_COUNTERS_PENDING,
+    LIVE_COUNTERS_PRECISION,
+    LIVE_COUNTERS_TTL,
+)
+from app.core.config import settings
+from app.domain_service.play.cache import ClientFactory
+from app.exceptions import LiveCountersError
+
+logger = logging.getLogger(__name__)
+
+
+def hash64(value):
+    return int.from_bytes(blake2b(str(value).encode(), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    """
+    Approximate count of the distinct values added
+
+    2**precision one-byte registers, within about 1.04/sqrt(2**precision)
+    of the exact count. The harmonic sum of the registers is kept
+    up to date, so that counting does not scan them
+    """
+
+    def __init__(self, precision=LIVE_COUNTERS_PRECISION):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(self.size)
+        self._alpha = 0.7213 / (1 + 1.079 / self.size)
+        self._sum = float(self.size)
+        self._zeros = self.size
+
+    def _set(self, index, rank):
+        previous = self.registers[index]
+        if rank <= previous:
+            return
+
+        self.registers[index] = rank
+        self._sum += 2.0**-rank - 2.0**-previous
+        self._zeros -= previous == 0
+
+    def add(self, value):
+        digest = hash64(value)
+        rest_bits = 64 - self.precision
+        rest = digest & ((1 << rest_bits) - 1)
+        self._set(digest >> rest_bits, rest_bits - rest.bit_length() + 1)
+
+    def merge(self, other):
+        for index, rank in enumerate(other.registers):
+            self._set(index, rank)
+        return self
+
+    def count(self):
+        estimate = self._alpha * self.size * self.size / self._sum
+        if estimate <= 2.5 * self.size and self._zeros:
+            # linear counting is more accurate on the few values
+            estimate = self.size * math.log(self.size / self._zeros)
+        return round(estimate)
+
+
+class SlidingWindow:
+    """Events of the last `seconds`, counted per second"""
+
+    def __init__(self, seconds=LIVE_ANSWERS_WINDOW):
+        self.seconds = seconds
+        self._counts = [0] * seconds
+        self._stamps = [None] * seconds
+
+    def add(self, now, amount=1):
+        second = int(now)
+        slot = second % self.seconds
+        if self._stamps[slot] != second:
+            self._stamps[slot] = second
+            self._counts[slot] = 0
+        self._counts[slot] += amount
+
+    def total(self, now):
+        second = int(now)
+        return sum(
+            count
+            for count, stamp in zip(self._counts, self._stamps)
+            if stamp is not None and 0 <= second - stamp < self.seconds
+        )
+
+
+class MatchCounters:
+    """
+    The live counters of one match: the players seen in the last
+    `active_window` seconds, the answers of the last minute and
+    a sketch of all the players so far
+    """
+
+    def __init__(self, match_uid, active_window=LIVE_ACTIVE_WINDOW):
+        self.match_uid = match_uid
+        self.active_window = active_window
+        self.players = HyperLogLog()
+        self.answers = SlidingWindow()
+        self.updated = None
+        self._last_seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def played(self, user_uid, now):
+        with self._lock:
+            self.players.add(user_uid)
+            self._last_seen.pop(user_uid, None)
+            self._last_seen[user_uid] = now
+            self.active(now)
+
+    def answered(self, user_uid, now):
+        self.played(user_uid, now)
+        with self._lock:
+            self.answers.add(now)
+
+    def active(self, now):
+        # the least recently seen come first
+        while self._last_seen:
+            user_uid, seen = next(iter(self._last_seen.items()))
+            if now - seen < self.active_window:
+                break
+            del self._last_seen[user_uid]
+        return len(self._last_seen)
+
+    def read(self, now):
+        with self._lock:
+            return {
+                "match_uid": self.match_uid,
+                "active_players": self.active(now),
+                "answers_per_minute": self.answers.total(now)
+                * 60
+                / self.answers.seconds,
+                "unique_players": self.players.count(),
+            }
+
+
+class LocalCounters:
+    """
+    The counters of the matches played on this process, forgotten
+    once not updated for `ttl` seconds
+    """
+
+    def __init__(self, ttl=LIVE_COUNTERS_TTL):
+        self.ttl = ttl
+        self._matches = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _counters(self, match_uid, now):
+        with self._lock:
+            # the least recently updated come first
+            while self._matches:
+                counters = next(iter(self._matches.values()))
+                if now - counters.updated < self.ttl:
+                    break
+                self._matches.popitem(last=False)
+
+            counters = self._matches.pop(match_uid, None) or MatchCounters(match_uid)
+            counters.updated = now
+            self._matches[match_uid] = counters
+            return counters
+
+    def played(self, match_uid, user_uid, now=None):
+        now = now or time()
+        self._counters(match_uid, now).played(user_uid, now)
+
+    def answered(self, match_uid, user_uid, now=None):
+        now = now or time()
+        self._counters(match_uid, now).answered(user_uid, now)
+
+    def read(self, match_uid, now=None):
+        with self._lock:
+            counters = self._matches.get(match_uid) or MatchCounters(match_uid)
+        return counters.read(now or time())
+
+
+class RedisCounters:
+    """
+    The same counters kept in Redis, shared by all the workers:
+    PFADD for the unique players, a sorted set of the last time
+    each player was seen, and one key per second for the answers
+
+    The updates are queued and sent in one pipeline by a
+    background thread, so that neither the play requests nor
+    the live sockets wait for Redis. They are dropped, and
+    logged, while Redis is unavailable or the queue is full
+    """
+
+    def __init__(
+        self,
+        client,
+        prefix="live",
+        active_window=LIVE_ACTIVE_WINDOW,
+        pending=LIVE_COUNTERS_PENDING,
+    ):
+        self._client = client
+        self.prefix = prefix
+        self.active_window = active_window
+        self._pending = queue.Queue(maxsize=pending)
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def _key(self, match_uid, name):
+        return f"{self.prefix}:{match_uid}:{name}"
+
+    def _seen(self, pipeline, match_uid, user_uid, now):
+        players = self._key(match_uid, "players")
+        active = self._key(match_uid, "active")
+        pipeline.pfadd(players, user_uid)
+        pipeline.zadd(active, {user_uid: now})
+        pipeline.expire(players, LIVE_COUNTERS_TTL)
+        pipeline.expire(active, LIVE_COUNTERS_TTL)
+
+    def _answer(self, pipeline, match_uid, user_uid, now):
+        second = self._key(match_uid, f"answers:{int(now)}")
+        self._seen(pipeline, match_uid, user_uid, now)
+        pipeline.incr(second)
+        pipeline.expire(second, LIVE_ANSWERS_WINDOW * 2)
+
+    def _submit(self, update, match_uid, user_uid, now):
+        if self._worker is None:
+            self._start_worker()
+        try:
+            self._pending.put_nowait((update, match_uid, user_uid, now or time()))
+        except queue.Full:
+            logger.warning(f"Live counters of match {match_uid} not updated")
+
+    def played(self, match_uid, user_uid, now=None):
+        self._submit(self._seen, match_uid, user_uid, now)
+
+    def answered(self, match_uid, user_uid, now=None):
+        self._submit(self._answer, match_uid, user_uid, now)
+
+    def _start_worker(self):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            self.flush(block=True)
+
+    def flush(self, block=False):
+        """Send the queued updates, waiting for the first one if `block`"""
+        try:
+            updates = [self._pending.get(block=block)]
+        except queue.Empty:
+            return
+        while True:
+            try:
+                updates.append(self._pending.get_nowait())
+            except queue.Empty:
+                break
+
+        pipeline = self._client.pipeline(transaction=False)
+        for update, *args in updates:
+            update(pipeline, *args)
+        try:
+            pipeline.execute()
+        except RedisError as exc:
+            logger.warning(f"{len(updates)} live counters updates lost: {exc}")
+
+    def read(self, match_uid, now=None):
+        now = now or time()
+        active = self._key(match_uid, "active")
+        seconds = range(int(now) - LIVE_ANSWERS_WINDOW + 1, int(now) + 1)
+        pipeline = self._client.pipeline()
+        pipeline.pfcount(self._key(match_uid, "players"))
+        pipeline.zremrangebyscore(active, "-inf", now - self.active_window)
+        pipeline.zcard(active)
+        pipeline.mget([self._key(match_uid, f"answers:{s}") for s in seconds])
+        try:
+            unique, _, active_players, answers = pipeline.execute()
+        except RedisError as exc:
+            raise LiveCountersError(f"Live counters not read: {exc}") from exc
+        return {
+            "match_uid": match_uid,
+            "active_players": active_players,
+            "answers_per_minute": sum(int(a or 0) for a in answers)
+            * 60
+            / LIVE_ANSWERS_WINDOW,
+            "unique_players": unique,
+        }
+
+
+live_counters = (
+    RedisCounters(ClientFactory().new_client())
+    if settings.LIVE_REDIS_COUNTERS
+    else LocalCounters()
+)
@@ -0,0 +1,203 @@
+import asyncio
+import json
+import logging
+import threading
+from bisect import bisect_left, insort
+from collections import deque
+from time import monotonic
+from uuid import uuid4
+
+from redis.exceptions import RedisError
+
+from app.constants import RANKINGS_STREAM_BACKLOG, RANKINGS_STREAM_TICK
+from app.core.config import settings
+from app.domain_entities import Ranking, User
+from app.domain_service.play.cache import ClientFactory
+from app.domain_service.play.relay import RedisRelay
+
+logger = logging.getLogger(__name__)
+
+
+def rankings_channel(match_uid):
+    return f"rankings:{match_uid}"
+
+
+class RankingFeed:
+    """
+    Rank updates of one match, shared by all its subscribers
+
+    The rankings written since the last tick are coalesced into
+    one event, computed by whichever subscriber first asks for
+    it. The latest events are kept to resume a stream after a
+    reconnection, older clients receive a new snapshot.
+
+    The event ids are prefixed by the epoch of the feed, so that
+    the clients of a feed since dropped, or of another worker,
+    receive a snapshot too, as those with an invalid id
+    """
+
+    def __init__(self, match_uid, rankings, backlog=RANKINGS_STREAM_BACKLOG):
+        self.match_uid = match_uid
+        self.epoch = uuid4().hex[:8]
+        self.event_id = 0
+        self.subscribers = 0
+        self._lock = threading.Lock()
+        self._rankings = list(rankings)
+        self._sorted_scores = sorted(-r["score"] for r in self._rankings)
+        self._pending = []
+        self._events = deque(maxlen=backlog)
+        self._last_tick = monotonic()
+
+    def publish(self, user_uid, score, name=None):
+        with self._lock:
+            self._pending.append(
+                {"user": {"uid": user_uid, "name": name}, "score": score}
+            )
+
+    async def receive(self, data: str):
+        """A score published through the relay"""
+        self.publish(**json.loads(data))
+
+    def rank(self, score):
+        return bisect_left(self._sorted_scores, -score) + 1
+
+    def snapshot(self):
+        return {
+            "type": "snapshot",
+            "rankings": [dict(r, rank=self.rank(r["score"])) for r in self._rankings],
+        }
+
+    def _flush(self):
+        for entry in self._pending:
+            insort(self._sorted_scores, -entry["score"])
+            self._rankings.append(entry)
+
+        self.event_id += 1
+        changes = [dict(e, rank=self.rank(e["score"])) for e in self._pending]
+        self._events.append(
+            (self.event_id, json.dumps({"type": "delta", "rankings": changes}))
+        )
+        self._pending = []
+
+    def tick(self, interval=RANKINGS_STREAM_TICK):
+        with self._lock:
+            if self._pending and monotonic() - self._last_tick >= interval:
+                self._flush()
+                self._last_tick = monotonic()
+
+    def key(self, event_id):
+        return f"{self.epoch}-{event_id}"
+
+    def sequence(self, last_event_id):
+        """The number of an event id of this feed, None for any other"""
+        epoch, _, number = (last_event_id or "").partition("-")
+        if epoch != self.epoch or not number.isdigit():
+            return
+        return int(number)
+
+    def since(self, last_event_id=None):
+        """Return the events following `last_event_id`"""
+        with self._lock:
+            last = self.sequence(last_event_id)
+            if last is not None and last <= self.event_id:
+                oldest = self._events[0][0] if self._events else self.event_id + 1
+                if last >= oldest - 1:
+                    return [(self.key(i), data) for i, data in self._events if i > last]
+            return [(self.key(self.event_id), json.dumps(self.snapshot()))]
+
+    async def stream(self, request, last_event_id=None, interval=RANKINGS_STREAM_TICK):
+        while not await request.is_disconnected():
+            self.tick(interval)
+            for event_id, data in self.since(last_event_id):
+                last_event_id = event_id
+                yield f"id: {event_id}\nevent: rankings\ndata: {data}\n\n"
+            await asyncio.sleep(interval)
+
+
+class RankingFeeds:
+    """
+    The ranking feeds of the matches watched on this worker
+
+    A feed lives as long as one of its streams runs: the count of
+    subscribers is taken when the stream starts. With a relay, the
+    new scores are published through it, so that the feeds of
+    every worker receive those saved by any of them, otherwise
+    they go straight to the feed of the match
+    """
+
+    def __init__(self, relay=None):
+        self.relay = relay
+        self._feeds = {}
+        self._lock = threading.Lock()
+
+    def load(self, match_uid, db_session):
+        rows = (
+            db_session.query(Ranking.score, User.uid, User.name)
+            .join(User, User.uid == Ranking.user_uid)
+            .filter(Ranking.match_uid == match_uid)
+            .order_by(Ranking.uid)
+        )
+        return [
+            {"user": {"uid": user_uid, "name": name}, "score": score}
+            for score, user_uid, name in rows
+        ]
+
+    def feed(self, match_uid, db_session):
+        """The feed streamed for the match, a new one if none is"""
+        with self._lock:
+            feed = self._feeds.get(match_uid)
+        return feed or RankingFeed(match_uid, self.load(match_uid, db_session))
+
+    def subscribe(self, feed):
+        """Count a subscriber of the feed streamed for its match"""
+        with self._lock:
+            feed = self._feeds.setdefault(feed.match_uid, feed)
+            feed.subscribers += 1
+            return feed
+
+    def release(self, match_uid):
+        """
+        Drop the feed once its last subscriber is gone, return
+        it if so
+        """
+        with self._lock:
+            feed = self._feeds.get(match_uid)
+            if feed:
+                feed.subscribers -= 1
+                if feed.subscribers <= 0:
+                    return self._feeds.pop(match_uid)
+
+    async def stream(
+        self, feed, request, last_event_id=None, interval=RANKINGS_STREAM_TICK
+    ):
+        feed = self.subscribe(feed)
+        channel = rankings_channel(feed.match_uid)
+        try:
+            if self.relay is not None and feed.subscribers == 1:
+                await self.relay.subscribe(channel, feed.receive)
+            async for event in feed.stream(request, last_event_id, interval):
+                yield event
+        finally:
+            if self.release(feed.match_uid) and self.relay is not None:
+                await self.relay.unsubscribe(channel, feed.receive)
+
+    def publish(self, match_uid, user_uid, score, name=None):
+        """Forward the new score to the feeds of the match"""
+        if self.relay is not None:
+            data = {"user_uid": user_uid, "score": score, "name": name}
+            try:
+                self.relay.send(rankings_channel(match_uid), json.dumps(data))
+            except RedisError as exc:
+                logger.warning(f"Ranking of match {match_uid} not published: {exc}")
+            return
+
+        feed = self._feeds.get(match_uid)
+        if feed:
+            feed.publish(user_uid, score, name)
+
+
+ranking_feeds = RankingFeeds(
+    RedisRelay(ClientFactory().new_async_client(), ClientFactory().new_client())
+    if settings.LIVE_REDIS_RELAY
+    else None
+)
@@ -0,0 +1,354 @@
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+from uuid import uuid4
+
+from app.domain_entities import User
+from app.domain_service.data_transfer.attempt import AttemptDTO
+from app.domain_service.data_transfer.play_event import PlayEventDTO
+from app.domain_service.data_transfer.question import QuestionDTO
+from app.domain_service.data_transfer.ranking import RankingDTO
+from app.domain_service.data_transfer.reaction import ReactionDTO
+from app.domain_service.play.leaderboard import ranking_feeds
+from app.domain_service.play.relay import LocalRelay
+from app.domain_service.play.single_player import GameFactory, QuestionFactory
+from app.domain_service.schemas.response.play import Question as PlayQuestion
+from app.exceptions import (
+    GameOver,
+    LiveHostError,
+    LiveHostUserError,
+    LiveMatchOverError,
+    MatchOver,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def outbound_channel(match_uid):
+    return f"live:{match_uid}:out"
+
+
+def inbound_channel(match_uid):
+    return f"live:{match_uid}:in"
+
+
+def host_key(match_uid):
+    return f"live:{match_uid}:host"
+
+
+def ended_key(match_uid):
+    return f"live:{match_uid}:ended"
+
+
+class LiveRoom:
+    """
+    The players of a live match connected to this process
+
+    Every message published on the outbound channel is
+    serialized once and sent to all the local sockets
+    """
+
+    def __init__(self, match_uid, relay):
+        self.match_uid = match_uid
+        self._relay = relay
+        self._sockets = {}
+
+    @property
+    def players(self):
+        return list(self._sockets)
+
+    async def open(self):
+        await self._relay.subscribe(outbound_channel(self.match_uid), self.deliver)
+
+    async def close(self):
+        await self._relay.unsubscribe(outbound_channel(self.match_uid), self.deliver)
+
+    async def connect(self, user_uid, websocket):
+        self._sockets[user_uid] = websocket
+        await self._relay.publish(
+            inbound_channel(self.match_uid),
+            json.dumps({"type": "join", "user_uid": user_uid}),
+        )
+
+    def disconnect(self, user_uid):
+        self._sockets.pop(user_uid, None)
+
+    async def answer(self, user_uid, answer_uid):
+        """Forward the answer to the host, stamped with the server time"""
+        await self._relay.publish(
+            inbound_channel(self.match_uid),
+            json.dumps(
+                {
+                    "type": "answer",
+                    "user_uid": user_uid,
+                    "answer_uid": answer_uid,
+                    "answered_at": datetime.now(tz=timezone.utc).isoformat(),
+                }
+            ),
+        )
+
+    async def deliver(self, data: str):
+        sockets = list(self._sockets.items())
+        results = await asyncio.gather(
+            *(ws.send_text(data) for _, ws in sockets), return_exceptions=True
+        )
+        for (user_uid, _), result in zip(sockets, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Dropping live player {user_uid}: {result}")
+                self.disconnect(user_uid)
+
+
+class LiveHost:
+    """
+    Drive a live match: the host decides when to move to the
+    next question, that is published once for all the players.
+
+    Answers are collected while the question is displayed and
+    recorded when the host moves forward, scored by ReactionScore
+    as in SinglePlayer. Only uids are kept between requests, the
+    rows are loaded with the session of the request.
+
+    The answers arrive on the event loop while advance() runs in
+    a thread, so the question is closed and its answers are taken
+    under a lock: the late ones are dropped, none is lost. The
+    whole advance() runs under another lock, that the event loop
+    never waits for, so that two requests of the host move the
+    match one question at a time and end it once
+    """
+
+    def __init__(self, match_uid, relay, user_uid=None):
+        self.match_uid = match_uid
+        self.user_uid = user_uid
+        self._relay = relay
+        self._advancing = threading.Lock()
+        self.over = False
+        self._played_game_ids = ()
+        self._displayed_ids = ()
+        self._game_uid = None
+        self._question_uid = None
+        self._displayed_at = None
+        self._answers = {}
+        self._lock = threading.Lock()
+        self.attempts = {}
+        self.scores = defaultdict(float)
+        self.eliminated = set()
+
+    @property
+    def current(self):
+        return self._question_uid
+
+    async def open(self):
+        await self._relay.subscribe(inbound_channel(self.match_uid), self.receive)
+
+    async def close(self):
+        await self._relay.unsubscribe(inbound_channel(self.match_uid), self.receive)
+
+    async def receive(self, data: str):
+        message = json.loads(data)
+        user_uid = message["user_uid"]
+        if user_uid in self.eliminated:
+            return
+
+        with self._lock:
+            self.attempts.setdefault(user_uid, uuid4().hex)
+            if message["type"] != "answer" or not self._question_uid:
+                return
+
+            # only the first answer given to the question counts
+            if user_uid not in self._answers:
+                answered_at = datetime.fromisoformat(message["answered_at"])
+                self._answers[user_uid] = (message.get("answer_uid"), answered_at)
+
+    def close_question(self):
+        """Stop collecting answers, return them with the attempts so far"""
+        with self._lock:
+            question_uid, self._question_uid = self._question_uid, None
+            answers, self._answers = self._answers, {}
+            return question_uid, answers, dict(self.attempts)
+
+    def _next_question(self, match):
+        game = match.games.filter_by(uid=self._game_uid).one_or_none()
+        while True:
+            if game:
+                try:
+                    return QuestionFactory(game, *self._displayed_ids).next()
+                except GameOver:
+                    self._played_game_ids += (game.uid,)
+
+            game = GameFactory(match, *self._played_game_ids).next()
+            self._game_uid = game.uid
+
+    def record_answers(self, question, answers, attempts, db_session):
+        """
+        Store the reactions to the current question with one commit
+
+        Return, by user, whether the answer was correct
+        """
+        reaction_dto = ReactionDTO(session=db_session)
+        answers_by_uid = question.answers_by_uid
+        results = {}
+        for user_uid, (answer_uid, answered_at) in answers.items():
+            reaction = reaction_dto.new(
+                match_uid=self.match_uid,
+                question=question,
+                game_uid=question.game_uid,
+                user_uid=user_uid,
+                attempt_uid=attempts[user_uid],
+                create_timestamp=self._displayed_at,
+            )
+            results[user_uid] = reaction_dto.record_answer(
+                reaction,
+                answer=answers_by_uid.get(answer_uid),
+                answered_at=answered_at,
+                commit=False,
+            )
+            self.scores[user_uid] += reaction.score or 0
+        db_session.commit()
+        return results
+
+    def question_results(self, match, question, answers, attempts, db_session):
+        correct = [a.uid for a in question.answers if a.is_correct]
+        results = self.record_answers(question, answers, attempts, db_session)
+        message = {"type": "results", "question_uid": question.uid}
+        if match.notify_correct:
+            message["correct"] = correct
+
+        if match.treasure_hunt:
+            out = {u for u in attempts if not results.get(u)} - self.eliminated
+            self.eliminated |= out
+            message["eliminated"] = sorted(out)
+
+        message["scores"] = {u: round(s, 3) for u, s in self.scores.items()}
+        return message
+
+    def save_rankings(self, attempts, db_session):
+        events = PlayEventDTO(session=db_session)
+        attempt_dto = AttemptDTO(session=db_session)
+        for user_uid, score in self.scores.items():
+            events.attempt_finished(
+                self.match_uid, user_uid, score, attempts.get(user_uid)
+            )
+            attempt_dto.finish(attempts.get(user_uid))
+        dto = RankingDTO(session=db_session)
+        dto.add_many(
+            [
+                dto.new(match_uid=self.match_uid, user_uid=user_uid, score=score)
+                for user_uid, score in self.scores.items()
+            ]
+        )
+        names = dict(
+            db_session.query(User.uid, User.name).filter(User.uid.in_(self.scores))
+        )
+        for user_uid, score in self.scores.items():
+            ranking_feeds.publish(self.match_uid, user_uid, score, names.get(user_uid))
+
+    def advance(self, match, db_session):
+        """
+        Close the current question and move to the next one
+
+        Return the messages to publish. The question is None
+        when the match is over
+        """
+        with self._advancing:
+            if self.over:
+                return None, []
+            return self._advance(match, db_session)
+
+    def _advance(self, match, db_session):
+        messages = []
+        question_uid, answers, attempts = self.close_question()
+        if question_uid:
+            question = QuestionDTO(session=db_session).get_by_uid(question_uid)
+            messages.append(
+                self.question_results(match, question, answers, attempts, db_session)
+            )
+
+        try:
+            question = self._next_question(match)
+        except MatchOver:
+            self.over = True
+            self.save_rankings(attempts, db_session)
+            messages.append({"type": "over", "scores": dict(self.scores)})
+            return None, messages
+
+        self._displayed_ids += (question.uid,)
+        with self._lock:
+            self._displayed_at = datetime.now(tz=timezone.utc)
+            self._question_uid = question.uid
+        payload = PlayQuestion.from_orm(question).dict()
+        messages.append({"type": "question", "question": payload})
+        return question, messages
+
+    async def publish(self, messages):
+        for message in messages:
+            await self._relay.publish(
+                outbound_channel(self.match_uid), json.dumps(message)
+            )
+
+
+class LiveRegistry:
+    """
+    Rooms and hosts of the live matches of this process
+
+    The host of a match lives on the worker that served its first
+    request, which holds a lease on it in the relay for the user
+    who sent it. The other workers and users are refused, rather
+    than restart the match, and so is any host of a match played
+    to its end
+    """
+
+    def __init__(self, relay=None):
+        self.relay = relay or LocalRelay()
+        self.worker = uuid4().hex
+        self.rooms = {}
+        self.hosts = {}
+
+    async def room(self, match_uid):
+        if match_uid not in self.rooms:
+            self.rooms[match_uid] = LiveRoom(match_uid, self.relay)
+            await self.rooms[match_uid].open()
+        return self.rooms[match_uid]
+
+    def _owner(self, user_uid):
+        return f"{self.worker}:{user_uid}"
+
+    async def host(self, match_uid, user_uid=None):
+        if await self.relay.ended(ended_key(match_uid)):
+            raise LiveMatchOverError(f"Match {match_uid} is over")
+
+        if not await self.relay.claim(host_key(match_uid), self._owner(user_uid)):
+            holder = await self.relay.holder(host_key(match_uid))
+            if holder and holder.split(":")[-1] != str(user_uid):
+                raise LiveHostUserError(f"Match {match_uid} has another host")
+            raise LiveHostError(f"Match {match_uid} is hosted by another worker")
+
+        if match_uid not in self.hosts:
+            self.hosts[match_uid] = LiveHost(match_uid, self.relay, user_uid)
+            await self.hosts[match_uid].open()
+        host = self.hosts[match_uid]
+        if host.user_uid != user_uid:
+            raise LiveHostUserError(f"Match {match_uid} has another host")
+        return host
+
+    async def leave(self, match_uid, user_uid):
+        room = self.rooms.get(match_uid)
+        if not room:
+            return
+
+        room.disconnect(user_uid)
+        if not room.players:
+            del self.rooms[match_uid]
+            await room.close()
+
+    async def end(self, match_uid):
+        await self.relay.end(ended_key(match_uid))
+        host = self.hosts.pop(match_uid, None)
+        if host:
+            await host.close()
+            await self.relay.release(host_key(match_uid), self._owner(host.user_uid))
+        room = self.rooms.pop(match_uid, None)
+        if room:
+            await room.close()
@@ -0,0 +1,134 @@
+from sqlalchemy import delete, func, select
+
+from app.domain_entities import Answer, Game, PlayEvent, Question, Ranking, Reaction
+from app.domain_entities.play_event import ATTEMPT_FINISHED
+from app.domain_service.data_transfer.play_event import PlayEventDTO
+from app.domain_service.data_transfer.ranking import RankingDTO
+from app.domain_service.data_transfer.reaction import ReactionScore
+from app.exceptions import IncompletePlayEventsError
+
+
+class PlayEventProjector:
+    """
+    Rebuild the tables derived from the play events of a match
+
+    Only the finished attempts are logged, the answers are
+    already in the reactions. With rescore=True these are scored
+    again from their timings, against the current time of the
+    questions and level of the answers, instead of using the
+    logged score of the attempt
+    """
+
+    def __init__(self, match_uid, db_session):
+        self.match_uid = match_uid
+        self._session = db_session
+        self._answers = None
+
+    @property
+    def answers(self):
+        if self._answers is None:
+            rows = (
+                self._session.query(Answer.uid, Question.time, Answer.level)
+                .join(Question, Question.uid == Answer.question_uid)
+                .join(Game, Game.uid == Question.game_uid)
+                .filter(Game.match_uid == self.match_uid)
+                .all()
+            )
+            self._answers = {uid: (time, level) for uid, time, level in rows}
+        return self._answers
+
+    def score(self, answer_uid, displayed_at, answered_at):
+        if answer_uid not in self.answers or not answered_at:
+            return 0
+
+        question_time, answer_level = self.answers[answer_uid]
+        timing = (answered_at - displayed_at).total_seconds()
+        if question_time is not None and question_time - timing < 0:
+            return 0
+        return ReactionScore(timing, question_time, answer_level).value()
+
+    def rescored(self):
+        """The score of each attempt, from its reactions"""
+        rows = self._session.execute(
+            select(
+                Reaction.attempt_uid,
+                Reaction.answer_uid,
+                Reaction.create_timestamp,
+                Reaction.update_timestamp,
+            ).where(
+                Reaction.match_uid == self.match_uid, Reaction.answer_uid.isnot(None)
+            )
+        )
+        scores = {}
+        for attempt_uid, answer_uid, displayed_at, answered_at in rows:
+            scores[attempt_uid] = scores.get(attempt_uid, 0) + self.score(
+                answer_uid, displayed_at, answered_at
+            )
+        return scores
+
+    def attempts(self, rescore=False, until=None):
+        """The user and score of each finished attempt"""
+        totals = {}
+        events = PlayEventDTO(session=self._session)
+        for event in events.replay(self.match_uid, until=until):
+            if event.kind != ATTEMPT_FINISHED:
+                continue
+            key = event.attempt_uid or (event.user_uid, event.uid)
+            totals[key] = {"user_uid": event.user_uid, "score": event.score or 0}
+
+        if rescore:
+            for attempt_uid, score in self.rescored().items():
+                if attempt_uid in totals:
+                    totals[attempt_uid]["score"] = score
+        return totals
+
+    def coverage(self):
+        """
+        The rankings of the match and the finished attempts logged,
+        how many and the last of each, read with one statement
+        """
+        of_match = Ranking.match_uid == self.match_uid
+        logged = PlayEvent.match_uid == self.match_uid
+        return self._session.execute(
+            select(
+                select(func.count(Ranking.uid)).where(of_match).scalar_subquery(),
+                select(func.max(Ranking.uid)).where(of_match).scalar_subquery(),
+                select(func.count(PlayEvent.uid))
+                .where(logged, PlayEvent.kind == ATTEMPT_FINISHED)
+                .scalar_subquery(),
+                select(func.max(PlayEvent.uid)).where(logged).scalar_subquery(),
+            )
+        ).one()
+
+    def rebuild_rankings(self, rescore=False):
+        """
+        Replace the rankings of the match with the replayed ones
+
+        Only when every ranking has its finished attempt in the log,
+        which misses those saved while it was disabled. The rankings
+        saved meanwhile are left alone, as are their events
+        """
+        rankings, last_ranking, finished, last_event = self.coverage()
+        if rankings != finished:
+            raise IncompletePlayEventsError(
+                f"{finished} of the {rankings} rankings of the match are logged"
+            )
+
+        attempts = self.attempts(rescore=rescore, until=last_event)
+        self._session.execute(
+            delete(Ranking).where(
+                Ranking.match_uid == self.match_uid, Ranking.uid <= (last_ranking or 0)
+            )
+        )
+        dto = RankingDTO(session=self._session)
+        dto.add_many(
+            [
+                dto.new(
+                    match_uid=self.match_uid,
+                    user_uid=entry["user_uid"],
+                    score=entry["score"],
+                )
+                for entry in attempts.values()
+            ]
+        )
+        return len(attempts)
@@ -0,0 +1,107 @@
+import asyncio
+from collections import defaultdict
+
+from app.constants import LIVE_ENDED_TTL, LIVE_HOST_LEASE
+
+
+class LocalRelay:
+    """Deliver the messages to the subscribers of this process"""
+
+    def __init__(self):
+        self._subscribers = defaultdict(list)
+        self._ended = set()
+
+    async def publish(self, channel, data: str):
+        for callback in list(self._subscribers[channel]):
+            await callback(data)
+
+    async def subscribe(self, channel, callback):
+        self._subscribers[channel].append(callback)
+
+    async def unsubscribe(self, channel, callback):
+        if callback in self._subscribers[channel]:
+            self._subscribers[channel].remove(callback)
+
+    async def claim(self, key, owner):
+        return True
+
+    async def release(self, key, owner):
+        pass
+
+    async def holder(self, key):
+        return
+
+    async def end(self, key):
+        self._ended.add(key)
+
+    async def ended(self, key):
+        return key in self._ended
+
+
+class RedisRelay:
+    """
+    Deliver the messages through Redis pub/sub, so that players
+    connected to different workers receive the same broadcast
+    """
+
+    def __init__(self, client, sync_client=None):
+        self._client = client
+        self._sync_client = sync_client
+        self._listeners = {}
+
+    async def publish(self, channel, data: str):
+        await self._client.publish(channel, data)
+
+    def send(self, channel, data: str):
+        """Publish from a thread, outside of the event loop"""
+        self._sync_client.publish(channel, data)
+
+    async def subscribe(self, channel, callback):
+        pubsub = self._client.pubsub()
+        await pubsub.subscribe(channel)
+        self._listeners[(channel, callback)] = (
+            pubsub,
+            asyncio.create_task(self._listen(pubsub, callback)),
+        )
+
+    async def unsubscribe(self, channel, callback):
+        pubsub, task = self._listeners.pop((channel, callback), (None, None))
+        if task:
+            task.cancel()
+            await pubsub.unsubscribe(channel)
+            await pubsub.close()
+
+    async def claim(self, key, owner):
+        """
+        Whether `owner` holds the lease on `key`, taken if free.
+        The lease is renewed at each claim and expires otherwise
+        """
+        if await self._client.set(key, owner, nx=True, ex=LIVE_HOST_LEASE):
+            return True
+
+        current = await self._client.get(key)
+        if current is None or current.decode("utf-8") != owner:
+            return False
+        await self._client.expire(key, LIVE_HOST_LEASE)
+        return True
+
+    async def release(self, key, owner):
+        current = await self._client.get(key)
+        if current is not None and current.decode("utf-8") == owner:
+            await self._client.delete(key)
+
+    async def holder(self, key):
+        """The owner of the lease on `key`, None if free"""
+        current = await self._client.get(key)
+        return current.decode("utf-8") if current is not None else None
+
+    async def end(self, key):
+        await self._client.set(key, 1, ex=LIVE_ENDED_TTL)
+
+    async def ended(self, key):
+        return bool(await self._client.exists(key))
+
+    async def _listen(self, pubsub, callback):
+        async for message in pubsub.listen():
+            if message["type"] == "message":
+                await callback(message["data"].decode("utf-8"))
@@ -0,0 +1,170 @@
+from collections import defaultdict
+
+import numpy as np
+
+from app.constants import RESCORE_FETCH_SIZE
+from app.domain_entities import Answer, Attempt, Question, Ranking, Reaction
+from app.domain_entities.db.utils import update_from_values
+
+
+def round_scores(values):
+    """
+    round(value, 3) over a whole array. np.round scales the values
+    before rounding them, which moves some of them onto a tie: those
+    are rounded by Python instead, as ReactionScore does
+    """
+    rounded = np.round(values, 3)
+    scaled = values * 1000
+    ties = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    rounded[ties] = [round(value, 3) for value in values[ties].tolist()]
+    return rounded
+
+
+def vector_scores(seconds, question_time, answer_level):
+    """
+    ReactionScore.value() over whole arrays. NaN stands for the
+    missing values, and is returned for the expired answers: as
+    in record_answer, only the questions without a time are
+    untimed, those of time 0 expire at once
+    """
+    untimed = np.isnan(question_time)
+    level = np.nan_to_num(answer_level)
+    weight = np.where(level == 0, 1, level)
+    # ReactionScore gives the level to the answers in no time
+    instant = untimed | (question_time == 0)
+    time = np.where(instant, 1, question_time)
+    scores = np.where(instant, level, round_scores((time - seconds) / time * weight))
+    scores[~untimed & (question_time - seconds < 0)] = np.nan
+    return scores
+
+
+def nullable(array):
+    return [None if np.isnan(v) else v for v in array.tolist()]
+
+
+class MatchRescorer:
+    """
+    Score the answers of a match again, after its questions or
+    answers were edited, and update its attempts and rankings
+
+    The answered reactions are loaded as columns and scored at
+    once, then only the changed scores are written back
+    """
+
+    def __init__(self, match_uid, db_session):
+        self.match_uid = match_uid
+        self._session = db_session
+
+    def load(self):
+        rows = (
+            self._session.query(
+                Reaction.uid,
+                Reaction.user_uid,
+                Reaction.attempt_uid,
+                Reaction.create_timestamp,
+                Reaction.update_timestamp,
+                Reaction.score,
+                Question.time,
+                Answer.level,
+            )
+            .join(Question, Question.uid == Reaction.question_uid)
+            .join(Answer, Answer.uid == Reaction.answer_uid)
+            .filter(Reaction.match_uid == self.match_uid)
+            .yield_per(RESCORE_FETCH_SIZE)
+        )
+        uid, user, attempt, displayed, answered, score, time, level = (
+            [] for _ in range(8)
+        )
+        for row in rows:
+            uid.append(row[0])
+            user.append(row[1])
+            attempt.append(row[2])
+            displayed.append(row[3].timestamp())
+            answered.append(row[4].timestamp())
+            score.append(row[5])
+            time.append(row[6])
+            level.append(row[7])
+
+        return {
+            "uid": np.array(uid, dtype=np.int64),
+            "user_uid": np.array(user, dtype=np.int64),
+            "attempt_uid": np.array(attempt, dtype=object),
+            "answered": np.array(answered, dtype=np.float64),
+            "seconds": np.array(answered, dtype=np.float64)
+            - np.array(displayed, dtype=np.float64),
+            "score": np.array(score, dtype=np.float64),
+            "time": np.array(time, dtype=np.float64),
+            "level": np.array(level, dtype=np.float64),
+        }
+
+    def attempt_totals(self, columns, scores):
+        """The uid, user, total score and last answer time of each attempt"""
+        if not len(scores):
+            return []
+
+        attempts, inverse = np.unique(columns["attempt_uid"], return_inverse=True)
+        totals = np.bincount(
+            inverse, weights=np.nan_to_num(scores), minlength=len(attempts)
+        )
+        last = np.full(len(attempts), -np.inf)
+        np.maximum.at(last, inverse, columns["answered"])
+        users = np.zeros(len(attempts), dtype=np.int64)
+        users[inverse] = columns["user_uid"]
+        return list(
+            zip(attempts.tolist(), users.tolist(), totals.tolist(), last.tolist())
+        )
+
+    def update_rankings(self, attempts):
+        """
+        Each ranking takes the total of the latest attempt of its
+        user that ended before the ranking was saved
+        """
+        by_user = defaultdict(list)
+        for _, user_uid, total, last in sorted(attempts, key=lambda a: a[3]):
+            by_user[user_uid].append((last, total))
+
+        rankings = (
+            self._session.query(Ranking.uid, Ranking.user_uid, Ranking.create_timestamp)
+            .filter(Ranking.match_uid == self.match_uid)
+            .order_by(Ranking.create_timestamp.desc())
+        )
+        updates = []
+        for uid, user_uid, saved_at in rankings:
+            candidates = by_user.get(user_uid, [])
+            for i in range(len(candidates) - 1, -1, -1):
+                last, total = candidates[i]
+                if last <= saved_at.timestamp():
+                    updates.append((uid, total))
+                    del candidates[i]
+                    break
+
+        return update_from_values(
+            self._session, Ranking.__table__, ("uid", "score"), updates
+        )
+
+    def update_attempts(self, attempts):
+        return update_from_values(
+            self._session,
+            Attempt.__table__,
+            ("attempt_uid", "score"),
+            [(attempt_uid, total) for attempt_uid, _, total, _ in attempts],
+        )
+
+    def rescore(self):
+        """Return how many reactions and rankings were updated"""
+        columns = self.load()
+        scores = vector_scores(columns["seconds"], columns["time"], columns["level"])
+        unchanged = (scores == columns["score"]) | (
+            np.isnan(scores) & np.isnan(columns["score"])
+        )
+        changed = list(
+            zip(columns["uid"][~unchanged].tolist(), nullable(scores[~unchanged]))
+        )
+        reactions = update_from_values(
+            self._session, Reaction.__table__, ("uid", "score"), changed
+        )
+        attempts = self.attempt_totals(columns, scores)
+        self.update_attempts(attempts)
+        rankings = self.update_rankings(attempts)
+        self._session.commit()
+        return reactions, rankings
@@ -0,0 +1,89 @@
+import threading
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+from random import Random
+from time import monotonic
+
+from sqlalchemy import func
+
+from app.constants import TEMPLATE_POOL_TTL
+from app.domain_entities import Answer, Question
+
+
+class TemplatePool:
+    """
+    Dense index of the template questions, by difficulty
+
+    The uids of each level, the highest among the answers of
+    the question, are kept sorted in compact arrays, so that
+    K of them are drawn in O(K) without touching the table.
+    The index is rebuilt once it is older than `ttl` seconds
+    """
+
+    def __init__(self, ttl=TEMPLATE_POOL_TTL):
+        self.ttl = ttl
+        self._strata = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def load(self, db_session):
+        rows = (
+            db_session.query(Question.uid, func.max(Answer.level))
+            .outerjoin(Answer, Answer.question_uid == Question.uid)
+            .filter(Question.game_uid.is_(None))
+            .group_by(Question.uid)
+            .order_by(Question.uid)
+        )
+        strata = {}
+        for uid, level in rows:
+            strata.setdefault(level or 0, array("l")).append(uid)
+        self._strata = strata
+        self._loaded_at = monotonic()
+
+    def strata(self, db_session):
+        with self._lock:
+            if self._loaded_at is None or monotonic() - self._loaded_at > self.ttl:
+                self.load(db_session)
+            return self._strata
+
+    def _draw(self, rng, uid_arrays, k):
+        """Sample k uids without replacement across the arrays"""
+        offsets = list(accumulate(len(uids) for uids in uid_arrays))
+        result = []
+        for position in rng.sample(range(offsets[-1]), k):
+            index = bisect_right(offsets, position)
+            start = offsets[index - 1] if index else 0
+            result.append(uid_arrays[index][position - start])
+        return result
+
+    def sample(self, db_session, k, seed, levels=None):
+        """
+        Return up to k template uids, always the same for the same
+        seed and pool. With `levels`, the sample is stratified:
+        each level contributes in proportion to its size
+        """
+        strata = self.strata(db_session)
+        rng = Random(seed)
+        if not levels:
+            uid_arrays = [strata[level] for level in sorted(strata)]
+            total = sum(len(uids) for uids in uid_arrays)
+            return self._draw(rng, uid_arrays, min(k, total)) if total else []
+
+        uid_arrays = [strata.get(level, array("l")) for level in sorted(set(levels))]
+        total = sum(len(uids) for uids in uid_arrays)
+        k = min(k, total)
+        shares = [k * len(uids) // total if total else 0 for uids in uid_arrays]
+        # the remainder goes to the largest strata
+        by_size = sorted(range(len(uid_arrays)), key=lambda i: -len(uid_arrays[i]))
+        for i in by_size[: k - sum(shares)]:
+            shares[i] += 1
+
+        result = []
+        for uids, share in zip(uid_arrays, shares):
+            if share:
+                result.extend(self._draw(rng, [uids], share))
+        return result
+
+
+template_pool = TemplatePool()
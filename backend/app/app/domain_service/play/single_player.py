@@ -1,8 +1,22 @@
 import logging
+from functools import partial
 from random import shuffle
+from uuid import uuid4
 
+from sqlalchemy import bindparam, func, select
+from sqlalchemy.orm import object_session
+
+from app.core.config import settings
+from app.core.tracing import span, traced
+from app.domain_entities import Answer, Game, Match, Question, User
+from app.domain_entities.db.utils import seeded_permutation
+from app.domain_service.data_transfer.attempt import AttemptDTO
+from app.domain_service.data_transfer.play_event import PlayEventDTO
 from app.domain_service.data_transfer.ranking import RankingDTO
 from app.domain_service.data_transfer.reaction import ReactionDTO
+from app.domain_service.play.adaptive import correctness, difficulty_indexes
+from app.domain_service.play.leaderboard import ranking_feeds
+from app.domain_service.play.tokens import ProgressToken
 from app.exceptions import (
     GameError,
     GameOver,
@@ -14,21 +28,127 @@ from app.exceptions import (
 
 logger = logging.getLogger(__name__)
 
+# the statements of the game and question factories, built once
+# with bound parameters, so that every question played reuses both
+# the statement and its compiled form
+GAMES_LEFT = (
+    select(Game)
+    .where(
+        Game.match_uid == bindparam("match_uid"),
+        Game.uid.notin_(bindparam("played_ids", expanding=True)),
+    )
+    .order_by(Game.index)
+)
+QUESTIONS_LEFT = (
+    select(Question)
+    .where(
+        Question.game_uid == bindparam("game_uid"),
+        Question.uid.notin_(bindparam("displayed_ids", expanding=True)),
+    )
+    .order_by(Question.uid)
+)
+QUESTIONS_COUNT = select(func.count(Question.uid)).where(
+    Question.game_uid == bindparam("game_uid")
+)
+QUESTION_POSITIONS = select(Question.uid, Question.position).where(
+    Question.game_uid == bindparam("game_uid")
+)
+QUESTION_POSITIONS_AT_LEVELS = QUESTION_POSITIONS.where(
+    Question.uid.in_(
+        select(Answer.question_uid)
+        .group_by(Answer.question_uid)
+        .having(func.max(Answer.level).in_(bindparam("levels", expanding=True)))
+    )
+)
+
 
 class QuestionFactory:
-    def __init__(self, game, *displayed_ids):
+    """
+    With a `seed`, the questions of unordered games follow
+    the permutation of the seed instead of a random shuffle.
+    With a `picker`, the uid of the next question is chosen by
+    it, given the game and the questions already displayed.
+    With a `sample`, only that many questions of the game are
+    displayed, the first of the permutation of the seed among
+    those whose highest answer level is in `levels`, if any
+    """
+
+    def __init__(
+        self, game, *displayed_ids, seed=None, picker=None, sample=None, levels=None
+    ):
         self._game = game
         # displayed_ids are ordered based on their display order
         self.displayed_ids = displayed_ids
         self._question = None
+        self._seed = seed
+        self._picker = picker
+        self._sample = sample
+        self._levels = levels
+        self._session = object_session(game)
+
+    def _game_question(self, uid):
+        """The question of the game, from the identity map if loaded"""
+        question = self._session.get(Question, uid) if uid else None
+        if question is not None and question.game_uid == self._game.uid:
+            return question
+
+    def _next_picked(self):
+        # the index may predate the last edits of the game: the
+        # questions it misses are drawn as the unordered ones
+        question = self._game_question(self._picker(self._game.uid, self.displayed_ids))
+        if question is None:
+            return self._next_seeded()
+        return [question]
+
+    def _positions(self):
+        """The position of each question the game can display, by uid"""
+        if self._levels:
+            rows = self._session.execute(
+                QUESTION_POSITIONS_AT_LEVELS,
+                {"game_uid": self._game.uid, "levels": list(self._levels)},
+            )
+        else:
+            rows = self._session.execute(
+                QUESTION_POSITIONS, {"game_uid": self._game.uid}
+            )
+        return dict(rows.all())
+
+    def _next_seeded(self):
+        positions = self._positions()
+        order = seeded_permutation(f"{self._seed}:{self._game.uid}", tuple(positions))
+        if self._sample:
+            order = order[: self._sample]
+            if self._game.order:
+                order = sorted(order, key=positions.get)
+        displayed = set(self.displayed_ids)
+        for uid in order:
+            if uid not in displayed:
+                return [self._game_question(uid)]
+        return []
 
     def next(self):
-        questions = self._game.questions.filter_by(uid__notin=self.displayed_ids).all()
-        if not self._game.order:
-            shuffle(questions)
+        if self._picker:
+            questions = self._next_picked()
+        elif self._seed and (self._sample or not self._game.order):
+            questions = self._next_seeded()
+        else:
+            questions = (
+                self._session.execute(
+                    QUESTIONS_LEFT,
+                    {
+                        "game_uid": self._game.uid,
+                        "displayed_ids": list(self.displayed_ids),
+                    },
+                )
+                .scalars()
+                .all()
+            )
+            if not self._game.order:
+                shuffle(questions)
 
         if questions:
             self._question = questions[0]
+            self._question.display_seed = self._seed
             self.displayed_ids += (questions[0].uid,)
             return questions[0]
 
@@ -37,9 +157,7 @@ class QuestionFactory:
     def previous(self):
         # remember that the reaction is not deleted
         if len(self.displayed_ids) > 1:
-            return self._game.questions.filter_by(
-                uid=self.displayed_ids[-2]
-            ).one_or_none()
+            return self._game_question(self.displayed_ids[-2])
 
         msg = (
             "No questions were displayed"
@@ -52,20 +170,43 @@ class QuestionFactory:
     def current(self):
         return self._question
 
+    @property
+    def size(self):
+        """How many questions of the game an attempt displays"""
+        if not self._sample:
+            return self._session.execute(
+                QUESTIONS_COUNT, {"game_uid": self._game.uid}
+            ).scalar()
+        return min(self._sample, len(self._positions()))
+
     @property
     def is_last_question(self):
-        return len(self.displayed_ids) == self._game.questions.count()
+        return len(self.displayed_ids) == self.size
 
 
 class GameFactory:
-    def __init__(self, match, *played_ids):
+    def __init__(self, match, *played_ids, seed=None):
         self._match = match
         self.played_ids = played_ids
         self._game = None
+        self._seed = seed
 
     def next(self):
-        games = self._match.games.filter_by(uid__notin=self.played_ids).all()
-        if not self._match.order:
+        games = (
+            object_session(self._match)
+            .execute(
+                GAMES_LEFT,
+                {"match_uid": self._match.uid, "played_ids": list(self.played_ids)},
+            )
+            .scalars()
+            .all()
+        )
+        if self._seed and not self._match.order:
+            uids = tuple(self.played_ids) + tuple(g.uid for g in games)
+            order = seeded_permutation(f"{self._seed}:{self._match.uid}", uids)
+            position = {uid: i for i, uid in enumerate(order)}
+            games.sort(key=lambda g: position[g.uid])
+        elif not self._match.order:
             shuffle(games)
 
         if games:
@@ -137,13 +278,17 @@ class PlayerStatus:
             for r in self._all_reactions_query.filter_by(game_uid=game.uid).all()
         }
 
+    @property
+    def attempt(self):
+        return self.reaction_dto.attempts.get(self.__current_attempt_uid)
+
     def match_completed(self):
-        return (
-            self._current_match.reactions.filter_by(
-                attempt_uid=self.__current_attempt_uid
-            ).count()
-            - len(self._current_match.questions_list)
-            == 0
+        match = self._current_match
+        attempt = self.attempt
+        displayed = attempt.displayed if attempt else 0
+        return displayed == sum(
+            QuestionFactory(game, sample=match.sample, levels=match.sample_levels).size
+            for game in match.games
         )
 
     def _no_attempts(self):
@@ -169,13 +314,18 @@ class PlayerStatus:
         }
 
     def current_score(self):
-        """Sum the scores of all reactions for the match
+        """The score of the attempt, from its summary
 
-        If reaction.score is None it either means the
-        the answer was recorded after question.time or
-        it was an open-answer
+        The reactions whose score is None, either expired
+        or open-answered, added nothing to it. The answers still
+        in the write-behind buffers are added to it
         """
-        return sum(r.score or 0 for r in self.all_reactions())
+        buffer = self.reaction_dto.buffer
+        pending = buffer.scores(self.__current_attempt_uid) if buffer else {}
+        if pending:
+            return self.reaction_dto.attempts.score(self.__current_attempt_uid, pending)
+        attempt = self.attempt
+        return attempt.score if attempt else 0
 
     @property
     def match(self):
@@ -183,16 +333,27 @@ class PlayerStatus:
 
 
 class SinglePlayer:
-    def __init__(self, status: "PlayerStatus", user, match, db_session):
+    """
+    With `deferred` reactions, no row is inserted when a question
+    is displayed: the caller holds the display time, signed, and
+    passes it back to react(), which writes the reaction once
+    """
+
+    def __init__(self, status: "PlayerStatus", user, match, db_session, deferred=None):
         self._status = status
         self._user = user
         self._match = match
         self._session = db_session
         self.reaction_dto = ReactionDTO(session=db_session)
+        self.deferred = settings.DEFERRED_REACTIONS if deferred is None else deferred
 
         self._game_factory = None
         self._question_factory = None
         self._current_reaction = None
+        self._progress = None
+        # the attempt-uid, which the order of games, questions
+        # and answers is derived from
+        self.seed = None
 
     def start(self):
         self._session.refresh(self._match)
@@ -204,23 +365,106 @@ class SinglePlayer:
         if not self._match.is_active:
             raise MatchError("Expired match")
 
-        self._game_factory = GameFactory(self._match, *self._status.all_games_played())
-        game = self._game_factory.next()
+        self.seed = uuid4().hex
+        with span("player_status"):
+            played = self._status.all_games_played()
+            displayed = self._status.questions_displayed()
+        with span("question_selection"):
+            self._game_factory = GameFactory(self._match, *played, seed=self.seed)
+            game = self._game_factory.next()
+            self._question_factory = self._questions_of(game, *displayed)
+            question = self._question_factory.next()
+        if self.deferred:
+            self.reserve()
+            return question, self.seed
 
-        self._question_factory = QuestionFactory(
-            game, *self._status.questions_displayed()
-        )
-        question = self._question_factory.next()
         self._current_reaction = self.reaction_dto.new(
             match_uid=self._match.uid,
             user_uid=self._user.uid,
             game_uid=game.uid,
             question_uid=question.uid,
+            attempt_uid=self.seed,
         )
         self.reaction_dto.save(self._current_reaction)
 
         return question, self._current_reaction.attempt_uid
 
+    def reserve(self):
+        """
+        Count the deferred attempt against the match times as soon
+        as it starts, since no reaction is inserted until the first
+        answer, and give it back if a concurrent start took the last
+        """
+        attempts = self.reaction_dto.attempts
+        attempts.reserve(self._user.uid, self._match.uid, self.seed)
+        if self._match.left_attempts(self._user) < 0:
+            attempts.release(self.seed)
+            raise MatchNotPlayableError(
+                f"User {self._user.email} has no left attempts "
+                f"for Match {self._match.name}"
+            )
+
+    def close(self, attempt):
+        """
+        Save the question the deferred `attempt` displayed last as
+        unanswered, once the player left it: its display token was
+        only held by the client. None if the match was completed
+        """
+        self.seed = attempt.attempt_uid
+        self._status.current_attempt_uid = self.seed
+        reactions = self._status.all_reactions()
+        self._game_factory = GameFactory(
+            self._match, *self._status.all_games_played(), seed=self.seed
+        )
+        try:
+            game = self._game_factory.next()
+            self._question_factory = self._questions_of(
+                game, *self._status.questions_displayed()
+            )
+            question = self.forward()
+        except MatchOver:
+            return
+
+        displayed_at = max(
+            (r.update_timestamp for r in reactions), default=attempt.started_at
+        )
+        self._current_reaction = self.reaction_dto.new(
+            match_uid=self._match.uid,
+            question=question,
+            game_uid=question.game_uid,
+            user_uid=self._user.uid,
+            attempt_uid=self.seed,
+            create_timestamp=displayed_at,
+        )
+        return self.reaction_dto.save(self._current_reaction)
+
+    def _questions_of(self, game, *displayed_ids):
+        """
+        The questions of adaptive matches are picked from the
+        difficulty index, by the accuracy of the attempt, unless
+        the match draws a sample of them for each attempt
+        """
+        picker = None
+        if self._match.adaptive and not self._match.sample:
+            index = difficulty_indexes.index(self._match, self._session)
+            picker = partial(self._pick, index)
+        return QuestionFactory(
+            game,
+            *displayed_ids,
+            seed=self.seed,
+            picker=picker,
+            sample=self._match.sample,
+            levels=self._match.sample_levels,
+        )
+
+    def _pick(self, index, game_uid, displayed_ids):
+        """The accuracy of the attempt is read from its summary"""
+        attempt = self.reaction_dto.attempts.get(self.seed)
+        accuracy = correctness(
+            *(attempt.answered, attempt.correct) if attempt else (0, 0)
+        )
+        return index.pick(self.seed, game_uid, displayed_ids, accuracy)
+
     @property
     def match_started(self):
         return self._game_factory.match_started
@@ -251,21 +495,87 @@ class SinglePlayer:
         question_reaction = match_reactions.filter_by(
             question_uid=question.uid, update_timestamp=None
         ).one_or_none()
-        if question_reaction:
+        if question_reaction and not self.reaction_dto.is_pending(question_reaction):
             return question_reaction
 
         return self._new_reaction(question, attempt_uid)
 
-    def react(self, question, answer=None, open_answer=None):
-        if not self._current_reaction:
-            self._current_reaction = self.last_reaction(question)
-            self._game_factory = GameFactory(
-                self._match, *self._status.all_games_played()
-            )
+    def start_progress(self, attempt_uid):
+        """The progress token of the attempt just started"""
+        self._progress = ProgressToken.now(
+            self._match,
+            self._user.uid,
+            attempt_uid,
+            self._game_factory.played_ids,
+            self._question_factory.displayed_ids,
+        )
+        return self._progress
+
+    def resume(self, progress):
+        """Restore the position of the player from the progress token"""
+        self._progress = progress
+        self.seed = progress.attempt_uid
+        self._game_factory = GameFactory(self._match, *progress.games, seed=self.seed)
+        self._question_factory = self._questions_of(
+            self._current_reaction.game, *progress.questions
+        )
+
+    @traced("player_status")
+    def _rebuild(self):
+        """Restore the position of the player from the reactions"""
+        self._game_factory = GameFactory(
+            self._match, *self._status.all_games_played(), seed=self.seed
+        )
+        self._question_factory = self._questions_of(
+            self._current_reaction.game, *self._status.questions_displayed()
+        )
+
+    def react_once(self, question, answer, open_answer, displayed_at, progress=None):
+        """
+        Insert the reaction with its answer, timed from the moment
+        the question was displayed. Unanswered questions are
+        inserted as well, so that the attempt stays complete.
+
+        The position is read from the progress token, if any,
+        otherwise from the reactions of the attempt
+        """
+        self._current_reaction = self.reaction_dto.new(
+            match_uid=self._match.uid,
+            question=question,
+            game_uid=question.game_uid,
+            user_uid=self._user.uid,
+            attempt_uid=self._status.current_attempt_uid,
+            create_timestamp=displayed_at,
+        )
+        was_correct = self.reaction_dto.record_answer(
+            self._current_reaction,
+            answer=answer,
+            open_answer=open_answer,
+            commit=False,
+        )
+        self.reaction_dto.save(self._current_reaction, counted=True)
+        self.answered(question, was_correct)
+
+        if progress:
+            self.resume(progress)
+        else:
+            self.seed = self._current_reaction.attempt_uid
+            self._rebuild()
+        self.end_now(was_correct)
+        return was_correct
 
-            self._question_factory = QuestionFactory(
-                self._current_reaction.game, *self._status.questions_displayed()
+    def react(
+        self, question, answer=None, open_answer=None, displayed_at=None, progress=None
+    ):
+        if displayed_at is not None:
+            return self.react_once(
+                question, answer, open_answer, displayed_at, progress
             )
+
+        if not self._current_reaction:
+            self._current_reaction = self.last_reaction(question)
+            self.seed = self._current_reaction.attempt_uid
+            self._rebuild()
         elif self._current_reaction.question != question:
             attempt_uid = self._current_reaction.attempt_uid
             self._current_reaction = self._new_reaction(question, attempt_uid)
@@ -273,6 +583,7 @@ class SinglePlayer:
         was_correct = self.reaction_dto.record_answer(
             self._current_reaction, answer=answer, open_answer=open_answer
         )
+        self.answered(question, was_correct)
         self.end_now(was_correct)
         return was_correct
 
@@ -280,30 +591,60 @@ class SinglePlayer:
     def current(self):
         return self._question_factory.current
 
+    def answered(self, question, was_correct):
+        if self._match.adaptive:
+            index = difficulty_indexes.index(self._match, self._session)
+            index.record(question.uid, was_correct)
+
     def end_now(self, was_correct):
         if not self._match.treasure_hunt or was_correct:
             return
 
         raise HuntOver("Hunt-treasure match over")
 
+    @traced("question_selection")
     def forward(self):
         try:
             return self._question_factory.next()
         except GameOver:
             game = self._game_factory.next()
-            self._question_factory = QuestionFactory(
-                game, *self._status.questions_displayed()
-            )
+            # the progress token holds the questions of the current game
+            displayed_ids = () if self._progress else self._status.questions_displayed()
+            self._question_factory = self._questions_of(game, *displayed_ids)
             return self._question_factory.next()
 
+    def progress(self):
+        """The token of the position reached, None at the end of the match"""
+        if not self._progress:
+            return
+
+        return ProgressToken.now(
+            self._match,
+            self._user.uid,
+            self._progress.attempt_uid,
+            self._game_factory.played_ids,
+            self._question_factory.displayed_ids,
+            step=self._progress.step + 1,
+            score=self.score(),
+            # checked against the match by the validation of /play/next
+            version=self._progress.version,
+        )
+
+    def score(self):
+        if not self._progress:
+            return self._status.current_score()
+        return self._progress.score + (self._current_reaction.score or 0)
+
 
 class PlayScore:
-    def __init__(self, match_uid, user_uid, score, db_session):
+    def __init__(self, match_uid, user_uid, score, db_session, attempt_uid=None):
         self.match_uid = match_uid
         self.user_uid = user_uid
         self.score = score
+        self.attempt_uid = attempt_uid
         self._session = db_session
 
+    @traced("save_to_ranking")
     def save_to_ranking(self):
         dto = RankingDTO(session=self._session)
         new_ranking = dto.new(
@@ -311,5 +652,25 @@ class PlayScore:
             user_uid=self.user_uid,
             score=self.score,
         )
+        PlayEventDTO(session=self._session).attempt_finished(
+            self.match_uid, self.user_uid, self.score, self.attempt_uid
+        )
+        if self.attempt_uid:
+            AttemptDTO(session=self._session).finish(self.attempt_uid)
         dto.save(new_ranking)
+        name = self._session.query(User.name).filter_by(uid=self.user_uid).scalar()
+        ranking_feeds.publish(self.match_uid, self.user_uid, self.score, name)
         return new_ranking
+
+
+def close_abandoned_attempts(since, before, db_session):
+    """Close the deferred attempts started between `since` and `before`"""
+    closed = 0
+    for attempt in AttemptDTO(session=db_session).abandoned(since, before):
+        match = db_session.get(Match, attempt.match_uid)
+        status = PlayerStatus(attempt.user, match, db_session=db_session)
+        player = SinglePlayer(
+            status, attempt.user, match, db_session=db_session, deferred=True
+        )
+        closed += player.close(attempt) is not None
+    return closed
@@ -0,0 +1,199 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import object_session
+
+from app.core.security import create_signed_token, decode_signed_token
+from app.domain_entities import Game, Question
+
+
+def _edited(entity, *criteria):
+    return (
+        select(
+            func.max(func.coalesce(entity.update_timestamp, entity.create_timestamp))
+        )
+        .where(*criteria)
+        .correlate(None)
+        .scalar_subquery()
+    )
+
+
+def content_edited(match_uid):
+    """
+    The last time a game and a question of the match were
+    created or edited, as two scalar subqueries
+    """
+    return (
+        _edited(Game, Game.match_uid == match_uid),
+        _edited(Question, Question.game_uid == Game.uid, Game.match_uid == match_uid),
+    )
+
+
+def match_version(match, edited=None):
+    """
+    Changes whenever the match, one of its games or one of its
+    questions is edited. `edited` are the timestamps selected by
+    content_edited(), when already fetched
+    """
+    if edited is None:
+        edited = object_session(match).execute(select(*content_edited(match.uid))).one()
+    edited_at = max(
+        # SQLite gives the timestamps back without their timezone
+        value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+        for value in (match.update_timestamp or match.create_timestamp, *edited)
+        if value is not None
+    )
+    return int(edited_at.timestamp() * 1000)
+
+
+class DisplayToken:
+    """
+    When a question was displayed to the player, signed by the
+    server so that the client can hold it until the answer
+    """
+
+    kind = "display"
+
+    def __init__(self, match_uid, user_uid, attempt_uid, question_uid, displayed_at):
+        self.match_uid = match_uid
+        self.user_uid = user_uid
+        self.attempt_uid = attempt_uid
+        self.question_uid = question_uid
+        self.displayed_at = displayed_at
+
+    @classmethod
+    def now(cls, match_uid, user_uid, attempt_uid, question_uid):
+        displayed_at = datetime.now(tz=timezone.utc)
+        return cls(match_uid, user_uid, attempt_uid, question_uid, displayed_at)
+
+    @property
+    def key(self):
+        return self.match_uid, self.user_uid, self.attempt_uid, self.question_uid
+
+    def claims(self):
+        return {
+            "k": self.kind,
+            "m": self.match_uid,
+            "u": self.user_uid,
+            "a": self.attempt_uid,
+            "q": self.question_uid,
+            "t": self.displayed_at.timestamp(),
+        }
+
+    @classmethod
+    def from_claims(cls, claims):
+        displayed_at = datetime.fromtimestamp(claims["t"], tz=timezone.utc)
+        return cls(claims["m"], claims["u"], claims["a"], claims["q"], displayed_at)
+
+    def encode(self):
+        return create_signed_token(self.claims())
+
+    @classmethod
+    def decode(cls, token):
+        claims = decode_signed_token(token)
+        if not claims or claims.get("k") != cls.kind:
+            return
+        return cls.from_claims(claims)
+
+
+class ProgressToken(DisplayToken):
+    """
+    Where the player is within the attempt: the games played,
+    the questions displayed of the current game, the last one
+    being the current, and the score so far. The step grows by
+    one at each answer, and is played once, and the version
+    ties the token to the match as it was
+    """
+
+    kind = "progress"
+
+    def __init__(
+        self,
+        match_uid,
+        user_uid,
+        attempt_uid,
+        displayed_at,
+        version,
+        step=0,
+        score=0,
+        games=(),
+        questions=(),
+    ):
+        super().__init__(match_uid, user_uid, attempt_uid, questions[-1], displayed_at)
+        self.version = version
+        self.step = step
+        self.score = score
+        self.games = tuple(games)
+        self.questions = tuple(questions)
+
+    @classmethod
+    def now(
+        cls,
+        match,
+        user_uid,
+        attempt_uid,
+        games,
+        questions,
+        step=0,
+        score=0,
+        version=None,
+    ):
+        """`version` is that of the match, when already computed"""
+        return cls(
+            match.uid,
+            user_uid,
+            attempt_uid,
+            datetime.now(tz=timezone.utc),
+            match_version(match) if version is None else version,
+            step=step,
+            score=score,
+            games=games,
+            questions=questions,
+        )
+
+    def claims(self):
+        claims = super().claims()
+        claims.update(
+            v=self.version,
+            s=self.step,
+            p=self.score,
+            g=list(self.games),
+            d=list(self.questions),
+        )
+        return claims
+
+    @classmethod
+    def from_claims(cls, claims):
+        return cls(
+            claims["m"],
+            claims["u"],
+            claims["a"],
+            datetime.fromtimestamp(claims["t"], tz=timezone.utc),
+            claims["v"],
+            step=claims["s"],
+            score=claims["p"],
+            games=claims["g"],
+            questions=claims["d"],
+        )
+
+
+class LiveToken:
+    """The player admitted to a live match by /live/join, signed"""
+
+    kind = "live"
+
+    def __init__(self, match_uid, user_uid):
+        self.match_uid = match_uid
+        self.user_uid = user_uid
+
+    def encode(self):
+        return create_signed_token(
+            {"k": self.kind, "m": self.match_uid, "u": self.user_uid}
+        )
+
+    @classmethod
+    def decode(cls, token):
+        claims = decode_signed_token(token)
+        if not claims or claims.get("k") != cls.kind:
+            return
+        return cls(claims["m"], claims["u"])
@@ -3,6 +3,7 @@ from typing import Callable
 from fastapi import HTTPException, status
 from sqlalchemy.orm import Session
 
+from app.core.tracing import span
 from app.domain_service.data_transfer.answer import AnswerDTO
 from app.domain_service.data_transfer.game import GameDTO
 from app.domain_service.data_transfer.match import MatchDTO
@@ -12,6 +13,14 @@ from app.exceptions import NotFoundObjectError, ValidateError
 
 
 class RetrieveObject:
+    """
+    Retrieve an object by its uid
+
+    The lookup goes through the session identity map, so an
+    object already loaded during the request (the session lives
+    as long as the request) is returned without querying the DB
+    """
+
     def __init__(self, uid: int, otype: str, db_session: Session):
         self.object_uid = uid
         self.otype = otype
@@ -26,7 +35,7 @@ class RetrieveObject:
             "user": UserDTO,
         }.get(self.otype)
 
-        obj = klass(self.db_session).get(uid=self.object_uid)
+        obj = klass(self.db_session).get_by_uid(self.object_uid)
         if obj:
             return obj
         raise NotFoundObjectError(
@@ -40,7 +49,8 @@ class LogicValidation:
 
     def validate(self, **validation_kwargs):
         try:
-            return self.schema_callable(**validation_kwargs).is_valid()
+            with span("validation", schema=self.schema_callable.__name__):
+                return self.schema_callable(**validation_kwargs).is_valid()
         except (NotFoundObjectError, ValidateError) as exc:
             if isinstance(exc, NotFoundObjectError):
                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND) from exc
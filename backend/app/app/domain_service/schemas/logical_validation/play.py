@@ -1,8 +1,19 @@
+from sqlalchemy import bindparam, func, select
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
+from app.domain_entities import Answer, Game, Match, Question, Reaction, User
+from app.domain_service.data_transfer.attempt import AttemptDTO
 from app.domain_service.data_transfer.match import MatchDTO
 from app.domain_service.data_transfer.open_answer import OpenAnswerDTO
 from app.domain_service.data_transfer.user import UserDTO, WordDigest
+from app.domain_service.data_transfer.write_behind import reaction_buffer
+from app.domain_service.play.tokens import (
+    DisplayToken,
+    ProgressToken,
+    content_edited,
+    match_version,
+)
 from app.domain_service.schemas.logical_validation import RetrieveObject
 from app.exceptions import NotFoundObjectError, ValidateError
 
@@ -72,9 +83,11 @@ class ValidatePlayStart:
         self.password = kwargs.get("password")
 
     def valid_user(self):
-        dto = UserDTO(session=self._session)
-        user = dto.get(uid=self.user_uid)
-        if self.user_uid and not user:
+        if not self.user_uid:
+            return
+
+        user = UserDTO(session=self._session).get_by_uid(self.user_uid)
+        if not user:
             raise NotFoundObjectError()
         return user
 
@@ -108,6 +121,64 @@ class ValidatePlayStart:
         return data
 
 
+def _count(column, *criteria):
+    return select(func.count(column)).where(*criteria).scalar_subquery()
+
+
+def _play_next_facts(progress=False):
+    """
+    The statement of ValidatePlayNext.facts(), built once with
+    bound parameters, so that every /play/next reuses both the
+    statement and its compiled form. With `progress` tokens, the
+    last edits of the games and questions of the match are
+    selected too, to check the version of the token against
+    """
+    attempt_reactions = (
+        Reaction.user_uid == bindparam("user_uid"),
+        Reaction.attempt_uid == bindparam("attempt_uid"),
+    )
+    question_reactions = attempt_reactions + (
+        Reaction.question_uid == bindparam("question_uid"),
+    )
+    edited = ()
+    if progress:
+        games_edited, questions_edited = content_edited(bindparam("match_uid"))
+        edited = (
+            games_edited.label("games_edited"),
+            questions_edited.label("questions_edited"),
+        )
+    return (
+        select(
+            Match,
+            Question,
+            Game.match_uid.label("question_match_uid"),
+            Answer,
+            User,
+            _count(Answer.uid, Answer.question_uid == bindparam("question_uid")).label(
+                "answers_count"
+            ),
+            _count(Reaction.uid, *attempt_reactions).label("attempt_reactions"),
+            _count(
+                Reaction.uid, *question_reactions, Reaction.answer_uid.isnot(None)
+            ).label("answered"),
+            _count(
+                Reaction.uid, *question_reactions, Reaction.open_answer_uid.isnot(None)
+            ).label("open_answered"),
+            *edited,
+        )
+        .select_from(Match)
+        .outerjoin(Question, Question.uid == bindparam("question_uid"))
+        .outerjoin(Game, Game.uid == Question.game_uid)
+        .outerjoin(Answer, Answer.uid == bindparam("answer_uid"))
+        .outerjoin(User, User.uid == bindparam("user_uid"))
+        .where(Match.uid == bindparam("match_uid"))
+    )
+
+
+PLAY_NEXT_FACTS = _play_next_facts()
+PLAY_NEXT_PROGRESS_FACTS = _play_next_facts(progress=True)
+
+
 class ValidatePlayNext:
     def __init__(self, db_session: Session, **kwargs):
         self._session = db_session
@@ -117,6 +188,8 @@ class ValidatePlayNext:
         self.question_uid = kwargs.get("question_uid")
         self.answer_text = kwargs.get("answer_text")
         self.attempt_uid = kwargs.get("attempt_uid")
+        self.display_token = kwargs.get("display_token")
+        self.progress_token = kwargs.get("progress_token")
         self._data = {}
         self.user_dto = UserDTO(session=db_session)
 
@@ -130,6 +203,8 @@ class ValidatePlayNext:
         ).one_or_none()
         if reaction and reaction.answer:  # TODO and not question.is_open:
             raise ValidateError("Duplicate Reactions")
+        if self.answer_pending(question.uid):
+            raise ValidateError("Duplicate Reactions")
         return self.attempt_uid
 
     def valid_answer(self, question):
@@ -180,18 +255,116 @@ class ValidatePlayNext:
             return question
         raise ValidateError("Invalid question")
 
+    def facts(self):
+        """
+        Fetch with one statement all the rows and counters the
+        validation depends on. None is returned if the match
+        does not exist, while the other entities are outer-joined
+        """
+        return self._session.execute(
+            PLAY_NEXT_PROGRESS_FACTS if settings.PROGRESS_TOKENS else PLAY_NEXT_FACTS,
+            {
+                "match_uid": self.match_uid,
+                "question_uid": self.question_uid,
+                "answer_uid": self.answer_uid,
+                "user_uid": self.user_uid,
+                "attempt_uid": self.attempt_uid,
+            },
+        ).one_or_none()
+
+    def valid_display_token(self):
+        """
+        Return the display time the token was signed with, which
+        also vouches for an attempt that has no reactions yet
+        """
+        if self.display_token is None:
+            return
+
+        token = DisplayToken.decode(self.display_token)
+        expected = (self.match_uid, self.user_uid, self.attempt_uid, self.question_uid)
+        if not token or token.key != expected:
+            raise ValidateError("Invalid display-token")
+        return token.displayed_at
+
+    def valid_progress_token(self, match, edited=None):
+        if self.progress_token is None:
+            return
+
+        token = ProgressToken.decode(self.progress_token)
+        expected = (self.match_uid, self.user_uid, self.attempt_uid, self.question_uid)
+        if not token or token.key != expected:
+            raise ValidateError("Invalid progress-token")
+        if token.version != match_version(match, edited):
+            raise ValidateError("The match was edited")
+        return token
+
+    def answer_pending(self, question_uid):
+        """Whether the answer is still in the write-behind buffer"""
+        buffer = reaction_buffer()
+        return buffer is not None and buffer.answered(self.attempt_uid, question_uid)
+
+    def not_found(self, otype, uid):
+        return NotFoundObjectError(f"{otype} with Id:: {uid} does not exist")
+
     def is_valid(self):
-        # expected to run in sequence
-        match = self.valid_match()
+        """
+        Apply the same rules of the valid_* methods, in the
+        same order, to the facts fetched by a single query
+        """
+        facts = self.facts()
+        if not facts:
+            raise self.not_found("Match", self.match_uid)
+
+        match = facts.Match
+        if not match.is_active:
+            raise ValidateError("Expired match")
         self._data["match"] = match
-        question = self.valid_question(match)
+
+        question = facts.Question
+        if not question:
+            raise self.not_found("Question", self.question_uid)
+        if facts.question_match_uid != match.uid:
+            raise ValidateError("Invalid question")
         self._data["question"] = question
-        answer = self.valid_answer(question)
+
+        answer = None
+        if self.answer_uid is not None:
+            answer = facts.Answer
+            if not answer:
+                raise self.not_found("Answer", self.answer_uid)
+            if answer.question_uid != question.uid:
+                raise ValidateError("Invalid answer")
         self._data["answer"] = answer
-        open_answer = self.valid_open_answer(question)
+
+        question_is_open = facts.answers_count == 0
+        open_answer = None
+        if self.answer_text is not None:
+            if not question_is_open:
+                raise ValidateError("Invalid answer")
+
+            open_answer_dto = OpenAnswerDTO(session=self._session)
+            open_answer = open_answer_dto.new(text=self.answer_text)
+            open_answer_dto.save(open_answer)
         self._data["open_answer"] = open_answer
-        user = self.valid_user()
-        self._data["user"] = user
-        attempt_uid = self.valid_reaction(user=user, question=question)
-        self._data["attempt_uid"] = attempt_uid
+
+        if not facts.User:
+            raise self.not_found("User", self.user_uid)
+        self._data["user"] = facts.User
+
+        edited = None
+        if settings.PROGRESS_TOKENS:
+            edited = facts.games_edited, facts.questions_edited
+        progress = self.valid_progress_token(match, edited)
+        displayed_at = progress.displayed_at if progress else self.valid_display_token()
+        self._data["displayed_at"] = displayed_at
+        self._data["progress"] = progress
+        if facts.attempt_reactions == 0 and not displayed_at:
+            raise ValidateError("Invalid attempt-uid")
+        answered = facts.open_answered if question_is_open else facts.answered
+        if answered or self.answer_pending(question.uid):
+            raise ValidateError("Duplicate Reactions")
+        attempts = AttemptDTO(session=self._session)
+        if progress and not attempts.advance(self.attempt_uid, progress.step):
+            raise ValidateError("Outdated progress-token")
+        self._data["attempt_uid"] = self.attempt_uid
         return self._data
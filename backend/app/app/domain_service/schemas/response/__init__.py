@@ -2,10 +2,15 @@ from app.domain_service.schemas.response.answer import Answer  # noqa: F401
 from app.domain_service.schemas.response.game import Game  # noqa: F401
 from app.domain_service.schemas.response.match import (  # noqa: F401
     Match,
+    MatchDashboard,
     Matches,
+    MatchLive,
     MatchRanking,
+    MatchStats,
 )
 from app.domain_service.schemas.response.play import (  # noqa: F401
+    LiveJoinResponse,
+    LiveNextResponse,
     NextResponse,
     SignResponse,
     StartResponse,
@@ -14,8 +19,14 @@ from app.domain_service.schemas.response.play import (  # noqa: F401
 from app.domain_service.schemas.response.question import (  # noqa: F401
     ManyQuestions,
     Question,
+    QuestionStats,
 )
 from app.domain_service.schemas.response.reaction import Reaction  # noqa: F401
-from app.domain_service.schemas.response.user import Player, Players  # noqa: F401
+from app.domain_service.schemas.response.user import (  # noqa: F401
+    MatchPlayer,
+    MatchPlayers,
+    Player,
+    Players,
+)
 
 from .token import Token, TokenPayload  # noqa: F401
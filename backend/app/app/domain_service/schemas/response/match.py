@@ -1,8 +1,9 @@
 from datetime import datetime
 from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, NonNegativeInt, PositiveInt
 
+from app.domain_service.schemas.response.question import QuestionStats, ResponseTime
 from app.domain_service.schemas.syntax_validation.game import Game
 from app.domain_service.schemas.syntax_validation.question import Question
 
@@ -42,6 +43,9 @@ class Match(BaseModel):
     from_time: Optional[datetime]
     times: Optional[int]
     order: Optional[bool]
+    adaptive: Optional[bool]
+    sample: Optional[int]
+    sample_levels: Optional[List[int]]
     is_open: Optional[bool]
     expires: Optional[datetime]
     questions_list: List[Question] = None
@@ -53,3 +57,52 @@ class Match(BaseModel):
 
 class Matches(BaseModel):
     matches: List[Match] = []
+
+
+class MatchStats(BaseModel):
+    match_uid: PositiveInt
+    attempts: NonNegativeInt
+    correct: NonNegativeInt
+    correct_rate: Optional[float]
+    response_time: ResponseTime
+    questions: List[QuestionStats] = []
+
+
+class ScoreBin(BaseModel):
+    low: float
+    high: float
+    attempts: NonNegativeInt
+
+
+class QuestionDropOff(BaseModel):
+    question_uid: PositiveInt
+    displayed: NonNegativeInt
+    answered: NonNegativeInt
+
+
+class GameTime(BaseModel):
+    game_uid: PositiveInt
+    average_seconds: float
+
+
+class HourAttempts(BaseModel):
+    hour: datetime
+    attempts: NonNegativeInt
+
+
+class MatchDashboard(BaseModel):
+    match_uid: PositiveInt
+    reactions: NonNegativeInt
+    attempts: NonNegativeInt
+    score_distribution: List[ScoreBin] = []
+    drop_off: List[QuestionDropOff] = []
+    funnel: List[NonNegativeInt] = []
+    time_per_game: List[GameTime] = []
+    attempts_per_hour: List[HourAttempts] = []
+
+
+class MatchLive(BaseModel):
+    match_uid: PositiveInt
+    active_players: NonNegativeInt
+    answers_per_minute: float
+    unique_players: NonNegativeInt
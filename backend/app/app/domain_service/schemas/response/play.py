@@ -37,6 +37,8 @@ class StartResponse(BaseModel):
     question: Question
     user_uid: PositiveInt
     attempt_uid: str
+    display_token: Optional[str]
+    progress_token: Optional[str]
 
 
 class NextResponse(BaseModel):
@@ -45,6 +47,8 @@ class NextResponse(BaseModel):
     user_uid: Optional[PositiveInt]
     score: Optional[float]
     was_correct: bool = None
+    display_token: Optional[str]
+    progress_token: Optional[str]
 
     def dict(self, *args, **kwargs):
         return super(NextResponse, self).dict(exclude_unset=True)
@@ -52,3 +56,14 @@ class NextResponse(BaseModel):
 
 class SignResponse(BaseModel):
     user: PositiveInt
+
+
+class LiveJoinResponse(BaseModel):
+    match_uid: PositiveInt
+    user_uid: PositiveInt
+    live_token: str
+
+
+class LiveNextResponse(BaseModel):
+    match_uid: PositiveInt
+    question: Question = None
@@ -1,4 +1,4 @@
-from typing import List
+from typing import Dict, List, Optional
 
 from pydantic import BaseModel, NonNegativeInt, PositiveInt
 
@@ -23,3 +23,18 @@ class Question(BaseModel):
 
 class ManyQuestions(BaseModel):
     questions: List[Question]
+
+
+class ResponseTime(BaseModel):
+    p50: Optional[float]
+    p90: Optional[float]
+    p99: Optional[float]
+
+
+class QuestionStats(BaseModel):
+    question_uid: PositiveInt
+    attempts: NonNegativeInt
+    correct: NonNegativeInt
+    correct_rate: Optional[float]
+    answers: Dict[str, int] = {}
+    response_time: ResponseTime
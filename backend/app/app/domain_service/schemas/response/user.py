@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import List, Optional
 
 from pydantic import BaseModel, EmailStr
@@ -27,3 +28,13 @@ class Player(BaseModel):
 
 class Players(BaseModel):
     players: List[Player]
+
+
+class MatchPlayer(Player):
+    best_score: Optional[float] = None
+    attempts: Optional[int] = None
+    last_played: Optional[datetime] = None
+
+
+class MatchPlayers(BaseModel):
+    players: List[MatchPlayer]
@@ -1,3 +1,6 @@
+from app.domain_service.schemas.syntax_validation.admin import (  # noqa: F401
+    ArmProfiler,
+)
 from app.domain_service.schemas.syntax_validation.answer import (  # noqa: F401
     Answer,
     AnswerCreate,
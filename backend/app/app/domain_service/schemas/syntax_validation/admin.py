@@ -0,0 +1,10 @@
+from typing import Optional
+
+from pydantic import BaseModel, PositiveInt, conint
+
+
+class ArmProfiler(BaseModel):
+    requests: conint(gt=0, le=100) = 1
+    # profile only the requests whose path starts with it
+    route: Optional[str] = None
+    match_uid: Optional[PositiveInt] = None
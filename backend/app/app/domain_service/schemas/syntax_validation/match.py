@@ -17,6 +17,9 @@ class MatchCreate(BaseModel):
     to_time: Optional[datetime]
     is_restricted: Optional[bool]
     order: Optional[bool]
+    adaptive: Optional[bool]
+    sample: Optional[PositiveInt]
+    sample_levels: Optional[List[int]]
     questions: List[QuestionCreate] = None
 
 
@@ -30,6 +33,9 @@ class MatchEdit(BaseModel):
     times: Optional[int]
     is_restricted: Optional[bool]
     order: Optional[bool]
+    adaptive: Optional[bool]
+    sample: Optional[PositiveInt]
+    sample_levels: Optional[List[int]]
     from_time: Optional[datetime]
     to_time: Optional[datetime]
     questions: List[QuestionCreate] = None
@@ -50,6 +56,10 @@ class ImportQuestions(BaseModel):
     uid: PositiveInt
     questions: List[PositiveInt] = None
     game_uid: PositiveInt = None
+    # draw this many templates instead of listing them
+    sample: PositiveInt = None
+    seed: str = None
+    levels: List[int] = None
 
 
 class FileContent(BaseModel):
@@ -64,6 +64,8 @@ class NextPlay(BaseModel):
     question_uid: PositiveInt
     answer_text: str = None
     attempt_uid: str
+    display_token: str = None
+    progress_token: str = None
 
     @validator("attempt_uid")
     def valid(cls, v):
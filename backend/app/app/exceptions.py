@@ -46,3 +46,23 @@ class ValidateError(InternalException):
 
 class NotFoundObjectError(InternalException):
     """"""
+
+
+class LiveHostError(InternalException):
+    """The live match is hosted by another worker"""
+
+
+class LiveHostUserError(InternalException):
+    """The live match is hosted by another user"""
+
+
+class LiveMatchOverError(InternalException):
+    """The live match was already played to its end"""
+
+
+class LiveCountersError(InternalException):
+    """The live counters could not be read"""
+
+
+class IncompletePlayEventsError(InternalException):
+    """The play events log misses some rankings of the match"""
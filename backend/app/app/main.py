@@ -6,9 +6,15 @@ from starlette.middleware.cors import CORSMiddleware
 
 from app.api.api_v1.api import api_router
 from app.core.config import CsrfSettings, settings
+from app.core.profiling import ProfilerMiddleware
+from app.core.sql_metrics import SQLBudgetMiddleware, instrument
+from app.core.tracing import TracedJSONResponse, TracingMiddleware
+from app.domain_entities.db.session import engine
 
 app = FastAPI(
-    title=settings.PROJECT_NAME, openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    title=settings.PROJECT_NAME,
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    default_response_class=TracedJSONResponse,
 )
 
 # Set all CORS enabled origins
@@ -21,6 +27,11 @@ if settings.BACKEND_CORS_ORIGINS:
         allow_headers=["*"],
     )
 
+app.add_middleware(SQLBudgetMiddleware)
+app.add_middleware(TracingMiddleware)
+app.add_middleware(ProfilerMiddleware)
+instrument(engine)
+
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
 
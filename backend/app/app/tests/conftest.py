@@ -12,6 +12,7 @@ from sqlalchemy.pool import StaticPool
 from app.api.deps import get_current_user
 from app.core import security
 from app.core.config import settings
+from app.core.sql_metrics import instrument
 from app.domain_entities.db.base import Base
 from app.domain_entities.db.session import get_db
 from app.domain_service.data_transfer.answer import AnswerDTO
@@ -30,6 +31,7 @@ test_engine = create_engine(
     connect_args={"check_same_thread": False},
     poolclass=StaticPool,
 )
+instrument(test_engine)
 
 
 def init_db():
@@ -183,6 +185,12 @@ def user_dto(db_session) -> UserDTO:
     return UserDTO(session=db_session)
 
 
+@pytest.fixture
+def admin_user(user_dto):
+    """The user of the overridden authentication, when created first"""
+    return user_dto.save(user_dto.new(email="admin@test.project", is_admin=True))
+
+
 @pytest.fixture
 def answer_dto(db_session):
     return AnswerDTO(session=db_session)
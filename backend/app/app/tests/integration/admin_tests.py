@@ -0,0 +1,117 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.core.profiling import profiler
+from app.core.slow_queries import fingerprint
+
+
+@pytest.fixture
+def clean_profiler():
+    profiler.disarm()
+    profiler.profiles.clear()
+    yield profiler
+    profiler.disarm()
+    profiler.profiles.clear()
+
+
+class TestCaseMetrics:
+    def test_1(self, ase_client: TestClient, user_dto):
+        """
+        GIVEN: a user who is not an admin
+        WHEN: the SQL metrics are requested
+        THEN: they are denied
+        """
+        user_dto.save(user_dto.new(email="user@test.project"))
+        response = ase_client.get(f"{settings.API_V1_STR}/admin/metrics")
+        assert response.status_code == 403
+
+
+class TestCaseProfiler:
+    def test_1(self, ase_client: TestClient, admin_user, trivia_match, clean_profiler):
+        """
+        GIVEN: the profiler armed for one request of a match
+        WHEN: requests of that and other matches are served
+        THEN: only the first matching one is profiled, with its SQL and plans
+        """
+        response = ase_client.post(
+            f"{settings.API_V1_STR}/admin/profiler",
+            json={
+                "route": f"{settings.API_V1_STR}/matches",
+                "match_uid": trivia_match.uid,
+            },
+        )
+        assert response.ok
+        assert response.json()["remaining"] == 1
+
+        ase_client.get(f"{settings.API_V1_STR}/matches/{trivia_match.uid + 1}")
+        ase_client.get(f"{settings.API_V1_STR}/matches/{trivia_match.uid}")
+        ase_client.get(f"{settings.API_V1_STR}/matches/{trivia_match.uid}")
+
+        response = ase_client.get(f"{settings.API_V1_STR}/admin/profiler")
+        assert response.json()["remaining"] == 0
+        (profile,) = response.json()["profiles"]
+        assert profile["path"] == f"{settings.API_V1_STR}/matches/{trivia_match.uid}"
+        assert profile["statements"] > 0
+
+        response = ase_client.get(
+            f"{settings.API_V1_STR}/admin/profiler/{profile['uid']}/sql"
+        )
+        statements = response.json()
+        assert statements[0]["statement"].startswith("SELECT")
+        assert isinstance(statements[0]["plan"], list)
+
+        response = ase_client.get(
+            f"{settings.API_V1_STR}/admin/profiler/{profile['uid']}/speedscope"
+        )
+        assert response.ok
+        assert response.json()["profiles"][0]["type"] == "sampled"
+        response = ase_client.get(f"{settings.API_V1_STR}/admin/profiler/100/sql")
+        assert response.status_code == 404
+
+    def test_2(self, ase_client: TestClient, user_dto, clean_profiler):
+        """
+        GIVEN: a user who is not an admin
+        WHEN: they arm the profiler or read a profile
+        THEN: they are denied
+        """
+        user_dto.save(user_dto.new(email="user@test.project"))
+        response = ase_client.post(
+            f"{settings.API_V1_STR}/admin/profiler", json={"requests": 1}
+        )
+        assert response.status_code == 403
+        response = ase_client.get(f"{settings.API_V1_STR}/admin/profiler/1/sql")
+        assert response.status_code == 403
+        assert not clean_profiler.armed
+
+
+class TestCaseSlowQueries:
+    def test_1(self, ase_client: TestClient, admin_user, trivia_match):
+        """
+        GIVEN: requests served by the API
+        WHEN: the slow queries are listed
+        THEN: their statements are grouped by fingerprint with their percentiles
+        """
+        ase_client.get(f"{settings.API_V1_STR}/matches/{trivia_match.uid}")
+        response = ase_client.get(
+            f"{settings.API_V1_STR}/admin/slow-queries?limit=5&order=count"
+        )
+        assert response.ok
+        rows = response.json()
+        assert 0 < len(rows) <= 5
+        assert rows[0]["count"] >= rows[-1]["count"]
+        assert rows[0]["fingerprint"] == fingerprint(rows[0]["statement"])[0]
+        assert rows[0]["p50_ms"] <= rows[0]["p99_ms"]
+
+        response = ase_client.get(f"{settings.API_V1_STR}/admin/slow-queries?order=x")
+        assert response.status_code == 422
+
+    def test_2(self, ase_client: TestClient, user_dto):
+        """
+        GIVEN: a user who is not an admin
+        WHEN: the slow queries are listed
+        THEN: they are denied
+        """
+        user_dto.save(user_dto.new(email="user@test.project"))
+        response = ase_client.get(f"{settings.API_V1_STR}/admin/slow-queries")
+        assert response.status_code == 403
@@ -0,0 +1,263 @@
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import WebSocketDisconnect, status
+from fastapi.testclient import TestClient
+
+from app.api.api_v1.endpoints.live import live_registry
+from app.core.config import settings
+from app.domain_entities import Ranking, Reaction
+from app.domain_service.play import (
+    LiveHost,
+    LiveRegistry,
+    LiveRoom,
+    LiveToken,
+    LocalRelay,
+)
+from app.exceptions import LiveHostError, LiveHostUserError, LiveMatchOverError
+
+
+class TestCaseLiveMatch:
+    def join(self, client, match_uid, **payload):
+        response = client.post(
+            f"{settings.API_V1_STR}/live/join",
+            json={"match_uid": match_uid, **payload},
+        )
+        assert response.ok
+        return response.json()["live_token"]
+
+    def test_1(
+        self,
+        ase_client: TestClient,
+        db_session,
+        match_dto,
+        game_dto,
+        question_dto,
+        user_dto,
+    ):
+        """
+        GIVEN: a match with two questions and a connected player
+        WHEN: the host moves through the questions
+        THEN: the player receives each question and its results,
+                the answers are recorded and the ranking is saved
+        """
+        match = match_dto.save(match_dto.new(notify_correct=True))
+        game = game_dto.save(game_dto.new(match_uid=match.uid, index=0))
+        first = question_dto.new(text="1+1", game_uid=game.uid, position=0)
+        question_dto.create_with_answers(first, [{"text": "2"}, {"text": "3"}])
+        second = question_dto.new(text="2+2", game_uid=game.uid, position=1)
+        question_dto.create_with_answers(second, [{"text": "4"}, {"text": "5"}])
+        user = user_dto.fetch()
+        match_uid, user_uid = match.uid, user.uid
+        right_answer = first.answers_by_position[0].uid
+        wrong_answer = second.answers_by_position[1].uid
+
+        client = ase_client
+        token = self.join(client, match_uid, user_uid=user_uid)
+        url = f"{settings.API_V1_STR}/live/{match_uid}"
+        with client.websocket_connect(f"{url}?token={token}") as ws:
+            response = client.post(f"{url}/next")
+            assert response.ok
+            assert response.json()["question"]["uid"] == first.uid
+            message = ws.receive_json()
+            assert message["type"] == "question"
+            assert message["question"]["uid"] == first.uid
+
+            ws.send_json({"answer_uid": right_answer})
+            assert ws.receive_json() == {"type": "received"}
+            response = client.post(f"{url}/next")
+            assert response.json()["question"]["uid"] == second.uid
+            message = ws.receive_json()
+            assert message["type"] == "results"
+            assert message["correct"] == [right_answer]
+            assert message["scores"] == {str(user_uid): 1}
+            assert ws.receive_json()["question"]["uid"] == second.uid
+
+            ws.send_json({"answer_uid": wrong_answer})
+            assert ws.receive_json() == {"type": "received"}
+            response = client.post(f"{url}/next")
+            assert response.json()["question"] is None
+            assert ws.receive_json()["type"] == "results"
+            assert ws.receive_json() == {"type": "over", "scores": {str(user_uid): 1}}
+            response = client.post(f"{url}/next")
+            assert response.status_code == 400
+            assert response.json()["detail"] == f"Match {match_uid} is over"
+
+        reactions = db_session.query(Reaction).filter_by(user_uid=user_uid).all()
+        assert [r.answer_uid for r in reactions] == [right_answer, wrong_answer]
+        assert len({r.attempt_uid for r in reactions}) == 1
+        ranking = db_session.query(Ranking).one()
+        assert (ranking.user_uid, ranking.score) == (user_uid, 1)
+
+    def test_2(self, ase_client: TestClient, match_dto, user_dto):
+        """
+        GIVEN: a live match
+        WHEN: a player connects without a valid token of that match
+        THEN: the socket is closed
+        """
+        match = match_dto.save(match_dto.new())
+        user = user_dto.fetch()
+        token = LiveToken(match.uid + 1, user.uid).encode()
+        for query in (f"user_uid={user.uid}", "token=abc", f"token={token}"):
+            url = f"{settings.API_V1_STR}/live/{match.uid}?{query}"
+            with pytest.raises(WebSocketDisconnect) as err:
+                with ase_client.websocket_connect(url):
+                    pass
+            assert err.value.code == status.WS_1008_POLICY_VIOLATION
+
+    def test_3(self, ase_client: TestClient, match_dto):
+        """
+        GIVEN: a restricted match and an expired one
+        WHEN: players join them
+        THEN: the same rules of /play/start apply, also to the host
+        """
+        restricted = match_dto.save(match_dto.new(is_restricted=True))
+        url = f"{settings.API_V1_STR}/live/join"
+        response = ase_client.post(url, json={"match_uid": restricted.uid})
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Password is required for private matches"
+        self.join(ase_client, restricted.uid, password=restricted.password)
+
+        expired = match_dto.save(
+            match_dto.new(to_time=datetime.now() - timedelta(hours=1))
+        )
+        response = ase_client.post(url, json={"match_uid": expired.uid})
+        assert response.json()["detail"] == "Expired match"
+        response = ase_client.post(f"{settings.API_V1_STR}/live/{expired.uid}/next")
+        assert response.status_code == 400
+
+    def test_4(self, ase_client: TestClient, match_dto):
+        """
+        GIVEN: a connected player
+        WHEN: a frame that is not a JSON answer is sent and the socket closed
+        THEN: the player is told so and then removed from the room
+        """
+        match = match_dto.save(match_dto.new())
+        token = self.join(ase_client, match.uid)
+        url = f"{settings.API_V1_STR}/live/{match.uid}?token={token}"
+        with ase_client.websocket_connect(url) as ws:
+            ws.send_text("not json")
+            assert ws.receive_json() == {"type": "invalid"}
+            ws.send_json([1])
+            assert ws.receive_json() == {"type": "invalid"}
+        # the server side of the socket closes after the client
+        deadline = time.monotonic() + 1
+        while match.uid in live_registry.rooms and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert match.uid not in live_registry.rooms
+
+
+class TestCaseLiveRoom:
+    class Socket:
+        def __init__(self, fail=False):
+            self.fail = fail
+            self.received = []
+
+        async def send_text(self, data):
+            if self.fail:
+                raise RuntimeError("socket closed")
+            self.received.append(json.loads(data))
+
+    def test_1(self):
+        """
+        GIVEN: two connected players, one of which has a broken socket
+        WHEN: a message is published
+        THEN: it reaches the first player and the second one is dropped
+        """
+        relay = LocalRelay()
+        room = LiveRoom(1, relay)
+        healthy, broken = self.Socket(), self.Socket(fail=True)
+
+        async def run():
+            await room.open()
+            await room.connect(1, healthy)
+            await room.connect(2, broken)
+            await relay.publish("live:1:out", json.dumps({"type": "question"}))
+
+        asyncio.run(run())
+        assert healthy.received == [{"type": "question"}]
+        assert room.players == [1]
+
+
+class TestCaseLiveHost:
+    def test_1(self):
+        """
+        GIVEN: a host collecting the answers to a question
+        WHEN: the question is closed while answers keep arriving
+        THEN: the answers given before are all returned, the later ones dropped
+        """
+        host = LiveHost(1, LocalRelay())
+        host._question_uid = 10
+
+        def answer(user_uid):
+            return json.dumps(
+                {
+                    "type": "answer",
+                    "user_uid": user_uid,
+                    "answer_uid": 5,
+                    "answered_at": datetime.now().isoformat(),
+                }
+            )
+
+        asyncio.run(host.receive(answer(1)))
+        question_uid, answers, attempts = host.close_question()
+        asyncio.run(host.receive(answer(2)))
+        assert question_uid == 10
+        assert list(answers) == [1]
+        assert list(attempts) == [1]
+        assert host.close_question() == (None, {}, host.attempts)
+
+    def test_2(self):
+        """
+        GIVEN: a live match hosted by another worker
+        WHEN: this worker is asked to host it
+        THEN: it refuses instead of starting the match again
+        """
+
+        class Relay(LocalRelay):
+            async def claim(self, key, owner):
+                return False
+
+        with pytest.raises(LiveHostError):
+            asyncio.run(LiveRegistry(Relay()).host(1))
+
+    def test_3(self):
+        """
+        GIVEN: a live match hosted by a user
+        WHEN: another user hosts it, on this worker or another one
+        THEN: they are refused as not its host
+        """
+
+        class Relay(LocalRelay):
+            async def claim(self, key, owner):
+                return False
+
+            async def holder(self, key):
+                return "worker:1"
+
+        registry = LiveRegistry()
+        host = asyncio.run(registry.host(1, user_uid=1))
+        assert asyncio.run(registry.host(1, user_uid=1)) is host
+        with pytest.raises(LiveHostUserError):
+            asyncio.run(registry.host(1, user_uid=2))
+        with pytest.raises(LiveHostUserError):
+            asyncio.run(LiveRegistry(Relay()).host(1, user_uid=2))
+        with pytest.raises(LiveHostError):
+            asyncio.run(LiveRegistry(Relay()).host(1, user_uid=1))
+
+    def test_4(self):
+        """
+        GIVEN: a live match played to its end
+        WHEN: it is advanced or hosted again
+        THEN: nothing is played, nor saved, twice
+        """
+        registry = LiveRegistry()
+        host = asyncio.run(registry.host(1, user_uid=1))
+        host.over = True
+        assert host.advance(match=None, db_session=None) == (None, [])
+        asyncio.run(registry.end(1))
+        with pytest.raises(LiveMatchOverError):
+            asyncio.run(registry.host(1, user_uid=1))
@@ -1,3 +1,4 @@
+import json
 from datetime import datetime, timedelta, timezone
 
 from fastapi import status
@@ -5,7 +6,9 @@ from fastapi.testclient import TestClient
 
 from app.core.config import settings
 from app.domain_service.data_transfer.ranking import RankingDTO
+from app.domain_service.play import LocalCounters, MatchAnalytics, TemplatePool
 from app.tests.fixtures import TEST_1
+from app.tests.utilities.sql import query_budget
 
 
 class TestCaseMatchEndpoints:
@@ -321,3 +324,175 @@ class TestCaseMatchEndpoints:
                 "uid": rank_2.uid,
             },
         ]
+
+    def test_13(self, client: TestClient):
+        """Streaming the rankings of an unknown match fails"""
+        response = client.get(f"{settings.API_V1_STR}/matches/rankings/1/stream")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_14(
+        self, ase_client: TestClient, question_dto, match_dto, game_dto, mocker
+    ):
+        """A sample of the template questions is imported"""
+        mocker.patch("app.api.api_v1.endpoints.match.template_pool", TemplatePool())
+        match = match_dto.save(match_dto.new())
+        new_game = game_dto.save(game_dto.new(match_uid=match.uid))
+        question_dto.add_many(
+            objects=[
+                question_dto.new(text=f"Question {position}", position=position)
+                for position in range(10)
+            ]
+        )
+        payload = {
+            "uid": match.uid,
+            "sample": 4,
+            "seed": "abc",
+            "game_uid": new_game.uid,
+        }
+        response = ase_client.post(
+            f"{settings.API_V1_STR}/matches/import_questions", json=payload
+        )
+        assert response.ok
+        assert len(match.questions_list) == 4
+
+    def test_15(
+        self,
+        ase_client: TestClient,
+        match_dto,
+        game_dto,
+        question_dto,
+        answer_dto,
+        reaction_dto,
+        user_dto,
+    ):
+        """The statistics of the questions of a match, and their totals"""
+        match = match_dto.save(match_dto.new())
+        game = game_dto.save(game_dto.new(match_uid=match.uid))
+        user = user_dto.fetch()
+        for position in range(2):
+            question = question_dto.save(
+                question_dto.new(text=f"{position}+1", game=game, position=position)
+            )
+            answer = answer_dto.new(question=question, text="ok", position=position)
+            answer_dto.save(answer)
+            reaction = reaction_dto.save(
+                reaction_dto.new(match=match, question=question, user=user)
+            )
+            reaction_dto.record_answer(reaction, answer=answer)
+
+        response = ase_client.get(f"{settings.API_V1_STR}/matches/{match.uid}/stats")
+        assert response.ok
+        assert response.json()["attempts"] == 2
+        assert response.json()["correct"] == 1
+        assert response.json()["response_time"]["p50"] is not None
+        assert len(response.json()["questions"]) == 2
+
+    def test_16(
+        self,
+        ase_client: TestClient,
+        match_dto,
+        game_dto,
+        question_dto,
+        answer_dto,
+        reaction_dto,
+        user_dto,
+        mocker,
+    ):
+        """The reactions of a match are exported as CSV or NDJSON"""
+        match = match_dto.save(match_dto.new())
+        game = game_dto.save(game_dto.new(match_uid=match.uid))
+        user = user_dto.fetch()
+        for position in range(3):
+            question = question_dto.save(
+                question_dto.new(text=f"{position}+1", game=game, position=position)
+            )
+            answer = answer_dto.new(question=question, text="ok", position=0)
+            answer_dto.save(answer)
+            reaction = reaction_dto.save(
+                reaction_dto.new(match=match, question=question, user=user)
+            )
+            reaction_dto.record_answer(reaction, answer=answer)
+
+        url = f"{settings.API_V1_STR}/matches/{match.uid}/export"
+        response = ase_client.get(url)
+        assert response.ok
+        assert response.headers["content-type"].startswith("text/csv")
+        lines = response.text.splitlines()
+        assert lines[0].startswith("reaction_uid,attempt_uid,user_digest")
+        assert len(lines) == 4
+
+        response = ase_client.get(url, params={"format": "ndjson"})
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [r["question_text"] for r in rows] == ["0+1", "1+1", "2+1"]
+        assert all(r["answer_is_correct"] for r in rows)
+
+        response = ase_client.get(url, params={"format": "xml"})
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+        mocker.patch("app.domain_service.data_transfer.export.pyarrow", None)
+        response = ase_client.get(url, params={"format": "parquet"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_17(
+        self,
+        ase_client: TestClient,
+        match_dto,
+        game_dto,
+        question_dto,
+        answer_dto,
+        reaction_dto,
+        user_dto,
+        mocker,
+    ):
+        """The dashboard of a match"""
+        mocker.patch("app.api.api_v1.endpoints.match.match_analytics", MatchAnalytics())
+        match = match_dto.save(match_dto.new())
+        game = game_dto.save(game_dto.new(match_uid=match.uid))
+        question = question_dto.save(
+            question_dto.new(text="1+1", game=game, position=0)
+        )
+        answer = answer_dto.new(question=question, text="2", position=0)
+        answer_dto.save(answer)
+        reaction = reaction_dto.save(
+            reaction_dto.new(match=match, question=question, user=user_dto.fetch())
+        )
+        reaction_dto.record_answer(reaction, answer=answer)
+
+        response = ase_client.get(
+            f"{settings.API_V1_STR}/matches/{match.uid}/dashboard", params={"bins": 4}
+        )
+        assert response.ok
+        assert response.json()["funnel"] == [1]
+        assert len(response.json()["score_distribution"]) == 4
+
+        response = ase_client.get(f"{settings.API_V1_STR}/matches/100/dashboard")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_18(self, ase_client: TestClient, mocker):
+        """The live counters of a match"""
+        counters = LocalCounters()
+        mocker.patch("app.api.api_v1.endpoints.match.live_counters", counters)
+        counters.played(1, 1)
+        counters.answered(1, 2)
+
+        response = ase_client.get(f"{settings.API_V1_STR}/matches/1/live")
+        assert response.ok
+        assert response.json() == {
+            "match_uid": 1,
+            "active_players": 2,
+            "answers_per_minute": 1,
+            "unique_players": 2,
+        }
+
+    def test_19(self, ase_client: TestClient, admin_user, trivia_match):
+        """The SQL statements of the listing are counted per route"""
+        with query_budget(15):
+            response = ase_client.get(f"{settings.API_V1_STR}/matches/")
+        assert response.ok
+        assert 'desc="0 commits"' in response.headers["Server-Timing"]
+
+        response = ase_client.get(f"{settings.API_V1_STR}/admin/metrics")
+        assert response.ok
+        assert (
+            'proquiz_sql_queries_total{route="GET /api/v1/matches/"}' in response.text
+        )
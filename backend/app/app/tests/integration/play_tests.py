@@ -5,6 +5,8 @@ from fastapi.testclient import TestClient
 
 from app.core.config import settings
 from app.domain_service.data_transfer.user import WordDigest
+from app.domain_service.play import LiveToken, ProgressToken
+from app.tests.utilities.sql import query_budget
 
 
 class TestCaseCSRF:
@@ -749,3 +751,293 @@ class TestCasePlayNext:
         )
         assert response.ok
         assert response.json() == {"question": None, "score": 0.0, "was_correct": None}
+
+    def test_10(
+        self,
+        se_client: TestClient,
+        db_session,
+        match_dto,
+        game_dto,
+        question_dto,
+        answer_dto,
+        user_dto,
+        emitted_queries,
+        mocker,
+    ):
+        """
+        GIVEN: the deferred reactions enabled
+        WHEN: the user plays a match of two questions
+        THEN: each reaction is inserted once, when the answer
+                arrives, and timed from the signed display time
+        """
+        mocker.patch.object(settings, "DEFERRED_REACTIONS", True)
+        match = match_dto.save(match_dto.new())
+        game = game_dto.save(game_dto.new(match_uid=match.uid))
+        first = question_dto.new(text="1+1", game_uid=game.uid, position=0, time=10)
+        question_dto.save(first)
+        first_answer = answer_dto.new(question=first, text="2", position=0, level=2)
+        answer_dto.save(first_answer)
+        second = question_dto.new(text="2+2", game_uid=game.uid, position=1, time=10)
+        question_dto.save(second)
+        second_answer = answer_dto.new(question=second, text="4", position=0)
+        answer_dto.save(second_answer)
+        user = user_dto.fetch()
+
+        response = se_client.post(
+            f"{settings.API_V1_STR}/play/start",
+            json={"match_uid": match.uid, "user_uid": user.uid},
+        )
+        assert response.ok
+        assert user.reactions.count() == 0
+        attempt_uid = response.json()["attempt_uid"]
+        payload = {
+            "match_uid": match.uid,
+            "question_uid": first.uid,
+            "answer_uid": first_answer.uid,
+            "user_uid": user.uid,
+            "attempt_uid": attempt_uid,
+        }
+
+        forged = f"{response.json()['display_token']}x"
+        response_ko = se_client.post(
+            f"{settings.API_V1_STR}/play/next",
+            json={**payload, "display_token": forged},
+        )
+        assert response_ko.status_code == status.HTTP_400_BAD_REQUEST
+        assert response_ko.json() == {"detail": "Invalid display-token"}
+        live_token = LiveToken(match.uid, user.uid).encode()
+        response_ko = se_client.post(
+            f"{settings.API_V1_STR}/play/next",
+            json={**payload, "display_token": live_token},
+        )
+        assert response_ko.status_code == status.HTTP_400_BAD_REQUEST
+
+        emitted_queries.clear()
+        response = se_client.post(
+            f"{settings.API_V1_STR}/play/next",
+            json={**payload, "display_token": response.json()["display_token"]},
+        )
+        assert response.ok
+        assert response.json()["question"]["uid"] == second.uid
+        statements = [s for s, _ in emitted_queries]
+        assert not [s for s in statements if s.startswith("UPDATE reactions")]
+        assert (
+            len([s for s in statements if s.startswith("INSERT INTO reactions")]) == 1
+        )
+        reaction = user.reactions.one()
+        assert reaction.answer_uid == first_answer.uid
+        assert reaction.score > 1.9
+
+        response = se_client.post(
+            f"{settings.API_V1_STR}/play/next",
+            json={
+                **payload,
+                "question_uid": second.uid,
+                "answer_uid": second_answer.uid,
+                "display_token": response.json()["display_token"],
+            },
+        )
+        assert response.ok
+        assert response.json()["question"] is None
+        assert user.reactions.count() == 2
+        assert match.rankings.count() == 1
+
+    def test_11(
+        self,
+        se_client: TestClient,
+        match_dto,
+        game_dto,
+        question_dto,
+        answer_dto,
+        user_dto,
+        emitted_queries,
+        mocker,
+    ):
+        """
+        GIVEN: the progress tokens enabled
+        WHEN: the user plays a match of two games
+        THEN: the position and the score travel in the token,
+                which cannot be played twice, and the version of
+                the match is read once per answer
+        """
+        mocker.patch.object(settings, "PROGRESS_TOKENS", True)
+        match = match_dto.save(match_dto.new())
+        questions = []
+        for index, level in enumerate((2, 3)):
+            game = game_dto.save(game_dto.new(match_uid=match.uid, index=index))
+            question = question_dto.new(
+                text=f"{index}+1", game_uid=game.uid, position=0
+            )
+            question_dto.save(question)
+            answer = answer_dto.new(
+                question=question, text="2", position=0, level=level
+            )
+            answer_dto.save(answer)
+            questions.append((question.uid, answer.uid))
+        user = user_dto.fetch()
+
+        response = se_client.post(
+            f"{settings.API_V1_STR}/play/start",
+            json={"match_uid": match.uid, "user_uid": user.uid},
+        )
+        assert response.ok
+        assert response.json()["display_token"] is None
+        attempt_uid = response.json()["attempt_uid"]
+        first_token = response.json()["progress_token"]
+        payload = {
+            "match_uid": match.uid,
+            "question_uid": questions[0][0],
+            "answer_uid": questions[0][1],
+            "user_uid": user.uid,
+            "attempt_uid": attempt_uid,
+        }
+        response_ko = se_client.post(
+            f"{settings.API_V1_STR}/play/next",
+            json={**payload, "progress_token": LiveToken(match.uid, user.uid).encode()},
+        )
+        assert response_ko.status_code == status.HTTP_400_BAD_REQUEST
+
+        emitted_queries.clear()
+        response = se_client.post(
+            f"{settings.API_V1_STR}/play/next",
+            json={**payload, "progress_token": first_token},
+        )
+        assert response.ok
+        assert response.json()["question"]["uid"] == questions[1][0]
+        statements = [s for s, _ in emitted_queries]
+        assert len([s for s in statements if "max(coalesce(" in s]) == 1
+        progress = ProgressToken.decode(response.json()["progress_token"])
+        assert (progress.step, progress.questions) == (1, (questions[1][0],))
+
+        response_ko = se_client.post(
+            f"{settings.API_V1_STR}/play/next",
+            json={
+                **payload,
+                "question_uid": questions[1][0],
+                "answer_uid": questions[1][1],
+                "progress_token": first_token,
+            },
+        )
+        assert response_ko.status_code == status.HTTP_400_BAD_REQUEST
+        assert response_ko.json() == {"detail": "Invalid progress-token"}
+
+        response = se_client.post(
+            f"{settings.API_V1_STR}/play/next",
+            json={
+                **payload,
+                "question_uid": questions[1][0],
+                "answer_uid": questions[1][1],
+                "progress_token": response.json()["progress_token"],
+            },
+        )
+        assert response.ok
+        assert response.json()["question"] is None
+        assert response.json()["score"] == 5
+        assert user.reactions.count() == 2
+        assert match.rankings.one().score == 5
+
+    def test_12(
+        self,
+        se_client: TestClient,
+        match_dto,
+        game_dto,
+        question_dto,
+        user_dto,
+        mocker,
+    ):
+        """
+        GIVEN: the deferred reactions enabled and a match playable once
+        WHEN: the user starts it again, without answering
+        THEN: the first start used up the attempt
+        """
+        mocker.patch.object(settings, "DEFERRED_REACTIONS", True)
+        match = match_dto.save(match_dto.new(times=1))
+        game = game_dto.save(game_dto.new(match_uid=match.uid))
+        question_dto.save(question_dto.new(text="1+1", game_uid=game.uid, position=0))
+        user = user_dto.fetch()
+
+        payload = {"match_uid": match.uid, "user_uid": user.uid}
+        response = se_client.post(f"{settings.API_V1_STR}/play/start", json=payload)
+        assert response.ok
+        assert user.reactions.count() == 0
+        assert match.left_attempts(user) == 0
+
+        response = se_client.post(f"{settings.API_V1_STR}/play/start", json=payload)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert match.attempts.count() == 1
+
+
+class TestCaseQueryBudget:
+    def test_1(self, se_client: TestClient, admin_user, trivia_match, user_dto):
+        """
+        GIVEN: an existing match
+        WHEN: the user starts it and answers the first question
+        THEN: each request stays within its budget of SQL statements
+        """
+        match = trivia_match
+        user = user_dto.fetch(signed=match.is_restricted)
+        with query_budget(25):
+            response = se_client.post(
+                f"{settings.API_V1_STR}/play/start",
+                json={"match_uid": match.uid, "user_uid": user.uid},
+            )
+        assert response.ok
+        assert "db;dur=" in response.headers["Server-Timing"]
+
+        question_uid = response.json()["question"]["uid"]
+        question = next(q for q in match.questions_list if q.uid == question_uid)
+        with query_budget(26):
+            response = se_client.post(
+                f"{settings.API_V1_STR}/play/next",
+                json={
+                    "match_uid": match.uid,
+                    "question_uid": question.uid,
+                    "answer_uid": question.answers_by_position[0].uid,
+                    "user_uid": user.uid,
+                    "attempt_uid": response.json()["attempt_uid"],
+                },
+            )
+        assert response.ok
+
+
+class TestCaseSpans:
+    def test_1(self, se_client: TestClient, admin_user, trivia_match, user_dto):
+        """
+        GIVEN: an existing match
+        WHEN: the user starts it and answers the first question
+        THEN: each phase of the requests is timed, the validation
+                of the responses against their model included
+        """
+        match = trivia_match
+        user = user_dto.fetch(signed=match.is_restricted)
+        response = se_client.post(
+            f"{settings.API_V1_STR}/play/start",
+            json={"match_uid": match.uid, "user_uid": user.uid},
+        )
+        assert response.ok
+
+        question_uid = response.json()["question"]["uid"]
+        question = next(q for q in match.questions_list if q.uid == question_uid)
+        response = se_client.post(
+            f"{settings.API_V1_STR}/play/next",
+            json={
+                "match_uid": match.uid,
+                "question_uid": question.uid,
+                "answer_uid": question.answers_by_position[0].uid,
+                "user_uid": user.uid,
+                "attempt_uid": response.json()["attempt_uid"],
+            },
+        )
+        assert response.ok
+        response = se_client.get(f"{settings.API_V1_STR}/admin/spans")
+        assert response.ok
+        phases = response.json()
+        for phase in (
+            "csrf",
+            "validation",
+            "player_status",
+            "record_answer",
+            "response_validation",
+            "serialization",
+        ):
+            assert phases[phase]["count"] > 0
@@ -162,3 +162,43 @@ class TestCaseQuestionEP:
         assert len(response.json()["questions"]) == 1
         questions_data = response.json()["questions"]
         assert questions_data[0]["text"] == "First Question"
+
+    def test_11(
+        self,
+        ase_client: TestClient,
+        match_dto,
+        game_dto,
+        question_dto,
+        answer_dto,
+        reaction_dto,
+        user_dto,
+    ):
+        """The statistics of a question, empty until it is answered"""
+        match = match_dto.save(match_dto.new())
+        game = game_dto.save(game_dto.new(match_uid=match.uid))
+        question = question_dto.save(
+            question_dto.new(text="1+1 =", game=game, position=0)
+        )
+        answer = answer_dto.new(question=question, text="2", position=0)
+        answer_dto.save(answer)
+
+        response = ase_client.get(
+            f"{settings.API_V1_STR}/questions/{question.uid}/stats"
+        )
+        assert response.ok
+        assert response.json()["attempts"] == 0
+        assert response.json()["response_time"]["p50"] is None
+
+        reaction = reaction_dto.save(
+            reaction_dto.new(match=match, question=question, user=user_dto.fetch())
+        )
+        reaction_dto.record_answer(reaction, answer=answer)
+        response = ase_client.get(
+            f"{settings.API_V1_STR}/questions/{question.uid}/stats"
+        )
+        assert response.json()["attempts"] == 1
+        assert response.json()["correct_rate"] == 1
+        assert response.json()["answers"] == {str(answer.uid): 1}
+
+        response = ase_client.get(f"{settings.API_V1_STR}/questions/300/stats")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -142,3 +142,79 @@ class TestCaseUser:
         assert response.json()["uid"] > 0
         assert response.json()["is_active"]
         assert response.json()["email"].endswith("@progame.io")
+
+    def test_6(self, client: TestClient, user_dto):
+        """unsigned players are paginated using the uid of the last one"""
+        user_1 = user_dto.fetch()
+        user_2 = user_dto.fetch()
+        user_dto.fetch(signed=True)
+        response = client.get(
+            f"{settings.API_V1_STR}/players", params={"signed": False, "limit": 1}
+        )
+        assert response.ok
+        assert [p["uid"] for p in response.json()["players"]] == [user_1.uid]
+
+        response = client.get(
+            f"{settings.API_V1_STR}/players",
+            params={"signed": False, "after": user_1.uid, "limit": 1},
+        )
+        assert response.ok
+        assert [p["uid"] for p in response.json()["players"]] == [user_2.uid]
+
+    def test_7(
+        self,
+        client: TestClient,
+        match_dto,
+        game_dto,
+        question_dto,
+        user_dto,
+        reaction_dto,
+    ):
+        """
+        GIVEN: three users who played a match, the first one twice
+        WHEN: its players are listed one page at a time, with their stats
+        THEN: each user is returned once, with the aggregates of the attempts
+        """
+        match = match_dto.save(match_dto.new())
+        game = game_dto.save(game_dto.new(match_uid=match.uid, index=0))
+        question_1 = question_dto.save(
+            question_dto.new(text="3*3 = ", game=game, time=0, position=0)
+        )
+        question_2 = question_dto.save(
+            question_dto.new(text="1+1 = ", game=game, time=1, position=1)
+        )
+        users = [user_dto.fetch() for _ in range(3)]
+        for user, score in ((users[0], 1), (users[0], 3), (users[1], 2), (users[2], 0)):
+            attempt_uid = None
+            for question in (question_1, question_2):
+                reaction = reaction_dto.save(
+                    reaction_dto.new(
+                        match=match,
+                        question=question,
+                        user=user,
+                        attempt_uid=attempt_uid,
+                        score=score / 2,
+                    )
+                )
+                attempt_uid = reaction.attempt_uid
+
+        response = client.get(
+            f"{settings.API_V1_STR}/players/{match.uid}",
+            params={"limit": 2, "stats": True},
+        )
+        assert response.ok
+        first_page = response.json()["players"]
+        assert [p["uid"] for p in first_page] == [users[0].uid, users[1].uid]
+        assert first_page[0]["attempts"] == 2
+        assert first_page[0]["best_score"] == 3
+        assert first_page[0]["last_played"]
+        assert first_page[1]["attempts"] == 1
+
+        response = client.get(
+            f"{settings.API_V1_STR}/players/{match.uid}",
+            params={"limit": 2, "after": users[1].uid},
+        )
+        assert response.ok
+        second_page = response.json()["players"]
+        assert [p["uid"] for p in second_page] == [users[2].uid]
+        assert second_page[0]["attempts"] is None
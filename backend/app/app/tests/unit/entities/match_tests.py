@@ -72,7 +72,7 @@ class TestCaseMatchModel:
         assert question.text == "What is the capital of Norway?"
 
     def test_5(self, match_dto, question_dto, answer_dto):
-        """Import existing template question to a match"""
+        """Import existing template question to a match, with its answers"""
         question_1 = question_dto.new(text="Where is London?", position=0)
         question_2 = question_dto.new(text="Where is Vienna?", position=1)
         question_dto.add_many([question_1, question_2])
@@ -89,7 +89,9 @@ class TestCaseMatchModel:
         answers_cnt = answer_dto.count()
         match_dto.import_template_questions(new_match, [question_1.uid, question_2.uid])
         assert question_dto.count() == questions_cnt + 2
-        assert answer_dto.count() == answers_cnt + 0
+        assert answer_dto.count() == answers_cnt + 1
+        copy = new_match.questions_list[0]
+        assert [a.text for a in copy.answers] == ["question2.answer1"]
 
     def test_6(self, match_dto, game_dto, question_dto):
         """
@@ -109,6 +111,25 @@ class TestCaseMatchModel:
         with pytest.raises(NotUsableQuestionError):
             match_dto.import_template_questions(match, [question.uid])
 
+    def test_7(self, match_dto, game_dto, question_dto):
+        """
+        GIVEN: a game with a question at position 0
+        WHEN: two templates, both at position 0, are imported into it
+        THEN: they are appended after it
+        """
+        match = match_dto.save(match_dto.new())
+        game = game_dto.save(game_dto.new(match_uid=match.uid))
+        question_dto.save(question_dto.new(text="1+1", game_uid=game.uid, position=0))
+        templates = [
+            question_dto.save(question_dto.new(text=text, position=0))
+            for text in ("2+2", "3+3")
+        ]
+
+        match_dto.import_template_questions(
+            match, [t.uid for t in templates], game_uid=game.uid
+        )
+        assert [q.position for q in game.questions.order_by("position")] == [0, 1, 2]
+
     def test_8(self, match_dto, game_dto, question_dto):
         """move one question from one game to another one"""
         match = match_dto.save(match_dto.new())
@@ -1,10 +1,24 @@
+import os
 from datetime import datetime, timedelta
 from math import isclose
 
 import pytest
+from redis.exceptions import RedisError
 from sqlalchemy.exc import IntegrityError, InvalidRequestError
+from sqlalchemy.orm.exc import StaleDataError
 
-from app.domain_service.data_transfer.reaction import ReactionScore
+from app.constants import QUESTION_STATS_SHARDS
+from app.core.sketch import ResponseTimeSketch
+from app.domain_entities import QuestionCounter, Reaction
+from app.domain_service.data_transfer.attempt import AttemptDTO
+from app.domain_service.data_transfer.question_stats import QuestionStatsDTO
+from app.domain_service.data_transfer.reaction import ReactionDTO, ReactionScore
+from app.domain_service.data_transfer.user import UserDTO
+from app.domain_service.data_transfer.write_behind import (
+    PendingAnswers,
+    ReactionWriteBuffer,
+)
+from app.domain_service.play import PlayerStatus, PlayScore
 
 
 class TestCaseReactionModel:
@@ -335,3 +349,372 @@ class TestCaseReactionScore:
         """
         rs = ReactionScore(timing=0.2, question_time=None, answer_level=None)
         assert rs.value() == 0
+
+
+@pytest.fixture
+def write_behind(tmp_path, mocker):
+    buffer = ReactionWriteBuffer(str(tmp_path / "reactions.log"))
+    mocker.patch("app.domain_service.data_transfer.write_behind._buffer", buffer)
+    yield buffer
+
+
+class TestCaseReactionWriteBehind:
+    def test_1(
+        self,
+        db_session,
+        write_behind,
+        match_dto,
+        game_dto,
+        question_dto,
+        answer_dto,
+        user_dto,
+        emitted_queries,
+    ):
+        """
+        GIVEN: the write-behind buffer enabled
+        WHEN: an answer is recorded and the session committed
+        THEN: nothing is written on the way, the reaction, the
+              statistics and the attempt are updated only when the
+              buffer is flushed, its score is read meanwhile
+        """
+        reaction_dto = ReactionDTO(session=db_session)
+        match = match_dto.save(match_dto.new())
+        game = game_dto.save(game_dto.new(match_uid=match.uid))
+        question = question_dto.save(
+            question_dto.new(text="1+1 =", game=game, position=0)
+        )
+        answer = answer_dto.new(question=question, text="2", position=1, level=2)
+        answer_dto.save(answer)
+        user = user_dto.fetch()
+        reaction = reaction_dto.save(
+            reaction_dto.new(match=match, question=question, user=user)
+        )
+
+        emitted_queries.clear()
+        assert reaction_dto.record_answer(reaction, answer=answer) is False
+        assert reaction.answer_uid == answer.uid
+        db_session.commit()
+        assert not [s for s, _ in emitted_queries if not s.startswith("SELECT")]
+        assert reaction_dto.observed(reaction, "answer_uid") == answer.uid
+        stored = db_session.query(Reaction.answer_uid, Reaction.score).one()
+        assert tuple(stored) == (None, None)
+        assert write_behind.answered(reaction.attempt_uid, question.uid)
+        status = PlayerStatus(user, match, db_session)
+        status.current_attempt_uid = reaction.attempt_uid
+        assert status.current_score() == 2
+        assert status.attempt.answered == 0
+        stats = QuestionStatsDTO(db_session)
+        assert stats.summary(question.uid)["attempts"] == 0
+
+        assert write_behind.flush(db_session) == 1
+        stored = db_session.query(Reaction.answer_uid, Reaction.score).one()
+        assert tuple(stored) == (answer.uid, 2)
+        assert status.attempt.answered == 1
+        assert status.current_score() == 2
+        assert stats.summary(question.uid)["answers"] == {str(answer.uid): 1}
+        assert not write_behind.is_pending(reaction.uid)
+        assert open(write_behind.path).read() == ""
+
+    def test_2(self, tmp_path):
+        """
+        GIVEN: a buffer with a pending recording, whose process ended
+        WHEN: a new buffer is created on the same path
+        THEN: the recording is pending again, in the log of the new one
+        """
+        path = str(tmp_path / "reactions.log")
+        answered_at = datetime.now()
+        crashed = ReactionWriteBuffer(path)
+        crashed.append(
+            {
+                "uid": 1,
+                "attempt_uid": "a",
+                "question_uid": 2,
+                "update_timestamp": answered_at,
+                "score": 0.5,
+            }
+        )
+        crashed.close()
+
+        buffer = ReactionWriteBuffer(path)
+        assert buffer.answered("a", 2)
+        assert buffer.get(1, "update_timestamp") == answered_at
+        assert buffer.get(1, "score") == 0.5
+        assert not os.path.exists(crashed.path)
+        assert len(open(buffer.path).readlines()) == 1
+
+    def test_3(self, tmp_path):
+        """
+        GIVEN: a buffer with a pending recording, whose process lives
+        WHEN: another buffer is created on the same path
+        THEN: it leaves that recording and its log alone
+        """
+        path = str(tmp_path / "reactions.log")
+        first = ReactionWriteBuffer(path)
+        first.append({"uid": 1, "attempt_uid": "a", "question_uid": 2})
+
+        second = ReactionWriteBuffer(path)
+        assert not second.is_pending(1)
+        assert first.path != second.path
+        second.append({"uid": 3, "attempt_uid": "b", "question_uid": 2})
+        assert len(open(first.path).readlines()) == 1
+
+    def test_4(
+        self,
+        db_session,
+        tmp_path,
+        match_dto,
+        game_dto,
+        question_dto,
+        reaction_dto,
+        user_dto,
+    ):
+        """
+        GIVEN: a batch holding a recording the database rejects
+        WHEN: it fails to be flushed `max_retries` times
+        THEN: the others are written and the rejected one dead-lettered
+        """
+        match = match_dto.save(match_dto.new())
+        game = game_dto.save(game_dto.new(match_uid=match.uid))
+        question = question_dto.save(
+            question_dto.new(text="1+1 =", game=game, position=0)
+        )
+        reaction = reaction_dto.save(
+            reaction_dto.new(match=match, question=question, user=user_dto.fetch())
+        )
+        buffer = ReactionWriteBuffer(str(tmp_path / "reactions.log"), max_retries=2)
+        buffer.append(
+            {
+                "uid": reaction.uid,
+                "attempt_uid": reaction.attempt_uid,
+                "question_uid": question.uid,
+                "match_uid": match.uid,
+                "was_correct": True,
+                "score": 1.5,
+            }
+        )
+        # a reaction deleted since
+        buffer.append({"uid": 0, "attempt_uid": "a", "question_uid": question.uid})
+
+        with pytest.raises(StaleDataError):
+            buffer.flush(db_session)
+        assert buffer.is_pending(reaction.uid)
+        assert buffer.flush(db_session) == 1
+        assert db_session.query(Reaction.score).scalar() == 1.5
+        assert not buffer.is_pending(reaction.uid) and not buffer.is_pending(0)
+        assert open(buffer.path).read() == ""
+        assert len(open(buffer.dead_path).readlines()) == 1
+
+    def test_5(self, tmp_path, mocker):
+        """
+        GIVEN: two buffers sharing their pending answers in Redis
+        WHEN: both take the answer to the same question
+        THEN: only the first records it and both see it pending
+        """
+        client = mocker.Mock()
+        client.pipeline.return_value.execute.side_effect = [[1, True], [0, True]]
+        client.hexists.return_value = 1
+        values = {"uid": 1, "attempt_uid": "a", "question_uid": 2, "score": 1.5}
+        first = ReactionWriteBuffer(
+            str(tmp_path / "first.log"), shared=PendingAnswers(client)
+        )
+        second = ReactionWriteBuffer(
+            str(tmp_path / "second.log"), shared=PendingAnswers(client)
+        )
+
+        assert first.append(dict(values))
+        assert not second.append(dict(values))
+        assert not second.is_pending(1)
+        assert second.answered("a", 2)
+        pipeline = client.pipeline.return_value
+        pipeline.hsetnx.assert_called_with("write-behind:a", 2, "[1, 1.5]")
+
+    def test_6(self, tmp_path, mocker):
+        """
+        GIVEN: a buffer sharing its pending answers in a Redis that is down
+        WHEN: an answer is taken twice
+        THEN: the buffer falls back to its own pending answers
+        """
+        client = mocker.Mock()
+        client.pipeline.return_value.execute.side_effect = RedisError("down")
+        client.hexists.side_effect = RedisError("down")
+        client.hgetall.side_effect = RedisError("down")
+        buffer = ReactionWriteBuffer(
+            str(tmp_path / "reactions.log"), shared=PendingAnswers(client)
+        )
+        values = {"uid": 1, "attempt_uid": "a", "question_uid": 2, "score": 1.5}
+
+        assert buffer.append(dict(values))
+        assert not buffer.append(dict(values))
+        assert buffer.answered("a", 2) and not buffer.answered("a", 3)
+        assert buffer.scores("a") == {1: 1.5}
+
+
+class TestCaseQuestionStats:
+    def test_1(self):
+        """
+        GIVEN: two sketches of response times, from 0.1s to 10s
+        WHEN: they are merged
+        THEN: the percentiles are within the relative accuracy
+        """
+        first, second = ResponseTimeSketch(), ResponseTimeSketch()
+        for i in range(1, 101):
+            (first if i % 2 else second).add(i / 10)
+
+        assert first.quantile(0.5) is not None
+        merged = ResponseTimeSketch.loads(first.dumps()).merge(second)
+        assert merged.count == 100
+        assert isclose(merged.quantile(0.5), 5.0, rel_tol=0.03)
+        assert isclose(merged.quantile(0.99), 9.9, rel_tol=0.03)
+        assert len(merged.counts) < 100
+        assert ResponseTimeSketch().quantile(0.5) is None
+
+    def test_2(
+        self,
+        db_session,
+        match_dto,
+        game_dto,
+        question_dto,
+        answer_dto,
+        reaction_dto,
+        user_dto,
+    ):
+        """
+        GIVEN: a question with two answers
+        WHEN: three reactions are recorded
+        THEN: the counters of the question are added up across shards
+        """
+        match = match_dto.save(match_dto.new())
+        game = game_dto.save(game_dto.new(match_uid=match.uid))
+        question = question_dto.save(
+            question_dto.new(text="1+1 =", game=game, position=0)
+        )
+        right = answer_dto.new(question=question, text="2", position=0, level=1)
+        answer_dto.save(right)
+        wrong = answer_dto.new(question=question, text="3", position=1, level=1)
+        answer_dto.save(wrong)
+        user = user_dto.fetch()
+        for answer in (right, wrong, right):
+            reaction = reaction_dto.save(
+                reaction_dto.new(
+                    match=match,
+                    question=question,
+                    user=user,
+                    create_timestamp=datetime.now() - timedelta(seconds=2),
+                )
+            )
+            reaction_dto.record_answer(reaction, answer=answer)
+
+        shards = {shard for (shard,) in db_session.query(QuestionCounter.shard)}
+        assert shards <= set(range(QUESTION_STATS_SHARDS))
+        summary = QuestionStatsDTO(db_session).summary(question.uid)
+        assert summary["attempts"] == 3
+        assert summary["correct"] == 2
+        assert summary["answers"] == {str(right.uid): 2, str(wrong.uid): 1}
+        assert isclose(summary["response_time"]["p50"], 2, rel_tol=0.05)
+
+
+class TestCaseAttemptSummary:
+    @pytest.fixture
+    def played(
+        self, match_dto, game_dto, question_dto, answer_dto, reaction_dto, user_dto
+    ):
+        match = match_dto.save(match_dto.new(times=3))
+        game = game_dto.save(game_dto.new(match_uid=match.uid))
+        first = question_dto.save(question_dto.new(text="1+1 =", game=game, position=0))
+        second = question_dto.save(
+            question_dto.new(text="2+2 =", game=game, position=1)
+        )
+        right = answer_dto.new(
+            question=first, text="2", position=0, level=1, is_correct=True
+        )
+        answer_dto.save(right)
+        wrong = answer_dto.new(
+            question=second, text="5", position=0, level=1, is_correct=False
+        )
+        answer_dto.save(wrong)
+        user = user_dto.fetch()
+        for question, answer in ((first, right), (second, wrong)):
+            reaction = reaction_dto.save(
+                reaction_dto.new(
+                    match=match,
+                    question=question,
+                    user=user,
+                    attempt_uid="a" * 32,
+                    create_timestamp=datetime.now() - timedelta(seconds=2),
+                )
+            )
+            reaction_dto.record_answer(reaction, answer=answer)
+
+        reaction_dto.save(
+            reaction_dto.new(
+                match=match, question=first, user=user, attempt_uid="b" * 32
+            )
+        )
+        return match, user
+
+    def test_1(self, db_session, played):
+        """
+        GIVEN: an attempt with one right and one wrong answer
+        WHEN: its score is saved to the ranking
+        THEN: the summary counts the reactions and the attempt is finished
+        """
+        match, user = played
+        status = PlayerStatus(user=user, match=match, db_session=db_session)
+        status.current_attempt_uid = "a" * 32
+        attempt = status.attempt
+        assert attempt.displayed == 2
+        assert attempt.answered == 2
+        assert attempt.correct == 1
+        assert status.current_score() == attempt.score
+        assert isclose(attempt.score, 2, rel_tol=0.01)
+        assert status.match_completed()
+        assert attempt.finished_at is None
+
+        PlayScore(
+            match.uid, user.uid, attempt.score, db_session, "a" * 32
+        ).save_to_ranking()
+        assert status.attempt.finished_at is not None
+        assert status.attempt.duration >= 0
+        assert match.left_attempts(user) == 1
+        assert UserDTO(session=db_session).players_of_match(match.uid) == [user]
+
+    def test_2(self, db_session, played):
+        """
+        GIVEN: the summaries of two attempts
+        WHEN: they are rebuilt from the reactions
+        THEN: the counters are the same
+        """
+        match, _ = played
+
+        def counters():
+            return sorted(
+                (a.attempt_uid, a.displayed, a.answered, a.correct, round(a.score, 3))
+                for a in match.attempts
+            )
+
+        before = counters()
+        assert AttemptDTO(session=db_session).backfill(match.uid) == 2
+        assert counters() == before
+        finished = AttemptDTO(session=db_session).get("a" * 32)
+        assert finished.finished_at is not None
+        assert AttemptDTO(session=db_session).get("b" * 32).finished_at is None
+
+    def test_3(self, db_session, played):
+        """
+        GIVEN: one summary missing and one with wrong counters
+        WHEN: they are rebuilt from the reactions
+        THEN: the first is created and the second is corrected in place
+        """
+        match, user = played
+        dto = AttemptDTO(session=db_session)
+        kept = dto.get("a" * 32)
+        uid, displayed = kept.uid, kept.displayed
+        db_session.delete(dto.get("b" * 32))
+        kept.displayed = 10
+        db_session.commit()
+
+        assert dto.backfill(match.uid) == 2
+        assert dto.get("a" * 32).uid == uid
+        assert dto.get("a" * 32).displayed == displayed
+        assert dto.get("b" * 32).displayed == 1
+        assert match.left_attempts(user) == 1
@@ -1,3 +1,9 @@
+from datetime import datetime, timedelta, timezone
+
+from app.domain_entities import Ranking
+from app.domain_service.data_transfer.user import UserFactory, WordDigest
+
+
 class TestCaseUserFactory:
     def test_1(self, monkeypatch, user_dto):
         """create new signed user via fetch"""
@@ -81,3 +87,110 @@ class TestCaseUserFactory:
         )
         existing_user = user_dto.fetch(email=new_internal_user.email)
         assert existing_user == new_internal_user
+
+
+class TestCaseUnsignedUsers:
+    def test_1(self, user_dto):
+        """
+        GIVEN: three unsigned users
+        WHEN: unsigned() is called with a page size of two
+        THEN: the pages follow the uid order
+        """
+        user_1 = user_dto.fetch()
+        user_2 = user_dto.fetch()
+        user_3 = user_dto.fetch()
+        assert user_dto.unsigned(limit=2) == [user_1, user_2]
+        assert user_dto.unsigned(after_uid=user_2.uid, limit=2) == [user_3]
+
+    def test_2(self, db_session, user_dto, match_dto):
+        """
+        GIVEN: two unsigned users, only one of which has a ranking,
+                and a signed user
+        WHEN: reap_unsigned() is called
+        THEN: only the unsigned user without rankings is deleted
+        """
+        match = match_dto.save(match_dto.new())
+        user_1 = user_dto.fetch()
+        user_2 = user_dto.fetch()
+        signed_user = user_dto.fetch(signed=True)
+        db_session.add(Ranking(match_uid=match.uid, user_uid=user_2.uid, score=1))
+        db_session.commit()
+        uids = user_1.uid, user_2.uid, signed_user.uid
+
+        in_one_hour = datetime.now(tz=timezone.utc) + timedelta(hours=1)
+        assert user_dto.reap_unsigned(in_one_hour, batch_size=1) == 1
+        assert user_dto.get(uid=uids[0]) is None
+        assert user_dto.get(uid=uids[1])
+        assert user_dto.get(uid=uids[2])
+
+    def test_3(self, user_dto):
+        """users created within the retention window are kept"""
+        user_dto.fetch()
+        an_hour_ago = datetime.now(tz=timezone.utc) - timedelta(hours=1)
+        assert user_dto.reap_unsigned(an_hour_ago) == 0
+        assert user_dto.count() == 1
+
+    def test_4(self, user_dto):
+        """
+        GIVEN: a user with a password and an admin, without digests
+        WHEN: reap_unsigned() is called past the retention window
+        THEN: both are kept
+        """
+        user_dto.save(user_dto.new(email="user@test.project", password="p@ss"))
+        user_dto.save(
+            user_dto.new(email="admin@test.project", password="p@ss", is_admin=True)
+        )
+        in_one_hour = datetime.now(tz=timezone.utc) + timedelta(hours=1)
+        assert user_dto.reap_unsigned(in_one_hour) == 0
+        assert user_dto.count() == 2
+
+
+class TestCaseWordDigest:
+    def test_1(self, monkeypatch):
+        """the digest depends on the key, even when the word was already hashed"""
+        monkeypatch.setenv("SIGNED_KEY", "3ba57f9a004e42918eee6f73326aa89d")
+        digest = WordDigest("test@progame.io").value()
+        assert digest == "916a55cf753a5c847b861df2bdbbd8de"
+        assert WordDigest("test@progame.io").value() == digest
+
+        monkeypatch.setenv("SIGNED_KEY", "eee84145094cc69e4f816fd9f435e6b3")
+        assert WordDigest("test@progame.io").value() != digest
+
+    def test_2(self, monkeypatch, user_dto, emitted_queries):
+        """
+        GIVEN: an existing signed user
+        WHEN: fetch() is called with the same email and token
+        THEN: the user is retrieved with one query
+        """
+        monkeypatch.setenv("SIGNED_KEY", "3ba57f9a004e42918eee6f73326aa89d")
+        signed_user = user_dto.fetch(original_email="test@progame.io", token="25111961")
+        emitted_queries.clear()
+        assert (
+            user_dto.fetch(original_email="test@progame.io", token="25111961")
+            == signed_user
+        )
+        assert len(emitted_queries) == 1
+
+    def test_3(self, db_session, user_dto):
+        """
+        GIVEN: a signed user created by a concurrent request
+        WHEN: signed_user() tries to insert the same digests
+        THEN: the unique index rejects it, the existing user is returned
+        and the pending work of the session is kept
+        """
+        signed_user = user_dto.save(
+            user_dto.new(
+                email_digest="916a55cf753a5c847b861df2bdbbd8de",
+                token_digest="2357e975e4daaee0348474750b792660",
+            )
+        )
+        pending = user_dto.new(email="pending@progame.io")
+        db_session.add(pending)
+        factory = UserFactory(db_session=db_session)
+        user = factory.signed_user(
+            "916a55cf753a5c847b861df2bdbbd8de", "2357e975e4daaee0348474750b792660"
+        )
+        assert user == signed_user
+        db_session.commit()
+        assert user_dto.count() == 2
+        assert user_dto.get(email="pending@progame.io") == pending
@@ -1,17 +1,52 @@
-from datetime import datetime, timedelta
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
 
+import numpy as np
 import pytest
-
+from redis.exceptions import RedisError
+from sqlalchemy import event
+from sqlalchemy.engine.default import CACHE_HIT
+
+from app.core.config import Settings, settings
+from app.domain_entities import PlayEvent, Ranking
+from app.domain_service.data_transfer.attempt import AttemptDTO
+from app.domain_service.data_transfer.reaction import ReactionScore
 from app.domain_service.play import (
     GameFactory,
+    LocalRelay,
     PlayerStatus,
+    PlayEventProjector,
+    PlayScore,
     QuestionFactory,
+    RankingFeed,
+    RankingFeeds,
     SinglePlayer,
+    close_abandoned_attempts,
+    ranking_feeds,
+)
+from app.domain_service.play.adaptive import (
+    DifficultyIndex,
+    DifficultyIndexes,
+    correctness,
 )
+from app.domain_service.play.analytics import MatchAnalytics
+from app.domain_service.play.counters import (
+    HyperLogLog,
+    LocalCounters,
+    RedisCounters,
+)
+from app.domain_service.play.rescoring import MatchRescorer, vector_scores
+from app.domain_service.play.sampling import TemplatePool
+from app.domain_service.play.single_player import QUESTIONS_LEFT
+from app.domain_service.play.tokens import match_version
 from app.exceptions import (
     GameError,
     GameOver,
     HuntOver,
+    IncompletePlayEventsError,
+    LiveCountersError,
     MatchError,
     MatchNotPlayableError,
     MatchOver,
@@ -132,6 +167,119 @@ class TestCaseQuestionFactory:
         with pytest.raises(GameError):
             question_factory.previous()
 
+    def test_6(self, match_dto, game_dto, question_dto, answer_dto, shuffle_patch):
+        """
+        GIVEN: an unordered game with five questions
+        WHEN: two factories with the same seed return all of them
+        THEN: the questions and their answers come in the same
+                order, without being shuffled
+        """
+        match = match_dto.save(match_dto.new())
+        game = game_dto.save(game_dto.new(match_uid=match.uid, order=False))
+        for position in range(5):
+            question = question_dto.new(
+                text=f"{position}+1", game_uid=game.uid, position=position
+            )
+            question_dto.save(question)
+            for answer_position in range(4):
+                answer_dto.save(
+                    answer_dto.new(
+                        question=question,
+                        text=str(answer_position),
+                        position=answer_position,
+                    )
+                )
+
+        def play(seed):
+            factory = QuestionFactory(game, seed=seed)
+            questions = [factory.next() for _ in range(5)]
+            with pytest.raises(GameOver):
+                factory.next()
+            return [(q.uid, q.answers_to_display) for q in questions]
+
+        first = play("8e491fd30c4f4f37a8a1944a11d1f96a")
+        assert play("8e491fd30c4f4f37a8a1944a11d1f96a") == first
+        assert sorted(uid for uid, _ in first) == [1, 2, 3, 4, 5]
+        assert shuffle_patch.call_count == 0
+
+        factory = QuestionFactory(
+            game, first[0][0], seed="8e491fd30c4f4f37a8a1944a11d1f96a"
+        )
+        assert factory.next().uid == first[1][0]
+
+    def test_7(self, match_dto, game_dto, question_dto, answer_dto):
+        """
+        GIVEN: an ordered game with six questions, of levels 1 and 2
+        WHEN: attempts draw a sample of two of the level 2 ones
+        THEN: each displays two of them, in their order, always the
+                same for the same seed
+        """
+        match = match_dto.save(match_dto.new())
+        game = game_dto.save(game_dto.new(match_uid=match.uid))
+        levels = {}
+        for position in range(6):
+            question = question_dto.new(
+                text=f"{position}+1", game_uid=game.uid, position=position
+            )
+            question_dto.save(question)
+            levels[question.uid] = position % 2 + 1
+            answer_dto.save(
+                answer_dto.new(
+                    question=question, text="1", position=0, level=levels[question.uid]
+                )
+            )
+
+        def play(seed):
+            factory = QuestionFactory(game, seed=seed, sample=2, levels=[2])
+            questions = [factory.next(), factory.next()]
+            assert factory.is_last_question
+            with pytest.raises(GameOver):
+                factory.next()
+            return [q.uid for q in questions]
+
+        drawn = {tuple(play(uuid4().hex)) for _ in range(10)}
+        assert all(list(uids) == sorted(uids) for uids in drawn)
+        assert {levels[uid] for uids in drawn for uid in uids} == {2}
+        assert len(drawn) > 1
+        assert play("8e491fd30c4f4f37a8a1944a11d1f96a") == play(
+            "8e491fd30c4f4f37a8a1944a11d1f96a"
+        )
+
+    def test_8(self, db_session, match_dto, game_dto, question_dto):
+        """
+        GIVEN: an unordered game with three questions
+        WHEN: next() is called three times
+        THEN: every call reuses the compiled form of the prebuilt statement
+        """
+        match = match_dto.save(match_dto.new())
+        game = game_dto.save(game_dto.new(match_uid=match.uid, order=False))
+        for position in range(3):
+            question_dto.save(
+                question_dto.new(
+                    text=f"{position}", game_uid=game.uid, position=position
+                )
+            )
+
+        hits = []
+
+        def after_cursor_execute(conn, cursor, statement, params, context, many):
+            if context.compiled is not None and (
+                context.compiled.statement is QUESTIONS_LEFT
+            ):
+                hits.append(context.cache_hit)
+
+        engine = db_session.get_bind()
+        event.listen(engine, "after_cursor_execute", after_cursor_execute)
+        try:
+            factory = QuestionFactory(game)
+            for _ in range(3):
+                factory.next()
+        finally:
+            event.remove(engine, "after_cursor_execute", after_cursor_execute)
+
+        assert len(hits) == 3
+        assert hits[1:] == [CACHE_HIT] * 2
+
 
 class TestCaseGameFactory:
     def test_1(self, match_dto, game_dto):
@@ -213,6 +361,26 @@ class TestCaseGameFactory:
         game_factory.next()
         assert game_factory.previous() == g1
 
+    def test_6(self, match_dto, game_dto, shuffle_patch):
+        """
+        GIVEN: an unordered match with four games
+        WHEN: factories with the same seed return all of them,
+                from scratch or after the first one was played
+        THEN: the games come in the same order
+        """
+        match = match_dto.save(match_dto.new(order=False))
+        for index in range(4):
+            game_dto.save(game_dto.new(match_uid=match.uid, index=index))
+
+        seed = "8e491fd30c4f4f37a8a1944a11d1f96a"
+        factory = GameFactory(match, seed=seed)
+        order = [factory.next().uid for _ in range(4)]
+        assert sorted(order) == [1, 2, 3, 4]
+        assert shuffle_patch.call_count == 0
+
+        factory = GameFactory(match, order[0], seed=seed)
+        assert [factory.next().uid for _ in range(3)] == order[1:]
+
 
 class TestCaseStatus:
     def test_1(
@@ -789,3 +957,742 @@ class TestCaseSinglePlayer:
         player = SinglePlayer(status, user, match, db_session=db_session)
         with pytest.raises(HuntOver):
             player.react(first_question, wrong)
+
+    def test_8(
+        self, db_session, match_dto, game_dto, question_dto, user_dto, answer_dto
+    ):
+        """
+        GIVEN: a deferred attempt left after answering the first of
+                three questions
+        WHEN: the abandoned attempts are closed
+        THEN: the question displayed last is saved unanswered, once
+        """
+        match = match_dto.save(match_dto.new())
+        game = game_dto.save(game_dto.new(match_uid=match.uid))
+        questions = []
+        for position in range(3):
+            question = question_dto.new(
+                text=f"{position}+1", game_uid=game.uid, position=position
+            )
+            question_dto.save(question)
+            answer_dto.save(answer_dto.new(question=question, text="ok", position=0))
+            questions.append(question)
+        user = user_dto.save(user_dto.new(email="user@test.project"))
+
+        status = PlayerStatus(user, match, db_session=db_session)
+        player = SinglePlayer(status, user, match, db_session=db_session, deferred=True)
+        first, attempt_uid = player.start()
+        status.current_attempt_uid = attempt_uid
+        player.react(
+            first,
+            first.answers_by_position[0],
+            displayed_at=datetime.now(tz=timezone.utc),
+        )
+        second = player.forward()
+
+        now = datetime.now(tz=timezone.utc)
+        hour = timedelta(hours=1)
+        assert close_abandoned_attempts(now - 2 * hour, now - hour, db_session) == 0
+        assert close_abandoned_attempts(now - hour, now + hour, db_session) == 1
+        left = user.reactions.filter_by(update_timestamp=None).one()
+        assert left.question_uid == second.uid
+        assert left.attempt_uid == attempt_uid
+        assert close_abandoned_attempts(now - hour, now + hour, db_session) == 0
+
+    def test_9(
+        self, db_session, match_dto, game_dto, question_dto, user_dto, answer_dto
+    ):
+        """
+        GIVEN: a match drawing two of the four questions of its game
+        WHEN: the user plays an attempt to the end
+        THEN: two questions are displayed and the match is completed
+        """
+        match = match_dto.save(match_dto.new(sample=2, sample_levels=[1]))
+        game = game_dto.save(game_dto.new(match_uid=match.uid))
+        for position in range(4):
+            question = question_dto.new(
+                text=f"{position}+1", game_uid=game.uid, position=position
+            )
+            question_dto.save(question)
+            answer_dto.save(
+                answer_dto.new(question=question, text="ok", position=0, level=1)
+            )
+        user = user_dto.save(user_dto.new(email="user@test.project"))
+
+        status = PlayerStatus(user, match, db_session=db_session)
+        player = SinglePlayer(status, user, match, db_session=db_session)
+        question, attempt_uid = player.start()
+        status.current_attempt_uid = attempt_uid
+        player.react(question, question.answers_by_position[0])
+        question = player.forward()
+        player.react(question, question.answers_by_position[0])
+        with pytest.raises(MatchOver):
+            player.forward()
+        assert user.reactions.count() == 2
+        assert match.sample_levels == [1]
+        assert status.match_completed()
+
+
+class TestCaseRankingFeed:
+    def test_1(self):
+        """
+        GIVEN: a feed with two rankings
+        WHEN: two new scores are published within the same tick
+        THEN: one delta is emitted with the rank of each new score
+        """
+        feed = RankingFeed(
+            1,
+            [
+                {"user": {"uid": 1, "name": None}, "score": 4.0},
+                {"user": {"uid": 2, "name": None}, "score": 2.0},
+            ],
+        )
+        (event_id, data), *_ = feed.since()
+        assert event_id == f"{feed.epoch}-0"
+        assert [r["rank"] for r in json.loads(data)["rankings"]] == [1, 2]
+
+        feed.publish(3, 3.0)
+        feed.publish(4, 5.0)
+        feed.tick(interval=0)
+        events = feed.since(event_id)
+        assert len(events) == 1
+        assert events[0][0] == f"{feed.epoch}-1"
+        assert json.loads(events[0][1]) == {
+            "type": "delta",
+            "rankings": [
+                {"user": {"uid": 3, "name": None}, "score": 3.0, "rank": 3},
+                {"user": {"uid": 4, "name": None}, "score": 5.0, "rank": 1},
+            ],
+        }
+        assert feed.since(f"{feed.epoch}-1") == []
+
+    def test_2(self):
+        """
+        GIVEN: a feed whose backlog holds the latest two events
+        WHEN: a subscriber resumes from an event no longer kept
+        THEN: it receives a new snapshot instead of the deltas
+        """
+        feed = RankingFeed(1, [], backlog=2)
+        for user_uid in range(3):
+            feed.publish(user_uid, float(user_uid))
+            feed.tick(interval=0)
+
+        assert [i for i, _ in feed.since(feed.key(1))] == [feed.key(2), feed.key(3)]
+        (event_id, data), *_ = feed.since(feed.key(0))
+        assert event_id == feed.key(3)
+        assert json.loads(data)["type"] == "snapshot"
+        assert len(json.loads(data)["rankings"]) == 3
+
+    def test_3(self, db_session, match_dto, user_dto):
+        """
+        GIVEN: a watched match
+        WHEN: a new score is saved to the ranking
+        THEN: it is published to the feed of the match
+        """
+        match = match_dto.save(match_dto.new())
+        user = user_dto.fetch()
+        feed = ranking_feeds.subscribe(ranking_feeds.feed(match.uid, db_session))
+        assert feed.snapshot()["rankings"] == []
+
+        PlayScore(match.uid, user.uid, 2.5, db_session).save_to_ranking()
+        feed.tick(interval=0)
+        (_, data), *_ = feed.since(feed.key(0))
+        assert json.loads(data)["rankings"] == [
+            {"user": {"uid": user.uid, "name": user.name}, "score": 2.5, "rank": 1}
+        ]
+
+        ranking_feeds.release(match.uid)
+        PlayScore(match.uid, user.uid, 3.0, db_session).save_to_ranking()
+        assert ranking_feeds.feed(match.uid, db_session) is not feed
+
+    def test_4(self):
+        """
+        GIVEN: a feed created after the one a client was reading
+        WHEN: the client resumes from its last id, or sends an invalid one
+        THEN: it receives a snapshot, before and after new deltas
+        """
+        feed = RankingFeed(1, [{"user": {"uid": 1, "name": None}, "score": 1.0}])
+        for last_event_id in ("0f3c9a1e-5", "5", "abc", "", None):
+            ((_, data),) = feed.since(last_event_id)
+            assert json.loads(data)["type"] == "snapshot"
+
+        for user_uid in range(3):
+            feed.publish(user_uid, 2.0)
+            feed.tick(interval=0)
+        ((event_id, data),) = feed.since("0f3c9a1e-5")
+        assert event_id == feed.key(3)
+        assert len(json.loads(data)["rankings"]) == 4
+        assert json.loads(feed.since(feed.key(7))[0][1])["type"] == "snapshot"
+
+    def test_5(self, mocker):
+        """
+        GIVEN: the ranking feeds relayed to the other workers
+        WHEN: a score is published while a stream runs until its
+                client disconnects
+        THEN: the score reaches the feed through the relay, which is
+                subscribed only while the feed is streamed
+        """
+
+        class Relay(LocalRelay):
+            def __init__(self):
+                super().__init__()
+                self.sent = []
+
+            def send(self, channel, data):
+                self.sent.append((channel, data))
+
+        relay = Relay()
+        feeds = RankingFeeds(relay)
+        feed = RankingFeed(1, [])
+        request = mocker.Mock()
+        request.is_disconnected = mocker.AsyncMock(side_effect=[False, True])
+        feeds.publish(1, 2, 3.0, "Ann")
+        assert relay.sent == [
+            ("rankings:1", json.dumps({"user_uid": 2, "score": 3.0, "name": "Ann"}))
+        ]
+        assert feed.subscribers == 0
+
+        async def run():
+            async for _ in feeds.stream(feed, request, interval=0):
+                assert feed.subscribers == 1
+                await relay.publish(*relay.sent[0])
+
+        asyncio.run(run())
+        feed.tick(interval=0)
+        (_, data), *_ = feed.since(feed.key(0))
+        assert json.loads(data)["rankings"] == [
+            {"user": {"uid": 2, "name": "Ann"}, "score": 3.0, "rank": 1}
+        ]
+        assert feed.subscribers == 0
+        assert relay._subscribers["rankings:1"] == []
+
+
+class TestCasePlayEventProjector:
+    def test_1(
+        self,
+        db_session,
+        match_dto,
+        game_dto,
+        question_dto,
+        answer_dto,
+        user_dto,
+        mocker,
+    ):
+        """
+        GIVEN: the play events log enabled
+        WHEN: a user plays a match with two questions
+        THEN: only the finished attempt is logged and the ranking
+                can be rebuilt from it, also with new scoring rules
+        """
+        mocker.patch.object(settings, "PLAY_EVENTS_LOG", True)
+        match = match_dto.save(match_dto.new())
+        game = game_dto.save(game_dto.new(match_uid=match.uid))
+        first = question_dto.new(text="1+1", game_uid=game.uid, position=0)
+        question_dto.save(first)
+        first_answer = answer_dto.new(question=first, text="2", position=0, level=2)
+        answer_dto.save(first_answer)
+        second = question_dto.new(text="2+2", game_uid=game.uid, position=1)
+        question_dto.save(second)
+        second_answer = answer_dto.new(question=second, text="4", position=0, level=3)
+        answer_dto.save(second_answer)
+        user = user_dto.fetch()
+
+        status = PlayerStatus(user, match, db_session=db_session)
+        player = SinglePlayer(status, user, match, db_session=db_session)
+        _, attempt_uid = player.start()
+        status.current_attempt_uid = attempt_uid
+        player.react(first, first_answer)
+        player.react(player.forward(), second_answer)
+        PlayScore(
+            match.uid, user.uid, status.current_score(), db_session, attempt_uid
+        ).save_to_ranking()
+
+        kinds = [e.kind for e in db_session.query(PlayEvent).order_by(PlayEvent.uid)]
+        assert kinds == ["AttemptFinished"]
+
+        projector = PlayEventProjector(match.uid, db_session)
+        assert projector.rebuild_rankings() == 1
+        assert [r.score for r in db_session.query(Ranking)] == [5]
+
+        second_answer.level = 1
+        db_session.commit()
+        assert projector.rebuild_rankings(rescore=True) == 1
+        assert [r.score for r in db_session.query(Ranking)] == [3]
+
+    def test_2(self, db_session, match_dto, game_dto, question_dto, user_dto):
+        """
+        GIVEN: the play events log disabled
+        WHEN: a user starts a match
+        THEN: no event is logged
+        """
+        match = match_dto.save(match_dto.new())
+        game = game_dto.save(game_dto.new(match_uid=match.uid))
+        question_dto.save(question_dto.new(text="1+1", game_uid=game.uid, position=0))
+        user = user_dto.fetch()
+
+        status = PlayerStatus(user, match, db_session=db_session)
+        SinglePlayer(status, user, match, db_session=db_session).start()
+        assert db_session.query(PlayEvent).count() == 0
+
+    def test_3(self, db_session, match_dto, user_dto, mocker):
+        """
+        GIVEN: a ranking saved while the play events log was disabled
+        WHEN: the rankings are rebuilt from the log, enabled later
+        THEN: they are refused and the rankings left untouched
+        """
+        match = match_dto.save(match_dto.new())
+        user = user_dto.fetch()
+        PlayScore(match.uid, user.uid, 4, db_session).save_to_ranking()
+        mocker.patch.object(settings, "PLAY_EVENTS_LOG", True)
+        PlayScore(match.uid, user.uid, 6, db_session).save_to_ranking()
+
+        with pytest.raises(IncompletePlayEventsError):
+            PlayEventProjector(match.uid, db_session).rebuild_rankings()
+        assert sorted(r.score for r in db_session.query(Ranking)) == [4, 6]
+
+
+class TestCaseProgressSteps:
+    def test_1(self, db_session, match_dto, user_dto):
+        """
+        GIVEN: an attempt of a match
+        WHEN: its progress-token steps are played
+        THEN: each step is accepted once and only in order
+        """
+        match = match_dto.save(match_dto.new())
+        attempts = AttemptDTO(session=db_session)
+        attempts.reserve(user_dto.fetch().uid, match.uid, "a" * 32)
+        assert attempts.advance("a" * 32, 0)
+        assert not attempts.advance("a" * 32, 0)
+        assert not attempts.advance("a" * 32, 2)
+        assert attempts.advance("a" * 32, 1)
+        assert not attempts.advance("b" * 32, 0)
+
+    def test_2(self, db_session, match_dto, game_dto, question_dto):
+        """
+        GIVEN: a match with one question
+        WHEN: the question is edited
+        THEN: the version of the match changes
+        """
+        match = match_dto.save(match_dto.new())
+        game = game_dto.save(game_dto.new(match_uid=match.uid))
+        question = question_dto.save(
+            question_dto.new(text="1+1", game_uid=game.uid, position=0)
+        )
+        version = match_version(match)
+        question.update_timestamp = datetime.now(tz=timezone.utc) + timedelta(seconds=1)
+        db_session.commit()
+        assert match_version(match) > version
+
+
+class TestCaseTemplatePool:
+    def test_1(self, db_session, match_dto, game_dto, question_dto, answer_dto):
+        """
+        GIVEN: twenty templates of two levels and a question in use
+        WHEN: the pool is sampled with the same seed twice
+        THEN: the same templates are drawn, never the one in use,
+                and stratified samples respect the size of each level
+        """
+        match = match_dto.save(match_dto.new())
+        game = game_dto.save(game_dto.new(match_uid=match.uid))
+        question_dto.save(
+            question_dto.new(text="In use", game_uid=game.uid, position=0)
+        )
+        templates = {1: [], 2: []}
+        for position in range(20):
+            level = 1 if position < 15 else 2
+            question = question_dto.new(text=f"Template {position}", position=position)
+            question_dto.save(question)
+            answer_dto.save(
+                answer_dto.new(question=question, text="a", position=0, level=level)
+            )
+            templates[level].append(question.uid)
+
+        pool = TemplatePool()
+        sample = pool.sample(db_session, 8, seed="attempt")
+        assert len(set(sample)) == 8
+        assert set(sample) <= set(templates[1] + templates[2])
+        assert pool.sample(db_session, 8, seed="attempt") == sample
+        assert len(pool.sample(db_session, 50, seed="attempt")) == 20
+
+        stratified = pool.sample(db_session, 8, seed="attempt", levels=[1, 2])
+        assert len([uid for uid in stratified if uid in templates[1]]) == 6
+        assert len([uid for uid in stratified if uid in templates[2]]) == 2
+        assert pool.sample(db_session, 3, seed="attempt", levels=[3]) == []
+
+
+class TestCaseDifficultyIndex:
+    def test_1(self):
+        """
+        GIVEN: a game with an easy, an average and a hard question
+        WHEN: questions are picked as the attempt gets them right
+        THEN: harder questions come first and the rates follow the
+                answers as they arrive
+        """
+        counts = [(1, 10, 18, 17), (2, 10, 0, 0), (3, 10, 18, 1)]
+        index = DifficultyIndex(match_uid=1, counts=counts)
+        assert index.pick("attempt", 10, ()) == 2
+
+        index.record(2, True)
+        index.record(2, True)
+        assert index.rate(2) == 0.75
+        accuracy = correctness(2, 2)
+        assert accuracy == 0.75
+        assert index.pick("attempt", 10, (2,), accuracy) == 3
+        assert index.pick("attempt", 10, (2, 3), accuracy) == 1
+        assert index.pick("attempt", 10, (1, 2, 3), accuracy) is None
+        assert index.pick("attempt", 20, ()) is None
+
+    def test_2(
+        self,
+        db_session,
+        match_dto,
+        game_dto,
+        question_dto,
+        answer_dto,
+        user_dto,
+        reaction_dto,
+        emitted_queries,
+        mocker,
+    ):
+        """
+        GIVEN: an adaptive match whose second question was always
+                answered wrong in the past
+        WHEN: the player answers the first question correctly
+        THEN: the hard question is the next one, picked without
+                querying the reactions
+        """
+        match = match_dto.save(match_dto.new(adaptive=True))
+        game = game_dto.save(game_dto.new(match_uid=match.uid, order=False))
+        questions = []
+        for position in range(3):
+            question = question_dto.new(
+                text=f"{position}+1", game_uid=game.uid, position=position
+            )
+            question_dto.save(question)
+            answer_dto.save(
+                answer_dto.new(question=question, text="ok", position=0, level=1)
+            )
+            answer_dto.save(
+                answer_dto.new(question=question, text="ko", position=1, level=1)
+            )
+            questions.append(question)
+
+        other = user_dto.save(user_dto.new(email="other@test.project"))
+        for attempt in range(4):
+            for question in questions:
+                reaction = reaction_dto.new(
+                    match_uid=match.uid,
+                    question=question,
+                    game_uid=game.uid,
+                    user_uid=other.uid,
+                    attempt_uid=f"past-{attempt}",
+                )
+                reaction_dto.save(reaction)
+                answer = question.answers_by_position[question is questions[1]]
+                reaction_dto.record_answer(reaction, answer=answer)
+
+        user = user_dto.save(user_dto.new(email="user@test.project"))
+        mocker.patch(
+            "app.domain_service.play.single_player.difficulty_indexes",
+            DifficultyIndexes(),
+        )
+        status = PlayerStatus(user, match, db_session=db_session)
+        player = SinglePlayer(status, user, match, db_session=db_session)
+        first, _ = player.start()
+        assert first != questions[1]
+
+        player.react(first, first.answers_by_position[0])
+        emitted_queries.clear()
+        assert player.forward() == questions[1]
+        statements = [s for s, _ in emitted_queries]
+        assert not [s for s in statements if "FROM reactions" in s]
+
+    def test_3(self, db_session, match_dto, game_dto, question_dto, mocker):
+        """
+        GIVEN: the difficulty index of a match, older than its ttl
+        WHEN: the index is requested again
+        THEN: the old one is served while a single refresh is
+                scheduled, and the refreshed one follows the edits
+        """
+        match = match_dto.save(match_dto.new(adaptive=True))
+        game = game_dto.save(game_dto.new(match_uid=match.uid))
+        question_dto.save(question_dto.new(text="1+1", game_uid=game.uid, position=0))
+        indexes = DifficultyIndexes(ttl=0)
+        index = indexes.index(match, db_session)
+
+        thread = mocker.patch("app.domain_service.play.adaptive.threading.Thread")
+        load = mocker.patch.object(indexes, "load")
+        assert indexes.index(match, db_session) is index
+        assert indexes.index(match, db_session) is index
+        assert thread.call_count == 1
+        load.assert_not_called()
+
+        mocker.stopall()
+        question = question_dto.new(text="2+2", game_uid=game.uid, position=1)
+        question_dto.save(question)
+        refreshed = indexes.refresh(match.uid, db_session)
+        assert indexes.index(match, db_session) is refreshed
+        assert refreshed.pick("attempt", game.uid, index._counts) == question.uid
+
+
+class TestCaseMatchRescorer:
+    def test_1(self):
+        """
+        GIVEN: timings, question times and answer levels
+        WHEN: they are scored as arrays
+        THEN: the scores are those of ReactionScore, NaN once expired
+        """
+        cases = [
+            (3.2, 10, 2),
+            (3.2, 10, None),
+            (0.5, None, 3),
+            (0.5, None, None),
+            (0.07, 4, 1),
+            (0.49, 4, 1),
+            (0.35, 4, 3),
+            (0.0, 0, 1),
+            (4.0, 0, 1),
+            (12.0, 10, 2),
+        ]
+        seconds, times, levels = (
+            np.array(column, dtype=np.float64) for column in zip(*cases)
+        )
+        scores = vector_scores(seconds, times, levels)
+        for (timing, time, level), score in zip(cases[:-2], scores):
+            assert score == ReactionScore(timing, time, level).value()
+        assert np.isnan(scores[-2]) and np.isnan(scores[-1])
+
+    def test_2(
+        self,
+        db_session,
+        match_dto,
+        game_dto,
+        question_dto,
+        answer_dto,
+        user_dto,
+        reaction_dto,
+    ):
+        """
+        GIVEN: a match played once, whose question time
+                and answer level are then edited
+        WHEN: the match is rescored
+        THEN: the scores of the reactions and the ranking
+                are those of the edited match
+        """
+        match = match_dto.save(match_dto.new())
+        game = game_dto.save(game_dto.new(match_uid=match.uid))
+        user = user_dto.save(user_dto.new(email="user@test.project"))
+        questions = []
+        for position in range(3):
+            question = question_dto.new(
+                text=f"{position}+1", game_uid=game.uid, position=position, time=10
+            )
+            question_dto.save(question)
+            answer_dto.save(
+                answer_dto.new(question=question, text="ok", position=0, level=1)
+            )
+            questions.append(question)
+
+        total = 0
+        for seconds, question in zip((2, 4, 6), questions):
+            reaction = reaction_dto.new(
+                match_uid=match.uid,
+                question=question,
+                game_uid=game.uid,
+                user_uid=user.uid,
+                attempt_uid="attempt",
+                create_timestamp=datetime.now() - timedelta(seconds=seconds),
+            )
+            reaction_dto.save(reaction)
+            reaction_dto.record_answer(reaction, answer=question.answers[0])
+            total += reaction.score
+        PlayScore(match.uid, user.uid, total, db_session).save_to_ranking()
+
+        questions[0].time = 20
+        questions[1].answers[0].level = 3
+        db_session.commit()
+        reactions, rankings = MatchRescorer(match.uid, db_session).rescore()
+        assert (reactions, rankings) == (2, 1)
+
+        scores = [r.score for r in match.reactions.all()]
+        assert scores[0] == pytest.approx(0.9, abs=0.01)
+        assert scores[1] == pytest.approx(1.8, abs=0.01)
+        assert scores[2] == pytest.approx(0.4, abs=0.01)
+        ranking = db_session.query(Ranking).one()
+        assert ranking.score == pytest.approx(sum(scores))
+
+
+class TestCaseMatchAnalytics:
+    @pytest.fixture
+    def played_match(
+        self, match_dto, game_dto, question_dto, answer_dto, user_dto, reaction_dto
+    ):
+        def play(attempts):
+            match = match_dto.save(match_dto.new())
+            game = game_dto.save(game_dto.new(match_uid=match.uid))
+            user = user_dto.save(user_dto.new(email=f"{match.uid}@test.project"))
+            questions = []
+            for position in range(3):
+                question = question_dto.new(
+                    text=f"{position}+1", game_uid=game.uid, position=position
+                )
+                question_dto.save(question)
+                answer_dto.save(
+                    answer_dto.new(question=question, text="ok", position=0, level=1)
+                )
+                questions.append(question)
+
+            for attempt, answered in attempts.items():
+                for position in range(answered):
+                    question = questions[position]
+                    reaction = reaction_dto.new(
+                        match_uid=match.uid,
+                        question=question,
+                        game_uid=game.uid,
+                        user_uid=user.uid,
+                        attempt_uid=attempt,
+                        create_timestamp=datetime.now() - timedelta(seconds=4),
+                    )
+                    reaction_dto.save(reaction)
+                    reaction_dto.record_answer(reaction, answer=question.answers[0])
+            return match, questions
+
+        return play
+
+    def test_1(self, db_session, played_match, reaction_dto, user_dto):
+        """
+        GIVEN: a match played by three attempts, one complete
+        WHEN: the dashboard is computed, then a question displayed
+        THEN: the funnel and drop-off follow the reactions, and
+                only the new reaction is loaded again
+        """
+        match, questions = played_match({"a": 3, "b": 2, "c": 1})
+        analytics = MatchAnalytics()
+        dashboard = analytics.dashboard(match, db_session)
+        assert dashboard["reactions"] == 6
+        assert dashboard["funnel"] == [3, 2, 1]
+        assert [q["answered"] for q in dashboard["drop_off"]] == [3, 2, 1]
+        assert sum(b["attempts"] for b in dashboard["score_distribution"]) == 3
+        assert dashboard["time_per_game"][0]["average_seconds"] == pytest.approx(
+            4, abs=0.5
+        )
+        assert dashboard["attempts_per_hour"][0]["attempts"] == 3
+        assert analytics.dashboard(match, db_session) is dashboard
+
+        reaction_dto.save(
+            reaction_dto.new(
+                match_uid=match.uid,
+                question=questions[1],
+                user_uid=match.reactions.first().user_uid,
+                attempt_uid="c",
+            )
+        )
+        facts = analytics.facts(match.uid, db_session)
+        assert facts.size == 7
+        dashboard = analytics.dashboard(match, db_session)
+        assert dashboard["funnel"] == [3, 3, 1]
+        assert dashboard["drop_off"][1] == {
+            "question_uid": questions[1].uid,
+            "displayed": 3,
+            "answered": 2,
+        }
+
+    def test_2(self, db_session, played_match):
+        """
+        GIVEN: analytics capped below the size of two matches
+        WHEN: the facts of both are loaded
+        THEN: the least recently used match is dropped
+        """
+        first, _ = played_match({"a": 3})
+        second, _ = played_match({"a": 3})
+        analytics = MatchAnalytics()
+        analytics.max_bytes = analytics.facts(first.uid, db_session).nbytes + 1
+        analytics.facts(second.uid, db_session)
+        assert list(analytics._facts) == [second.uid]
+
+
+class TestCaseLiveCounters:
+    def test_1(self):
+        """
+        GIVEN: two sketches of 10000 players, half of them in common
+        WHEN: they are merged
+        THEN: the unique players are counted within a few percent
+        """
+        first, second = HyperLogLog(), HyperLogLog()
+        for uid in range(10000):
+            first.add(uid)
+            second.add(uid + 5000)
+            first.add(uid)
+
+        assert first.count() == pytest.approx(10000, rel=0.05)
+        assert first.merge(second).count() == pytest.approx(15000, rel=0.05)
+        small = HyperLogLog()
+        for uid in range(10):
+            small.add(uid)
+        assert small.count() == 10
+
+    def test_2(self):
+        """
+        GIVEN: the answers and the requests of three players
+        WHEN: the counters are read as time goes by
+        THEN: only the recent answers and players are counted
+        """
+        counters = LocalCounters()
+        counters.played(1, 1, now=1000)
+        counters.answered(1, 2, now=1010)
+        counters.answered(1, 2, now=1050)
+        counters.answered(1, 3, now=1100)
+
+        live = counters.read(1, now=1100)
+        assert live["unique_players"] == 3
+        assert live["active_players"] == 3
+        assert live["answers_per_minute"] == 2
+
+        live = counters.read(1, now=1150)
+        assert live["active_players"] == 2
+        assert live["answers_per_minute"] == 1
+        assert live["unique_players"] == 3
+        assert counters.read(2, now=1150)["unique_players"] == 0
+
+    def test_3(self):
+        """
+        GIVEN: two matches, one of them no longer played
+        WHEN: the other one is played past the ttl
+        THEN: the counters of the idle match are forgotten
+        """
+        counters = LocalCounters(ttl=100)
+        counters.played(1, 1, now=1000)
+        counters.played(2, 1, now=1050)
+        counters.played(2, 2, now=1120)
+        assert counters.read(1, now=1120)["unique_players"] == 0
+        assert counters.read(2, now=1120)["unique_players"] == 2
+
+    def test_4(self, mocker):
+        """
+        GIVEN: the live counters kept in a Redis that is down
+        WHEN: players play and the counters are read
+        THEN: the updates are dropped quietly, the read fails
+        """
+        client = mocker.Mock()
+        client.pipeline.return_value.execute.side_effect = RedisError("down")
+        counters = RedisCounters(client)
+        counters.played(1, 1, now=1000)
+        counters.answered(1, 1, now=1000)
+        counters.flush()
+        with pytest.raises(LiveCountersError):
+            counters.read(1, now=1000)
+
+    def test_5(self):
+        """
+        GIVEN: the live messages relayed through Redis
+        WHEN: the settings do not choose where the counters are kept
+        THEN: they are kept in Redis too, in-process only if chosen
+        """
+        assert Settings(LIVE_REDIS_RELAY=True).LIVE_REDIS_COUNTERS is True
+        assert Settings(LIVE_REDIS_RELAY=False).LIVE_REDIS_COUNTERS is False
+        assert (
+            Settings(
+                LIVE_REDIS_RELAY=True, LIVE_REDIS_COUNTERS=False
+            ).LIVE_REDIS_COUNTERS
+            is False
+        )
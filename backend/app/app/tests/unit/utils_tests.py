@@ -1,7 +1,13 @@
+import json
+import sys
+import threading
 from datetime import datetime, timedelta
 
 import pytest
 
+from app.core.profiling import Profile, match_uid_of
+from app.core.slow_queries import SlowQueryLog, fingerprint, report
+from app.core.tracing import PhaseHistograms, SpanExporter, Tracer
 from app.domain_entities.db.utils import QAppenderClass
 from app.domain_service.data_transfer.game import Game
 from app.domain_service.data_transfer.reaction import Reaction
@@ -95,3 +101,133 @@ class TestCaseBaseQueryAppender:
         expected = db_session.query(Game).filter(Game.uid.notin_([0])).all()
         result = match.games.filter_by(uid__notin=[0]).all()
         assert result == expected
+
+
+class TestCaseTracer:
+    def test_1(self, tmp_path):
+        """
+        GIVEN: a tracer exporting to a file
+        WHEN: two nested spans are timed
+        THEN: they are written in one OTLP JSON export request, once
+                flushed, and counted in the histograms
+        """
+        export = tmp_path / "spans.jsonl"
+        tracer = Tracer(PhaseHistograms(), SpanExporter(str(export), interval=60))
+        with tracer.span("request", path="/play/next") as outer:
+            tracer.traced("record_answer")(lambda: None)()
+        assert not export.exists()
+
+        tracer.exporter.flush()
+        (line,) = export.read_text().splitlines()
+        (resource,) = json.loads(line)["resourceSpans"]
+        (scope,) = resource["scopeSpans"]
+        inner, root = scope["spans"]
+        assert inner["name"] == "record_answer"
+        assert inner["traceId"] == root["traceId"] == outer.trace_id
+        assert inner["parentSpanId"] == root["spanId"]
+        assert root["parentSpanId"] == ""
+        assert root["attributes"] == [
+            {"key": "path", "value": {"stringValue": "/play/next"}}
+        ]
+        assert int(root["endTimeUnixNano"]) >= int(inner["endTimeUnixNano"])
+
+        summary = tracer.histograms.summary()
+        assert summary["record_answer"]["count"] == 1
+        assert summary["request"]["buckets"][-1] == {"le": "+Inf", "count": 1}
+
+
+class TestCaseProfiler:
+    def test_1(self):
+        """
+        GIVEN: requests of several matches
+        WHEN: the match of each one is looked for
+        THEN: it is found in the path, the query or the JSON body
+        """
+        assert match_uid_of("/api/v1/matches/12/stats", "", b"") == 12
+        assert match_uid_of("/api/v1/play/start", "", b'{"match_uid": 3}') == 3
+        assert match_uid_of("/api/v1/export", "format=csv&match_uid=4", b"") == 4
+        assert match_uid_of("/api/v1/play/start", "", b"not json") is None
+
+    def test_2(self):
+        """
+        GIVEN: a profile sampling the stack of this test
+        WHEN: it is exported
+        THEN: the frames are shared and each sample refers to them
+        """
+        profile = Profile(1, "GET", "/")
+        profile.sample(sys._getframe(), 0.005, sys._getframe())
+        profile.sample(sys._getframe(), 0.005, sys._getframe())
+        data = profile.speedscope()
+        frames = data["shared"]["frames"]
+        (first, second) = data["profiles"][0]["samples"]
+        assert first == second
+        assert frames[first[-1]]["name"] == "test_2"
+        assert data["profiles"][0]["weights"] == [0.005, 0.005]
+
+    def test_3(self):
+        """
+        GIVEN: a profile attached to the frame of a request
+        WHEN: stacks are sampled in and out of that frame
+        THEN: only those running the request are kept
+        """
+
+        def request():
+            yield
+            yield sys._getframe()
+
+        running = request()
+        next(running)
+        profile = Profile(1, "GET", "/")
+        profile.attach(running.gi_frame)
+        root = profile.roots[threading.get_ident()]
+        profile.sample(sys._getframe(), 0.005, root)
+        assert profile.samples == []
+
+        profile.sample(next(running), 0.005, root)
+        (sample,) = profile.samples
+        assert profile.frames[sample[-1]]["name"] == "request"
+
+
+class TestCaseSlowQueries:
+    def test_1(self):
+        """
+        GIVEN: statements differing only in their literals and parameters
+        WHEN: they are fingerprinted
+        THEN: they share the same fingerprint
+        """
+        first = fingerprint("SELECT * FROM users WHERE uid IN (1, 2, 3) AND name = 'a'")
+        second = fingerprint("SELECT *  FROM users WHERE uid IN (?) AND name = ?")
+        third = fingerprint("SELECT * FROM users WHERE uid IN (%(uid_1)s, %(uid_2)s)")
+        assert first == second
+        assert first[1] == "SELECT * FROM users WHERE uid IN (?+) AND name = ?"
+        assert third[0] != first[0]
+
+    def test_2(self, db_session, tmp_path):
+        """
+        GIVEN: a slow-query log with no threshold
+        WHEN: statements are recorded
+        THEN: they are aggregated and written to the log in the
+                background, and the fingerprints are ranked by latency
+        """
+        path = tmp_path / "slow.log"
+        log = SlowQueryLog(threshold=0, path=str(path), interval=60)
+        engine = db_session.get_bind()
+        log.record(engine, "SELECT 1 FROM users WHERE uid = 1", (), 0.002)
+        log.record(engine, "SELECT 1 FROM users WHERE uid = 2", (), 0.004)
+        log.record(engine, "SELECT 1 FROM matches", (), 0.005)
+        assert not path.exists()
+
+        (users, matches) = log.top(order="total")
+        assert users["count"] == 2
+        assert users["total_ms"] == pytest.approx(6)
+        assert users["p50_ms"] == pytest.approx(2, rel=0.05)
+        assert users["max_ms"] == pytest.approx(4)
+        assert log.top(limit=1, order="max")[0]["fingerprint"] == matches["fingerprint"]
+
+        with open(path) as lines:
+            rows = report(lines, order="count")
+        assert [r["fingerprint"] for r in rows] == [
+            users["fingerprint"],
+            matches["fingerprint"],
+        ]
+        assert rows[0]["max_ms"] == pytest.approx(4)
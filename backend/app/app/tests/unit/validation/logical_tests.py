@@ -2,7 +2,10 @@ from datetime import datetime, timedelta, timezone
 
 import pytest
 
+from app.core.sql_metrics import RequestStats, request_stats
+from app.domain_entities import Reaction
 from app.domain_service.data_transfer.user import WordDigest
+from app.domain_service.data_transfer.write_behind import ReactionWriteBuffer
 from app.domain_service.schemas.logical_validation import (
     RetrieveObject,
     ValidateEditMatch,
@@ -28,6 +31,15 @@ class TestCaseRetrieveObject:
         obj = RetrieveObject(uid=user.uid, otype="user", db_session=db_session).get()
         assert obj == user
 
+    def test_3(self, db_session, match_dto, emitted_queries):
+        """an object already loaded in the session is returned without queries"""
+        match = match_dto.save(match_dto.new())
+        match_uid = match.uid
+        emitted_queries.clear()
+        obj = RetrieveObject(uid=match_uid, otype="match", db_session=db_session).get()
+        assert obj is match
+        assert len(emitted_queries) == 0
+
 
 class TestCaseLandEndPoint:
     def test_1(self, db_session):
@@ -308,6 +320,126 @@ class TestCaseNextEndPoint:
             ).valid_question(match)
         assert err.value.message == "Invalid question"
 
+    @pytest.fixture
+    def next_data(
+        self, match_dto, game_dto, question_dto, answer_dto, user_dto, reaction_dto
+    ):
+        match = match_dto.save(match_dto.new())
+        game = game_dto.new(match_uid=match.uid)
+        game_dto.save(game)
+        question = question_dto.new(
+            text="Where is London?", game_uid=game.uid, position=0
+        )
+        question_dto.save(question)
+        answer = answer_dto.new(question_uid=question.uid, text="UK", position=0)
+        answer_dto.save(answer)
+        user = user_dto.fetch(email="user@test.project")
+        reaction = reaction_dto.save(
+            reaction_dto.new(
+                match_uid=match.uid,
+                question_uid=question.uid,
+                user_uid=user.uid,
+                game_uid=game.uid,
+            )
+        )
+        yield {
+            "match_uid": match.uid,
+            "question_uid": question.uid,
+            "answer_uid": answer.uid,
+            "user_uid": user.uid,
+            "attempt_uid": reaction.attempt_uid,
+        }
+
+    def test_10(self, db_session, next_data, emitted_queries):
+        """
+        GIVEN: a valid payload
+        WHEN: is_valid() is called
+        THEN: all the facts are fetched with one statement
+        """
+        emitted_queries.clear()
+        data = ValidatePlayNext(db_session=db_session, **next_data).is_valid()
+        assert len(emitted_queries) == 1
+        assert data["match"].uid == next_data["match_uid"]
+        assert data["question"].uid == next_data["question_uid"]
+        assert data["answer"].uid == next_data["answer_uid"]
+        assert data["user"].uid == next_data["user_uid"]
+        assert data["open_answer"] is None
+        assert data["attempt_uid"] == next_data["attempt_uid"]
+
+    def test_11(self, db_session, next_data, question_dto):
+        """the same errors of the single valid_* methods are raised"""
+        template = question_dto.save(question_dto.new(text="Template", position=0))
+        wrong_data = [
+            ({"match_uid": 1000}, NotFoundObjectError, None),
+            ({"question_uid": 1000}, NotFoundObjectError, None),
+            ({"question_uid": template.uid}, ValidateError, "Invalid question"),
+            ({"answer_uid": 1000}, NotFoundObjectError, None),
+            ({"answer_text": "London"}, ValidateError, "Invalid answer"),
+            ({"user_uid": 1000}, NotFoundObjectError, None),
+            (
+                {"attempt_uid": "8e491fd30c4f4f37a8a1944a11d1f96a"},
+                ValidateError,
+                "Invalid attempt-uid",
+            ),
+        ]
+        for payload, exc_class, message in wrong_data:
+            with pytest.raises(exc_class) as err:
+                ValidatePlayNext(
+                    db_session=db_session, **{**next_data, **payload}
+                ).is_valid()
+            if message:
+                assert err.value.message == message
+
+    def test_12(self, db_session, next_data):
+        """
+        GIVEN: a reaction already answered
+        WHEN: the same question is answered again with the same attempt
+        THEN: the duplicate is rejected
+        """
+        reaction = db_session.query(Reaction).one()
+        reaction.answer_uid = next_data["answer_uid"]
+        db_session.commit()
+        with pytest.raises(ValidateError) as err:
+            ValidatePlayNext(db_session=db_session, **next_data).is_valid()
+        assert err.value.message == "Duplicate Reactions"
+
+    def test_13(self, db_session, next_data, tmp_path, mocker):
+        """
+        GIVEN: an answer still pending in the write-behind buffer
+        WHEN: the same question is answered again with the same attempt
+        THEN: the duplicate is rejected
+        """
+        buffer = ReactionWriteBuffer(str(tmp_path / "reactions.log"))
+        mocker.patch("app.domain_service.data_transfer.write_behind._buffer", buffer)
+        buffer.append(
+            {
+                "uid": db_session.query(Reaction.uid).scalar(),
+                "attempt_uid": next_data["attempt_uid"],
+                "question_uid": next_data["question_uid"],
+                "answer_uid": next_data["answer_uid"],
+            }
+        )
+        with pytest.raises(ValidateError) as err:
+            ValidatePlayNext(db_session=db_session, **next_data).is_valid()
+        assert err.value.message == "Duplicate Reactions"
+
+    def test_14(self, db_session, next_data):
+        """
+        GIVEN: the facts of /play/next already fetched once
+        WHEN: they are fetched again for another user
+        THEN: the compiled statement is taken from the cache
+        """
+        ValidatePlayNext(db_session=db_session, **next_data).facts()
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        try:
+            ValidatePlayNext(
+                db_session=db_session, **{**next_data, "user_uid": 1000}
+            ).facts()
+        finally:
+            request_stats.reset(token)
+        assert (stats.cache_hits, stats.cache_misses) == (1, 0)
+
 
 class TestCaseCreateMatch:
     def test_1(self, db_session):
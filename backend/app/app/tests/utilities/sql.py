@@ -0,0 +1,24 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core.sql_metrics import RequestStats
+
+
+@contextmanager
+def query_budget(max_queries):
+    """Fail if the block issues more than `max_queries` SQL statements"""
+    stats = RequestStats()
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        stats.statement(statement, 0)
+
+    event.listen(Engine, "before_cursor_execute", count)
+    try:
+        yield stats
+    finally:
+        event.remove(Engine, "before_cursor_execute", count)
+    assert (
+        stats.queries <= max_queries
+    ), f"{stats.queries} queries issued, the budget is {max_queries}"
@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta, timezone
+
+from app.constants import CLOSE_ATTEMPTS_EVERY
+from app.core.celery_app import celery_app
+from app.core.config import settings
+from app.domain_entities.db.session import session_factory
+from app.domain_service.data_transfer.user import UserDTO
+from app.domain_service.play import (
+    MatchRescorer,
+    PlayEventProjector,
+    close_abandoned_attempts,
+)
+
+
+@celery_app.task
+def reap_unsigned_players() -> int:
+    retention = timedelta(days=settings.UNSIGNED_PLAYERS_RETENTION_DAYS)
+    before = datetime.now(tz=timezone.utc) - retention
+    _session = session_factory()
+    try:
+        return UserDTO(session=_session).reap_unsigned(before)
+    finally:
+        _session.close()
+
+
+@celery_app.task
+def close_deferred_attempts() -> int:
+    left_for = timedelta(hours=settings.DEFERRED_ATTEMPTS_CLOSE_HOURS)
+    before = datetime.now(tz=timezone.utc) - left_for
+    since = before - timedelta(seconds=CLOSE_ATTEMPTS_EVERY)
+    _session = session_factory()
+    try:
+        return close_abandoned_attempts(since, before, _session)
+    finally:
+        _session.close()
+
+
+@celery_app.task
+def rebuild_rankings(match_uid: int, rescore: bool = False) -> int:
+    _session = session_factory()
+    try:
+        return PlayEventProjector(match_uid, _session).rebuild_rankings(rescore)
+    finally:
+        _session.close()
+
+
+@celery_app.task
+def rescore_match(match_uid: int) -> tuple:
+    _session = session_factory()
+    try:
+        return MatchRescorer(match_uid, _session).rescore()
+    finally:
+        _session.close()
@@ -0,0 +1,23 @@
+from typing import Optional
+
+import typer
+
+from app.domain_entities.db.session import session_factory
+from app.domain_service.data_transfer.attempt import AttemptDTO
+
+app = typer.Typer()
+
+
+@app.command()
+def backfill(match_uid: Optional[int] = typer.Argument(None)):
+    """Build the attempt summaries from the reactions, of one or all matches"""
+    _session = session_factory()
+    try:
+        count = AttemptDTO(session=_session).backfill(match_uid)
+    finally:
+        _session.close()
+    typer.echo(f"{count} attempts summarized")
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,35 @@
+import sys
+from pathlib import Path
+from typing import Optional
+
+import typer
+
+from app.domain_entities.db.session import session_factory
+from app.domain_service.data_transfer.export import ReactionExport
+
+app = typer.Typer()
+
+
+@app.command()
+def export(
+    match_uid: int,
+    fmt: str = typer.Option("csv", "--format", help="csv, ndjson or parquet"),
+    output: Optional[Path] = typer.Option(None, help="stdout when omitted"),
+):
+    """Write the reactions of the match, for the analysts"""
+    _session = session_factory()
+    binary = fmt == "parquet"
+    sink = open(output, "wb" if binary else "w") if output else None
+    if sink is None:
+        sink = sys.stdout.buffer if binary else sys.stdout
+    try:
+        for chunk in ReactionExport(match_uid, _session).stream(fmt):
+            sink.write(chunk)
+    finally:
+        _session.close()
+        if output:
+            sink.close()
+
+
+if __name__ == "__main__":
+    app()
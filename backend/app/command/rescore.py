@@ -0,0 +1,21 @@
+import typer
+
+from app.domain_entities.db.session import session_factory
+from app.domain_service.play import MatchRescorer
+
+app = typer.Typer()
+
+
+@app.command()
+def rescore(match_uid: int):
+    """Score again the answers of the match and update its rankings"""
+    _session = session_factory()
+    try:
+        reactions, rankings = MatchRescorer(match_uid, _session).rescore()
+    finally:
+        _session.close()
+    typer.echo(f"{reactions} reactions and {rankings} rankings updated")
+
+
+if __name__ == "__main__":
+    app()
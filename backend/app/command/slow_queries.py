@@ -0,0 +1,31 @@
+from pathlib import Path
+from typing import Optional
+
+import typer
+
+from app.core.config import settings
+from app.core.slow_queries import report
+
+app = typer.Typer()
+
+
+@app.command()
+def top(
+    log: Optional[Path] = typer.Option(None, help="The slow-query log file"),
+    limit: int = 20,
+    order: str = typer.Option("total", help="total, count, p95 or max"),
+):
+    """The statement fingerprints of the slow-query log with the highest latency"""
+    with open(log or settings.SLOW_QUERY_LOG) as lines:
+        rows = report(lines, limit, order)
+    for row in rows:
+        typer.echo(
+            f"{row['fingerprint']}  count={row['count']}  "
+            f"total={row['total_ms']:.1f}ms  p95={row['p95_ms']:.1f}ms  "
+            f"max={row['max_ms']:.1f}ms  plan={'yes' if row['plan'] else 'no'}"
+        )
+        typer.echo(f"    {row['statement']}")
+
+
+if __name__ == "__main__":
+    app()